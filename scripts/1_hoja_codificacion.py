@@ -8,85 +8,80 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 
+from cache_datos import cargar_excel
+from libro_codigos import construir_libro_codigos, guardar_libro_codigos
+
+# Entradas, parámetros y salidas de la etapa (definen su huella en main.py)
+ENTRADAS = ['../BASE_ETIQUETAS.xlsx', '../BASE_NOMBRES_Y_VALORES.xlsx']
+PARAMETROS = {'max_categorias': 50}
+SALIDAS = [
+    '../resultados/tabla_codificacion.xlsx',
+    '../resultados/tabla_codificacion.csv',
+    '../resultados/libro_codigos.json',
+]
+
 def cargar_datos():
     """Carga los dos archivos Excel"""
     print("📂 Cargando archivos Excel...")
     
-    etiquetas = pd.read_excel('../BASE_ETIQUETAS.xlsx')
-    valores = pd.read_excel('../BASE_NOMBRES_Y_VALORES.xlsx')
+    etiquetas = cargar_excel('../BASE_ETIQUETAS.xlsx')
+    valores = cargar_excel('../BASE_NOMBRES_Y_VALORES.xlsx')
     
     print(f"✓ BASE_ETIQUETAS: {etiquetas.shape[0]} filas, {etiquetas.shape[1]} columnas")
     print(f"✓ BASE_NOMBRES_Y_VALORES: {valores.shape[0]} filas, {valores.shape[1]} columnas")
     
     return etiquetas, valores
 
-def analizar_codificacion(etiquetas, valores, max_variables=15):
+def analizar_codificacion(etiquetas, valores, max_categorias=PARAMETROS['max_categorias']):
     """
     Analiza y crea la tabla de codificación comparando ambos archivos
     
     Args:
         etiquetas: DataFrame con las etiquetas
         valores: DataFrame con los valores codificados
-        max_variables: Número máximo de variables a analizar
+        max_categorias: Máximo de códigos distintos para tratar una variable
+                        como categórica
+    
+    Returns:
+        (tabla de codificación, libro de códigos)
     """
     print("\n📊 Analizando codificación de variables...")
     
-    # Lista para almacenar la información de codificación
-    codificacion_data = []
-    
-    # Obtener las columnas comunes
-    columnas_comunes = list(set(etiquetas.columns) & set(valores.columns))
-    
-    # Limitar al número deseado de variables
-    columnas_analizar = columnas_comunes[:min(max_variables, len(columnas_comunes))]
+    # Mapeo código → etiqueta por co-ocurrencia en las mismas filas
+    libro = construir_libro_codigos(etiquetas, valores, max_categorias=max_categorias)
     
-    for col in columnas_analizar:
-        # Obtener valores únicos de la columna en valores
-        valores_unicos = valores[col].dropna().unique()
-        
-        # Obtener etiquetas únicas de la columna en etiquetas
-        etiquetas_unicas = etiquetas[col].dropna().unique()
-        
-        # Crear el mapeo de codificación
-        codificacion = {}
-        
-        # Si hay valores numéricos y etiquetas de texto, crear el mapeo
-        if len(valores_unicos) > 0 and len(etiquetas_unicas) > 0:
-            # Ordenar valores únicos para mapeo consistente
-            valores_ordenados = sorted([v for v in valores_unicos if pd.notna(v)])
-            etiquetas_ordenadas = sorted([e for e in etiquetas_unicas if pd.notna(e)])
-            
-            # Crear mapeo
-            for i, (val, etiq) in enumerate(zip(valores_ordenados, etiquetas_ordenadas)):
-                codificacion[val] = etiq
-        
-        # Si no hay mapeo claro, usar los valores directamente
-        if not codificacion and len(valores_unicos) > 0:
-            for val in sorted(valores_unicos)[:5]:  # Máximo 5 valores
-                codificacion[val] = f"Valor {val}"
-        
-        # Crear la descripción de codificación
-        if codificacion:
-            cod_str = " / ".join([f"{k} = {v}" for k, v in list(codificacion.items())[:6]])
+    codificacion_data = []
+    for col, entrada in libro.items():
+        if entrada['tipo'] == 'categorica':
+            cod_str = " / ".join(f"{codigo:g} = {etiqueta}" for codigo, etiqueta
+                                 in zip(entrada['codigos'], entrada['etiquetas']))
         else:
             cod_str = "Variable continua o sin codificación clara"
         
         # Intentar determinar una descripción de la variable
-        descripcion = determinar_descripcion(col, etiquetas_unicas)
+        descripcion = determinar_descripcion(entrada['pregunta'], entrada['etiquetas'])
         
         codificacion_data.append({
             'Variable': col,
+            'Pregunta': entrada['pregunta'],
             'Descripción': descripcion,
             'Codificación': cod_str,
-            'N_Valores': len(valores_unicos)
+            'N_Valores': entrada['n_valores'],
+            'Consistencia': round(entrada['consistencia'], 4),
         })
     
     # Crear DataFrame con la codificación
     df_codificacion = pd.DataFrame(codificacion_data)
     
-    print(f"\n✓ Se analizaron {len(df_codificacion)} variables")
+    n_categoricas = sum(e['tipo'] == 'categorica' for e in libro.values())
+    print(f"\n✓ Se analizaron {len(df_codificacion)} variables ({n_categoricas} categóricas)")
     
-    return df_codificacion
+    inconsistentes = df_codificacion[df_codificacion['Consistencia'] < 1]
+    if len(inconsistentes) > 0:
+        print(f"⚠️  {len(inconsistentes)} variables con códigos de etiqueta no única "
+              f"(se usó la etiqueta más frecuente)")
+    
+    return df_codificacion, libro
 
 def determinar_descripcion(nombre_variable, etiquetas):
     """Determina una descripción basada en el nombre de la variable y sus etiquetas"""
@@ -123,8 +118,8 @@ def determinar_descripcion(nombre_variable, etiquetas):
     
     return f"Variable {nombre_variable}"
 
-def guardar_resultados(df_codificacion, output_dir='../resultados'):
-    """Guarda la tabla de codificación en Excel y CSV"""
+def guardar_resultados(df_codificacion, libro, output_dir='../resultados'):
+    """Guarda la tabla de codificación en Excel y CSV y el libro de códigos en JSON"""
     
     Path(output_dir).mkdir(exist_ok=True)
     
@@ -138,6 +133,11 @@ def guardar_resultados(df_codificacion, output_dir='../resultados'):
     df_codificacion.to_csv(csv_path, index=False, encoding='utf-8')
     print(f"💾 Tabla guardada en CSV: {csv_path}")
     
+    # Libro de códigos reutilizable por las demás etapas
+    libro_path = Path(output_dir) / 'libro_codigos.json'
+    guardar_libro_codigos(libro, libro_path)
+    print(f"💾 Libro de códigos guardado: {libro_path}")
+    
     return excel_path
 
 def mostrar_tabla(df_codificacion):
@@ -157,14 +157,15 @@ def main():
     # Cargar datos
     etiquetas, valores = cargar_datos()
     
-    # Analizar codificación (mínimo 10 variables)
-    df_codificacion = analizar_codificacion(etiquetas, valores, max_variables=15)
+    # Analizar codificación (todas las variables)
+    df_codificacion, libro = analizar_codificacion(etiquetas, valores,
+                                                   max_categorias=PARAMETROS['max_categorias'])
     
     # Mostrar tabla
     mostrar_tabla(df_codificacion)
     
     # Guardar resultados
-    guardar_resultados(df_codificacion)
+    guardar_resultados(df_codificacion, libro)
     
     print("\n✅ ¡Análisis completado!")
     print("\n📌 Esta tabla debe incluirse en tu informe final.")
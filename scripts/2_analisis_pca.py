@@ -7,87 +7,305 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
 from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
 from pathlib import Path
 
+from motor_correlacion import calcular_estructura, componentes_principales, obtener_estructura
+from retencion import analisis_paralelo, map_velicer
+from preprocesamiento import (preparar_matriz, como_dataframe, estadisticas_por_bloques,
+                              estandarizar_por_bloques)
+
 # Configuración de estilo
 plt.style.use('seaborn-v0_8-darkgrid')
 sns.set_palette("husl")
 
+# Entradas, parámetros y salidas de la etapa (definen su huella en main.py)
+ENTRADAS = ['../BASE_NOMBRES_Y_VALORES.xlsx']
+PARAMETROS = {
+    'n_components': None,
+    'metodo': 'auto',
+    # 'memoria' o 'streaming' (por bloques desde disco, memoria acotada)
+    'modo': 'memoria',
+    'tamano_bloque': 50_000,
+    # Criterio con el que se recomienda cuántas componentes retener:
+    # 'paralelo' (análisis paralelo de Horn), 'map' (Velicer) o 'kaiser'
+    'criterio_retencion': 'paralelo',
+    'percentil_paralelo': 95,
+}
+SALIDAS = [
+    '../graficos/scree_plot.png',
+    '../graficos/mapa_calor_cargas.png',
+    '../resultados/tabla_autovalores.xlsx',
+    '../resultados/tabla_cargas_factoriales.xlsx',
+    '../resultados/reporte_pca.txt',
+]
+
 def cargar_y_preparar_datos():
     """Carga y prepara los datos para el análisis"""
     print("📂 Cargando datos...")
     
-    # Cargar datos numéricos
-    df = pd.read_excel('../BASE_NOMBRES_Y_VALORES.xlsx')
-    
-    print(f"✓ Datos cargados: {df.shape[0]} filas, {df.shape[1]} columnas")
+    # Matriz numérica imputada y estandarizada (compartida entre etapas)
+    datos = preparar_matriz('../BASE_NOMBRES_Y_VALORES.xlsx')
     
-    # Seleccionar solo columnas numéricas
-    df_numeric = df.select_dtypes(include=[np.number])
+    print(f"✓ Datos cargados: {datos['forma_origen'][0]} filas, {datos['forma_origen'][1]} columnas")
+    print(f"✓ Columnas numéricas: {len(datos['columnas'])}")
+    print(f"✓ Valores faltantes imputados")
     
-    print(f"✓ Columnas numéricas: {df_numeric.shape[1]}")
+    df_imputed = como_dataframe(datos['imputada'], datos['columnas'])
     
-    # Imputar valores faltantes con la media
-    imputer = SimpleImputer(strategy='mean')
-    df_imputed = pd.DataFrame(
-        imputer.fit_transform(df_numeric),
-        columns=df_numeric.columns
-    )
+    return df_imputed, datos
+
+# Solvers de sklearn para los modos truncados
+SOLVERS_TRUNCADOS = {'aleatorizado': 'randomized', 'arpack': 'arpack'}
+
+def _pca_truncado(datos, solver, n_components=None, k_inicial=20):
+    """
+    Calcula solo las primeras k componentes con SVD aleatorizada o ARPACK.
     
-    print(f"✓ Valores faltantes imputados")
+    La varianza total se toma de la traza (suma de varianzas por columna),
+    así que explained_variance_ratio_ es exacta aunque no se calculen todas
+    las componentes. Con n_components=None, k se duplica hasta que el último
+    autovalor calculado sea ≤ 1 (todas las componentes de Kaiser incluidas);
+    si para eso hace falta más de la mitad del rango, se usa la SVD completa.
+    """
+    limite = min(datos.shape) - (1 if solver == 'arpack' else 0)
+    k = min(n_components or k_inicial, limite)
     
-    return df_imputed
+    while True:
+        pca = PCA(n_components=k, svd_solver=solver, random_state=42)
+        componentes = pca.fit_transform(datos)
+        
+        if n_components is not None or pca.explained_variance_[-1] <= 1 or k == limite:
+            return pca, componentes
+        
+        k = min(2 * k, limite)
+        if k > limite // 2:
+            pca = PCA(n_components=min(datos.shape))
+            return pca, pca.fit_transform(datos)
 
-def realizar_pca(df, n_components=None):
+def _pca_desde_estructura(estructura, datos, n_components=None):
+    """
+    PCA a partir de la descomposición espectral de la matriz de correlación
+    (motor_correlacion). Devuelve un objeto PCA de sklearn con los mismos
+    atributos que un ajuste por SVD, para que el resto del script no cambie.
+    """
+    n, p = datos.shape
+    k = n_components or min(n, p)
+    resultado = componentes_principales(estructura, datos, k)
+    
+    pca = PCA(n_components=k)
+    pca.n_components_ = k
+    pca.n_samples_ = n
+    pca.n_features_in_ = p
+    pca.mean_ = np.zeros(p)
+    pca.components_ = resultado['componentes']
+    pca.explained_variance_ = resultado['varianza']
+    pca.explained_variance_ratio_ = resultado['proporcion']
+    pca.singular_values_ = np.sqrt(resultado['varianza'] * (n - 1))
+    resto = estructura['autovalores'][k:] * n / (n - 1)
+    pca.noise_variance_ = resto.mean() if len(resto) else 0.0
+    return pca, resultado['puntuaciones']
+
+def resolver_metodo(metodo, forma):
+    """
+    Traduce metodo='auto' según la forma (n, p) de los datos: aleatorizado si
+    min(n, p) > 500; si no, desde la matriz de correlación cuando n >= p
+    (compartida con el AFE); SVD completa en el resto de casos
+    """
+    if metodo != 'auto':
+        return metodo
+    if min(forma) > 500:
+        return 'aleatorizado'
+    return 'correlacion' if forma[0] >= forma[1] else 'completo'
+
+def realizar_pca(df, n_components=None, datos_estandarizados=None, metodo='completo',
+                 estructura=None):
     """
     Realiza el Análisis de Componentes Principales
     
     Args:
         df: DataFrame con datos numéricos
-        n_components: Número de componentes (None = todos)
+        n_components: Número de componentes (None = todos, o en los modos
+            truncados las necesarias para los criterios de retención)
+        datos_estandarizados: Matriz ya estandarizada (None = estandarizar df)
+        metodo: 'completo' (SVD completa), 'aleatorizado' (SVD aleatorizada),
+            'arpack' (Lanczos), 'correlacion' (autovectores de la matriz de
+            correlación) o 'auto' (ver resolver_metodo)
+        estructura: Estructura de correlación ya calculada para el método
+            'correlacion' (None = calcularla a partir de los datos)
     """
     print("\n🔬 Realizando Análisis de Componentes Principales...")
     
     # Estandarizar los datos
-    scaler = StandardScaler()
-    datos_estandarizados = scaler.fit_transform(df)
+    if datos_estandarizados is None:
+        scaler = StandardScaler()
+        datos_estandarizados = scaler.fit_transform(df)
+    
+    metodo = resolver_metodo(metodo, df.shape)
     
     # Aplicar PCA
-    if n_components is None:
-        n_components = min(df.shape[0], df.shape[1])
+    if metodo == 'correlacion':
+        if estructura is None:
+            estructura = calcular_estructura(datos_estandarizados)
+        pca, componentes = _pca_desde_estructura(estructura, datos_estandarizados, n_components)
+        print(f"✓ PCA (matriz de correlación) completado con {pca.n_components_} componentes")
+    elif metodo in SOLVERS_TRUNCADOS:
+        pca, componentes = _pca_truncado(datos_estandarizados, SOLVERS_TRUNCADOS[metodo],
+                                         n_components)
+        print(f"✓ PCA truncado ({metodo}) completado con {pca.n_components_} componentes")
+    else:
+        if n_components is None:
+            n_components = min(df.shape[0], df.shape[1])
+        
+        pca = PCA(n_components=n_components)
+        componentes = pca.fit_transform(datos_estandarizados)
+        
+        print(f"✓ PCA completado con {pca.n_components_} componentes")
     
-    pca = PCA(n_components=n_components)
-    componentes = pca.fit_transform(datos_estandarizados)
+    return pca, componentes, datos_estandarizados
+
+def _rebloquear(bloques, minimo):
+    """
+    Agrupa bloques para que todos tengan al menos `minimo` filas
+    (IncrementalPCA lo exige); un resto final pequeño se une al anterior.
+    """
+    listo = None
+    acumulado = []
+    n_acumulado = 0
+    for bloque in bloques:
+        acumulado.append(bloque)
+        n_acumulado += len(bloque)
+        if n_acumulado >= minimo:
+            if listo is not None:
+                yield listo
+            listo = np.vstack(acumulado)
+            acumulado, n_acumulado = [], 0
+    if acumulado:
+        listo = np.vstack(([listo] if listo is not None else []) + acumulado)
+    if listo is not None:
+        yield listo
+
+def realizar_pca_streaming(ruta, n_components=None, tamano_bloque=50_000,
+                           ruta_puntuaciones='../resultados/puntuaciones_pca.npy'):
+    """
+    PCA fuera de memoria: lee el archivo por bloques y nunca lo carga entero
     
-    print(f"✓ PCA completado con {pca.n_components_} componentes")
+    1. Primera pasada: estadísticas de imputación y estandarización
+    2. Segunda pasada: IncrementalPCA.partial_fit sobre bloques estandarizados
+    3. Tercera pasada: puntuaciones escritas bloque a bloque en un .npy
+       mapeado en memoria
     
-    return pca, componentes, datos_estandarizados
+    La memoria máxima depende del tamaño de bloque, no del número de filas.
+    Los signos de las componentes siguen la misma convención que PCA, así
+    que tablas y gráficos coinciden con el modo en memoria.
+    
+    Returns:
+        (modelo, puntuaciones memmap n×k, columnas)
+    """
+    print("\n🔬 Realizando PCA en streaming (por bloques)...")
+    
+    estadisticas = estadisticas_por_bloques(ruta, tamano_bloque)
+    n, p = estadisticas['n'], len(estadisticas['columnas'])
+    print(f"✓ Primera pasada: {n} filas, {p} columnas numéricas")
+    
+    if n_components is None:
+        n_components = min(n, p)
+    
+    pca = IncrementalPCA(n_components=n_components)
+    bloques = estandarizar_por_bloques(ruta, estadisticas, tamano_bloque)
+    for bloque in _rebloquear(bloques, n_components):
+        pca.partial_fit(bloque)
+    print(f"✓ Segunda pasada: PCA incremental con {pca.n_components_} componentes")
+    
+    Path(ruta_puntuaciones).parent.mkdir(exist_ok=True)
+    puntuaciones = np.lib.format.open_memmap(ruta_puntuaciones, mode='w+',
+                                             dtype=np.float64, shape=(n, n_components))
+    
+    # Elemento de mayor valor absoluto por componente (convención de signos de PCA)
+    max_abs = np.zeros(n_components)
+    signos = np.ones(n_components)
+    inicio = 0
+    for bloque in estandarizar_por_bloques(ruta, estadisticas, tamano_bloque):
+        Y = pca.transform(bloque)
+        puntuaciones[inicio:inicio + len(Y)] = Y
+        
+        filas = np.argmax(np.abs(Y), axis=0)
+        valores = Y[filas, np.arange(n_components)]
+        mayor = np.abs(valores) > max_abs
+        max_abs[mayor] = np.abs(valores[mayor])
+        signos[mayor] = np.sign(valores[mayor])
+        inicio += len(Y)
+    
+    if (signos < 0).any():
+        pca.components_ *= signos[:, np.newaxis]
+        for i in range(0, n, tamano_bloque):
+            puntuaciones[i:i + tamano_bloque] *= signos
+    puntuaciones.flush()
+    print(f"✓ Tercera pasada: puntuaciones guardadas en {ruta_puntuaciones}")
+    
+    return pca, puntuaciones, estadisticas['columnas']
 
-def calcular_componentes_optimos(pca):
-    """Determina el número óptimo de componentes"""
+def calcular_componentes_optimos(pca, estructura=None, percentil=95):
+    """
+    Determina el número óptimo de componentes
+    
+    Además de los umbrales de varianza y Kaiser, aplica el análisis paralelo
+    de Horn (autovalores por encima del percentil de matrices aleatorias
+    del mismo n y p) y, si se da la estructura de correlación, el MAP de
+    Velicer (retencion.py).
+    """
     
     # Varianza acumulada
     varianza_acumulada = np.cumsum(pca.explained_variance_ratio_)
     
+    # Con PCA truncado un umbral puede no alcanzarse con las componentes
+    # calculadas: en ese caso el criterio queda como None (más de k)
+    
     # Componentes que explican al menos 80% de varianza
-    n_comp_80 = np.argmax(varianza_acumulada >= 0.80) + 1
+    n_comp_80 = (np.argmax(varianza_acumulada >= 0.80) + 1
+                 if varianza_acumulada[-1] >= 0.80 else None)
     
     # Componentes que explican al menos 90% de varianza
-    n_comp_90 = np.argmax(varianza_acumulada >= 0.90) + 1
+    n_comp_90 = (np.argmax(varianza_acumulada >= 0.90) + 1
+                 if varianza_acumulada[-1] >= 0.90 else None)
     
     # Criterio de Kaiser (autovalores > 1)
     n_comp_kaiser = np.sum(pca.explained_variance_ > 1)
     
+    # Análisis paralelo sobre los autovalores de la matriz de correlación
+    n = getattr(pca, 'n_samples_', None) or pca.n_samples_seen_
+    paralelo = analisis_paralelo(pca.explained_variance_ * (n - 1) / n, n, pca.n_features_in_,
+                                 percentil)
+    if paralelo['cota_inferior']:
+        print(f"⚠️  Análisis paralelo: las {paralelo['n_retener']} componentes calculadas superan "
+              f"su umbral; el número real puede ser mayor (aumenta 'n_components')")
+    
     return {
         '80_varianza': n_comp_80,
         '90_varianza': n_comp_90,
         'kaiser': n_comp_kaiser,
+        'paralelo': paralelo['n_retener'],
+        'paralelo_cota_inferior': paralelo['cota_inferior'],
+        'umbral_paralelo': paralelo['umbral'],
+        'percentil_paralelo': percentil,
+        'map': map_velicer(estructura)['n_retener'] if estructura is not None else None,
         'varianza_acumulada': varianza_acumulada
     }
 
+# Descripción de cada criterio de retención en el reporte
+CRITERIOS_RETENCION = {
+    'paralelo': 'el análisis paralelo de Horn',
+    'map': 'el MAP de Velicer',
+    'kaiser': 'el criterio de Kaiser',
+}
+
+def componentes_a_retener(criterios, criterio='paralelo'):
+    """Componentes recomendadas por el criterio elegido (Kaiser si no está disponible)"""
+    if criterios.get(criterio) is None:
+        criterio = 'kaiser'
+    return max(1, int(criterios[criterio])), criterio
+
 def crear_scree_plot(pca, output_dir='../graficos'):
     """Crea el scree plot (gráfico de sedimentación)"""
     
@@ -123,8 +341,14 @@ def crear_scree_plot(pca, output_dir='../graficos'):
     print(f"\n📊 Scree plot guardado: {path}")
     plt.close()
 
-def crear_tabla_autovalores(pca, output_dir='../resultados'):
-    """Crea tabla con autovalores y varianza explicada"""
+def crear_tabla_autovalores(pca, umbral_paralelo=None, output_dir='../resultados'):
+    """
+    Crea tabla con autovalores y varianza explicada
+    
+    Con umbral_paralelo (de calcular_componentes_optimos) añade el umbral
+    del análisis paralelo de cada componente, en la misma escala que el
+    autovalor.
+    """
     
     Path(output_dir).mkdir(exist_ok=True)
     
@@ -137,6 +361,9 @@ def crear_tabla_autovalores(pca, output_dir='../resultados'):
         'Varianza_Explicada_%': pca.explained_variance_ratio_[:n_componentes] * 100,
         'Varianza_Acumulada_%': np.cumsum(pca.explained_variance_ratio_[:n_componentes]) * 100
     })
+    if umbral_paralelo is not None:
+        n = getattr(pca, 'n_samples_', None) or pca.n_samples_seen_
+        df_autovalores['Umbral_Paralelo'] = umbral_paralelo[:n_componentes] * n / (n - 1)
     
     # Guardar
     path = Path(output_dir) / 'tabla_autovalores.xlsx'
@@ -201,9 +428,12 @@ def crear_mapa_calor_cargas(df_cargas, output_dir='../graficos'):
     print(f"📊 Mapa de calor guardado: {path}")
     plt.close()
 
-def generar_reporte_pca(pca, criterios, df_autovalores, df_cargas, output_dir='../resultados'):
+def generar_reporte_pca(pca, criterios, df_autovalores, df_cargas, criterio='paralelo',
+                        output_dir='../resultados'):
     """Genera reporte textual del análisis PCA"""
     
+    n_retener, criterio = componentes_a_retener(criterios, criterio)
+    
     Path(output_dir).mkdir(exist_ok=True)
     
     reporte = []
@@ -215,18 +445,33 @@ def generar_reporte_pca(pca, criterios, df_autovalores, df_cargas, output_dir='.
     # Pregunta 1: ¿Cuántos componentes retienes?
     reporte.append("1️⃣ ¿CUÁNTOS COMPONENTES RETIENES?")
     reporte.append("-" * 80)
-    reporte.append(f"   • Criterio 80% varianza: {criterios['80_varianza']} componentes")
-    reporte.append(f"   • Criterio 90% varianza: {criterios['90_varianza']} componentes")
+    k_calculadas = len(criterios['varianza_acumulada'])
+    for umbral in ['80', '90']:
+        n_comp = criterios[f'{umbral}_varianza']
+        if n_comp is None:
+            reporte.append(f"   • Criterio {umbral}% varianza: más de {k_calculadas} componentes "
+                           f"(PCA truncado)")
+        else:
+            reporte.append(f"   • Criterio {umbral}% varianza: {n_comp} componentes")
     reporte.append(f"   • Criterio de Kaiser (λ > 1): {criterios['kaiser']} componentes")
+    if criterios['paralelo_cota_inferior']:
+        reporte.append(f"   • Análisis paralelo (percentil {criterios['percentil_paralelo']}): "
+                       f"al menos {criterios['paralelo']} componentes (PCA truncado: todas las "
+                       f"calculadas superan su umbral)")
+    else:
+        reporte.append(f"   • Análisis paralelo (percentil {criterios['percentil_paralelo']}): "
+                       f"{criterios['paralelo']} componentes")
+    if criterios['map'] is not None:
+        reporte.append(f"   • MAP de Velicer: {criterios['map']} componentes")
     reporte.append("")
-    reporte.append(f"   ✅ RECOMENDACIÓN: Retener {criterios['kaiser']} componentes")
-    reporte.append("      (Basado en el criterio de Kaiser)")
+    reporte.append(f"   ✅ RECOMENDACIÓN: Retener {n_retener} componentes")
+    reporte.append(f"      (Basado en {CRITERIOS_RETENCION[criterio]})")
     reporte.append("")
     
     # Pregunta 2: ¿Qué % de varianza explican?
     reporte.append("2️⃣ ¿QUÉ % DE VARIANZA EXPLICAN?")
     reporte.append("-" * 80)
-    for i in range(min(criterios['kaiser'], 10)):
+    for i in range(min(n_retener, 10)):
         var_individual = pca.explained_variance_ratio_[i] * 100
         var_acum = criterios['varianza_acumulada'][i] * 100
         reporte.append(f"   • PC{i+1}: {var_individual:.2f}% (Acumulada: {var_acum:.2f}%)")
@@ -236,7 +481,7 @@ def generar_reporte_pca(pca, criterios, df_autovalores, df_cargas, output_dir='.
     reporte.append("3️⃣ ¿QUÉ ÍTEMS CARGAN MÁS EN CADA COMPONENTE?")
     reporte.append("-" * 80)
     
-    n_comp_mostrar = min(criterios['kaiser'], 5)
+    n_comp_mostrar = min(n_retener, 5)
     for i in range(n_comp_mostrar):
         pc_name = f'PC{i+1}'
         reporte.append(f"\n   📌 {pc_name}:")
@@ -266,27 +511,40 @@ def main():
     print("🔬 ANÁLISIS 2A: ANÁLISIS DE COMPONENTES PRINCIPALES (ACP/PCA)")
     print("=" * 80)
     
-    # 1. Cargar y preparar datos
-    df = cargar_y_preparar_datos()
-    
-    # 2. Realizar PCA
-    pca, componentes, datos_std = realizar_pca(df)
+    # 1-2. Cargar datos y realizar PCA (en memoria o por bloques desde disco)
+    estructura = None
+    if PARAMETROS['modo'] == 'streaming':
+        pca, componentes, columnas = realizar_pca_streaming(
+            '../BASE_NOMBRES_Y_VALORES.xlsx', n_components=PARAMETROS['n_components'],
+            tamano_bloque=PARAMETROS['tamano_bloque'])
+    else:
+        df, datos = cargar_y_preparar_datos()
+        metodo = resolver_metodo(PARAMETROS['metodo'], df.shape)
+        # La matriz de correlación se comparte (en caché) con el AFE
+        estructura = obtener_estructura(datos) if metodo == 'correlacion' else None
+        pca, componentes, datos_std = realizar_pca(df, n_components=PARAMETROS['n_components'],
+                                               datos_estandarizados=datos['estandarizada'],
+                                               metodo=metodo, estructura=estructura)
+        columnas = df.columns
     
     # 3. Calcular componentes óptimos
-    criterios = calcular_componentes_optimos(pca)
+    # (MAP de Velicer solo si ya se tiene la matriz de correlación)
+    criterios = calcular_componentes_optimos(pca, estructura, PARAMETROS['percentil_paralelo'])
+    n_retener, _ = componentes_a_retener(criterios, PARAMETROS['criterio_retencion'])
     
     # 4. Crear visualizaciones
     crear_scree_plot(pca)
     
     # 5. Crear tablas
-    df_autovalores = crear_tabla_autovalores(pca)
-    df_cargas = crear_tabla_cargas(pca, df.columns, n_componentes=criterios['kaiser'])
+    df_autovalores = crear_tabla_autovalores(pca, criterios['umbral_paralelo'])
+    df_cargas = crear_tabla_cargas(pca, columnas, n_componentes=n_retener)
     
     # 6. Crear mapa de calor
     crear_mapa_calor_cargas(df_cargas)
     
     # 7. Generar reporte
-    generar_reporte_pca(pca, criterios, df_autovalores, df_cargas)
+    generar_reporte_pca(pca, criterios, df_autovalores, df_cargas,
+                        criterio=PARAMETROS['criterio_retencion'])
     
     print("\n✅ ¡Análisis de PCA completado!")
     
@@ -7,58 +7,104 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from factor_analyzer import FactorAnalyzer, calculate_bartlett_sphericity, calculate_kmo
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
+from factor_analyzer import FactorAnalyzer
 from pathlib import Path
 
+from motor_correlacion import bartlett, depurar_kmo, kmo, obtener_estructura, subestructura
+from motor_factorial import bootstrap_cargas, congruencia_emparejada, rejilla_soluciones
+from preprocesamiento import preparar_matriz, como_dataframe
+from retencion import analisis_paralelo, map_velicer
+
 # Configuración de estilo
 plt.style.use('seaborn-v0_8-darkgrid')
 sns.set_palette("husl")
 
+# Entradas, parámetros y salidas de la etapa (definen su huella en main.py)
+ENTRADAS = ['../BASE_NOMBRES_Y_VALORES.xlsx']
+PARAMETROS = {
+    'rotation': 'varimax',
+    # Depuración de variables: se eliminan una a una las de menor MSA hasta
+    # que todas lo superen (None = usar todas las variables; p. ej. 0.5 la activa)
+    'umbral_msa': None,
+    # Criterio de retención: 'paralelo' (Horn), 'map' (Velicer) o 'kaiser'
+    'criterio_retencion': 'paralelo',
+    'percentil_paralelo': 95,
+    # Referencias del análisis paralelo: 'normal' (matrices Wishart de datos
+    # normales, en caché por n y p) o 'permutacion' (columnas de los propios
+    # datos permutadas por separado; respeta sus distribuciones marginales)
+    'referencia_paralelo': 'normal',
+    # Comparación de soluciones (opcional): métodos de extracción × rotaciones
+    # × número de factores (retenidos ± 'rango_factores'), ajustados en
+    # paralelo sobre la misma R. Cada método añade extracciones iterativas,
+    # así que por defecto no se compara; p. ej. ['minres', 'ml'] la activa.
+    'metodos_comparacion': [],
+    'rotaciones_comparacion': ['varimax', 'promax', 'oblimin', 'quartimax'],
+    'rango_factores': 1,
+    # Estabilidad de las cargas: réplicas bootstrap (remuestreo de encuestados,
+    # alineadas por Procrustes con la solución principal). 0 = no se calcula;
+    # p. ej. 1000 la activa y añade la sección de estabilidad al reporte
+    'replicas_bootstrap': 0,
+    'semilla_bootstrap': 42,
+}
+# Salidas opcionales: solo se generan (y se registran) si su parámetro las activa
+SALIDAS_OPCIONALES = {
+    '../resultados/comparacion_soluciones_afe.xlsx': bool(PARAMETROS['metodos_comparacion']),
+    '../resultados/depuracion_kmo.xlsx': PARAMETROS['umbral_msa'] is not None,
+    '../resultados/bootstrap_cargas_afe.xlsx': bool(PARAMETROS['replicas_bootstrap']),
+}
+SALIDAS = [
+    '../graficos/scree_plot_afe.png',
+    '../graficos/mapa_calor_afe.png',
+    '../resultados/tabla_cargas_afe.xlsx',
+    '../resultados/comparacion_afe_pca.txt',
+    '../resultados/reporte_afe.txt',
+] + [ruta for ruta, activa in SALIDAS_OPCIONALES.items() if activa]
+
 def cargar_y_preparar_datos():
     """Carga y prepara los datos para el análisis"""
     print("📂 Cargando datos...")
     
-    df = pd.read_excel('../BASE_NOMBRES_Y_VALORES.xlsx')
-    print(f"✓ Datos cargados: {df.shape[0]} filas, {df.shape[1]} columnas")
-    
-    # Seleccionar solo columnas numéricas
-    df_numeric = df.select_dtypes(include=[np.number])
-    print(f"✓ Columnas numéricas: {df_numeric.shape[1]}")
-    
-    # Imputar valores faltantes
-    imputer = SimpleImputer(strategy='mean')
-    df_imputed = pd.DataFrame(
-        imputer.fit_transform(df_numeric),
-        columns=df_numeric.columns
-    )
-    
+    # Matriz numérica imputada (compartida entre etapas)
+    datos = preparar_matriz('../BASE_NOMBRES_Y_VALORES.xlsx')
+    print(f"✓ Datos cargados: {datos['forma_origen'][0]} filas, {datos['forma_origen'][1]} columnas")
+    print(f"✓ Columnas numéricas: {len(datos['columnas'])}")
     print(f"✓ Valores faltantes imputados")
     
-    return df_imputed
+    # Correlación, autovalores e inversa (compartidos entre etapas)
+    estructura = obtener_estructura(datos)
+    
+    return como_dataframe(datos['imputada'], datos['columnas']), estructura
+
+def factores_de(df_loadings):
+    """Columnas de cargas (Factor1, Factor2, ...) sin las columnas derivadas"""
+    return [col for col in df_loadings.columns if col.startswith('Factor') and col[6:].isdigit()]
 
-def evaluar_adecuacion_muestral(df):
+def evaluar_adecuacion_muestral(estructura):
     """
     Evalúa si los datos son adecuados para análisis factorial
     usando KMO y test de Bartlett
+    
+    Args:
+        estructura: Estructura de correlación (motor_correlacion)
     """
     print("\n🔍 Evaluando adecuación muestral...")
     
     # Test de esfericidad de Bartlett
-    chi_square_value, p_value = calculate_bartlett_sphericity(df)
+    chi_square_value, p_value = bartlett(estructura)
     
     print(f"\n📊 Test de Bartlett:")
     print(f"   Chi-cuadrado: {chi_square_value:.2f}")
     print(f"   p-valor: {p_value:.6f}")
     
-    if p_value < 0.05:
+    if np.isnan(p_value):
+        print(f"   ⚠️  No se puede calcular: la matriz de correlación es singular")
+    elif p_value < 0.05:
         print(f"   ✅ Los datos son adecuados para factorial (p < 0.05)")
     else:
         print(f"   ⚠️  Los datos podrían no ser ideales (p >= 0.05)")
     
     # KMO (Kaiser-Meyer-Olkin)
-    kmo_all, kmo_model = calculate_kmo(df)
+    kmo_all, kmo_model = kmo(estructura)
     
     print(f"\n📊 Medida KMO:")
     print(f"   KMO global: {kmo_model:.3f}")
@@ -74,35 +120,101 @@ def evaluar_adecuacion_muestral(df):
     else:
         print(f"   ❌ Inadecuado")
     
-    return {'bartlett_p': p_value, 'kmo': kmo_model}
+    return {'bartlett_p': p_value, 'kmo': kmo_model, 'kmo_por_variable': kmo_all}
 
-def determinar_numero_factores(df, max_factors=10):
-    """Determina el número óptimo de factores"""
-    print("\n🔢 Determinando número óptimo de factores...")
+def depurar_variables(estructura, columnas, umbral=0.5, output_dir='../resultados'):
+    """
+    Elimina variables con MSA bajo, una a una (la de menor MSA cada vez)
     
-    # Probar diferentes números de factores
-    max_factors = min(max_factors, df.shape[1] - 1)
+    La inversa de R se actualiza en cada paso sin reinvertir
+    (motor_correlacion.depurar_kmo), así que la depuración completa cuesta
+    O(p³) en vez de O(p⁴).
     
-    # Análisis inicial para obtener autovalores
-    fa_initial = FactorAnalyzer(n_factors=max_factors, rotation=None)
-    fa_initial.fit(df)
+    Returns:
+        (estructura de las variables que quedan, sus columnas, DataFrame
+        con la trayectoria de eliminación)
+    """
+    print(f"\n🧹 Depurando variables por MSA (umbral {umbral})...")
+    
+    Path(output_dir).mkdir(exist_ok=True)
+    
+    columnas = pd.Index(columnas)
+    depuracion = depurar_kmo(estructura, umbral)
+    activas = depuracion['activas']
+    
+    df_trayectoria = pd.DataFrame([
+        {'Paso': i + 1, 'Variable': columnas[paso['indice']], 'MSA': paso['msa'],
+         'KMO_Antes': paso['kmo_antes'], 'KMO_Despues': paso['kmo_despues']}
+        for i, paso in enumerate(depuracion['trayectoria'])
+    ], columns=['Paso', 'Variable', 'MSA', 'KMO_Antes', 'KMO_Despues'])
+    df_final = pd.DataFrame({'Variable': columnas[activas],
+                             'MSA': depuracion['kmo_por_variable']}).sort_values('MSA')
+    
+    path = Path(output_dir) / 'depuracion_kmo.xlsx'
+    with pd.ExcelWriter(path) as writer:
+        df_trayectoria.to_excel(writer, sheet_name='Trayectoria', index=False)
+        df_final.to_excel(writer, sheet_name='Variables_Finales', index=False)
+    
+    for _, paso in df_trayectoria.iterrows():
+        print(f"   • Paso {paso['Paso']}: se elimina {paso['Variable']} (MSA {paso['MSA']:.3f}), "
+              f"KMO {paso['KMO_Antes']:.3f} → {paso['KMO_Despues']:.3f}")
+    print(f"✓ {activas.sum()} de {len(activas)} variables con MSA ≥ {umbral}")
+    print(f"📊 Depuración guardada: {path}")
+    
+    if activas.all():
+        return estructura, columnas, df_trayectoria
+    return (subestructura(estructura, activas, depuracion['R_inv']), columnas[activas],
+            df_trayectoria)
+
+def determinar_numero_factores(estructura, criterio='paralelo', percentil=95, referencia='normal',
+                               datos=None):
+    """
+    Determina el número óptimo de factores
     
-    # Obtener autovalores
-    ev, _ = fa_initial.get_eigenvalues()
+    Los autovalores son los de la matriz de correlación (no dependen de la
+    solución factorial), así que se leen de la estructura compartida en vez
+    de ajustar un modelo previo: el AFE solo minimiza una vez, en realizar_afe.
+    
+    Args:
+        estructura: Estructura de correlación (motor_correlacion)
+        criterio: 'paralelo' (Horn), 'map' (Velicer) o 'kaiser'
+        percentil: Percentil de las referencias del análisis paralelo
+        referencia: 'normal' o 'permutacion' (requiere datos)
+        datos: Matriz n×p de las variables analizadas (para 'permutacion')
+    
+    Returns:
+        (número de factores según el criterio, autovalores)
+    """
+    print("\n🔢 Determinando número óptimo de factores...")
+    
+    # Autovalores de R (descendentes), ya calculados por motor_correlacion
+    ev = estructura['autovalores']
     
     # Criterio de Kaiser (autovalores > 1)
-    n_factores_kaiser = np.sum(ev > 1)
+    n_factores_kaiser = int(np.sum(ev > 1))
+    
+    # Análisis paralelo de Horn y MAP de Velicer (retencion.py)
+    paralelo = analisis_paralelo(ev, estructura['n'], estructura['p'], percentil,
+                                 datos=datos if referencia == 'permutacion' else None)
+    n_factores = {
+        'kaiser': n_factores_kaiser,
+        'paralelo': paralelo['n_retener'],
+        'map': map_velicer(estructura)['n_retener'],
+    }
     
     print(f"\n✓ Autovalores calculados")
     print(f"✓ Factores con autovalor > 1: {n_factores_kaiser}")
+    print(f"✓ Análisis paralelo (percentil {percentil}, referencias {referencia}): "
+          f"{n_factores['paralelo']} factores")
+    print(f"✓ MAP de Velicer: {n_factores['map']} factores")
     
     # Crear gráfico de sedimentación
-    crear_scree_plot_afe(ev)
+    crear_scree_plot_afe(ev, umbral_paralelo=paralelo['umbral'])
     
-    return n_factores_kaiser, ev
+    return max(1, n_factores[criterio]), ev
 
-def crear_scree_plot_afe(eigenvalues, output_dir='../graficos'):
-    """Crea scree plot para AFE"""
+def crear_scree_plot_afe(eigenvalues, umbral_paralelo=None, output_dir='../graficos'):
+    """Crea scree plot para AFE (con el umbral del análisis paralelo, si se da)"""
     
     Path(output_dir).mkdir(exist_ok=True)
     
@@ -110,6 +222,9 @@ def crear_scree_plot_afe(eigenvalues, output_dir='../graficos'):
     factores = range(1, len(eigenvalues) + 1)
     plt.plot(factores, eigenvalues, 'bo-', linewidth=2, markersize=8)
     plt.axhline(y=1, color='r', linestyle='--', label='Criterio Kaiser (λ=1)')
+    if umbral_paralelo is not None:
+        plt.plot(factores, umbral_paralelo[:len(eigenvalues)], 'g--',
+                 label='Análisis paralelo (percentil)')
     plt.xlabel('Número de Factor', fontsize=12)
     plt.ylabel('Autovalor', fontsize=12)
     plt.title('Scree Plot - Análisis Factorial Exploratorio', fontsize=14, fontweight='bold')
@@ -122,7 +237,7 @@ def crear_scree_plot_afe(eigenvalues, output_dir='../graficos'):
     print(f"📊 Scree plot AFE guardado: {path}")
     plt.close()
 
-def realizar_afe(df, n_factors, rotation='varimax'):
+def realizar_afe(df, n_factors, rotation='varimax', estructura=None):
     """
     Realiza el Análisis Factorial Exploratorio
     
@@ -130,12 +245,18 @@ def realizar_afe(df, n_factors, rotation='varimax'):
         df: DataFrame con datos
         n_factors: Número de factores
         rotation: Método de rotación ('varimax', 'promax', None)
+        estructura: Estructura de correlación ya calculada (opcional);
+                    si se da, el modelo se ajusta sobre R sin recorrer df
     """
     print(f"\n🔬 Realizando AFE con {n_factors} factores (rotación: {rotation})...")
     
     # Crear y ajustar modelo
-    fa = FactorAnalyzer(n_factors=n_factors, rotation=rotation)
-    fa.fit(df)
+    if estructura is not None:
+        fa = FactorAnalyzer(n_factors=n_factors, rotation=rotation, is_corr_matrix=True)
+        fa.fit(estructura['R'])
+    else:
+        fa = FactorAnalyzer(n_factors=n_factors, rotation=rotation)
+        fa.fit(df)
     
     print(f"✓ AFE completado")
     
@@ -149,8 +270,14 @@ def realizar_afe(df, n_factors, rotation='varimax'):
         index=df.columns
     )
     
-    # Calcular comunalidades
-    communalities = fa.get_communalities()
+    # Calcular comunalidades. Con rotación oblicua son la diagonal de Λ·Φ·Λᵀ
+    # (la suma de cargas al cuadrado ignoraría la correlación entre factores);
+    # se usa la matriz de estructura Λ·Φ, que FactorAnalyzer reordena junto
+    # con las cargas (phi_ queda en el orden previo a ordenar los factores)
+    if fa.structure_ is not None:
+        communalities = (fa.structure_ * loadings).sum(axis=1)
+    else:
+        communalities = fa.get_communalities()
     df_loadings['Comunalidad'] = communalities
     
     # Calcular varianza explicada
@@ -164,7 +291,7 @@ def crear_tabla_cargas_afe(df_loadings, output_dir='../resultados'):
     Path(output_dir).mkdir(exist_ok=True)
     
     # Añadir columna con factor dominante
-    factor_cols = [col for col in df_loadings.columns if col.startswith('Factor')]
+    factor_cols = factores_de(df_loadings)
     df_loadings['Factor_Dominante'] = df_loadings[factor_cols].abs().idxmax(axis=1)
     df_loadings['Carga_Maxima'] = df_loadings[factor_cols].abs().max(axis=1)
     
@@ -185,7 +312,7 @@ def crear_mapa_calor_afe(df_loadings, output_dir='../graficos'):
     Path(output_dir).mkdir(exist_ok=True)
     
     # Seleccionar solo columnas de factores
-    factor_cols = [col for col in df_loadings.columns if col.startswith('Factor')]
+    factor_cols = factores_de(df_loadings)
     
     # Tomar top 20 variables por carga máxima
     top_vars = df_loadings.nlargest(20, 'Carga_Maxima')[factor_cols]
@@ -204,6 +331,151 @@ def crear_mapa_calor_afe(df_loadings, output_dir='../graficos'):
     print(f"📊 Mapa de calor AFE guardado: {path}")
     plt.close()
 
+def comparar_soluciones(estructura, columnas, n_factors, rotation='varimax',
+                        metodos=('minres', 'ml'), rotaciones=('varimax', 'promax'),
+                        rango_factores=1, output_dir='../resultados'):
+    """
+    Compara soluciones del AFE (extracción × rotación × número de factores)
+    
+    Cada extracción se ajusta una sola vez y se rota sin reajustar
+    (motor_factorial). La congruencia de Tucker se mide contra la solución
+    principal del análisis (minres, rotation, n_factors).
+    
+    Returns:
+        DataFrame con una fila por solución (índices de ajuste, congruencia
+        con la principal, cargas cruzadas y correlación máxima entre factores)
+    """
+    print(f"\n🔀 Comparando soluciones del AFE...")
+    
+    Path(output_dir).mkdir(exist_ok=True)
+    
+    valores_n = [n for n in range(n_factors - rango_factores, n_factors + rango_factores + 1)
+                 if 1 <= n < estructura['p']]
+    rotaciones = list(dict.fromkeys([rotation, *rotaciones]))
+    soluciones = rejilla_soluciones(estructura, metodos, rotaciones, valores_n)
+    
+    nombres = [f"{s['metodo']}-{s['rotacion']}-{s['n_factores']}" for s in soluciones]
+    referencia = f'minres-{rotation}-{n_factors}'
+    cargas_referencia = (soluciones[nombres.index(referencia)]['cargas']
+                         if referencia in nombres else None)
+    
+    filas = []
+    for nombre, solucion in zip(nombres, soluciones):
+        cargas, phi = solucion['cargas'], solucion['phi']
+        fila = {
+            'Solucion': nombre,
+            'Metodo': solucion['metodo'],
+            'Rotacion': solucion['rotacion'],
+            'Factores': solucion['n_factores'],
+            **{k: solucion[k] for k in ['RMSR', 'Residuo_Max', 'Residuos_05', 'Chi2', 'gl',
+                                        'p_Chi2', 'RMSEA', 'BIC', 'Comunalidad_Media']},
+            # Variables con carga > 0.4 en más de un factor
+            'Cargas_Cruzadas': int(((np.abs(cargas) > 0.4).sum(axis=1) > 1).sum()),
+            'Correlacion_Factores_Max': (float(np.abs(phi - np.eye(len(phi))).max())
+                                         if solucion['oblicua'] else 0.0),
+        }
+        if cargas_referencia is not None:
+            congruencia = congruencia_emparejada(cargas, cargas_referencia)
+            fila['Congruencia_Media'] = congruencia.mean()
+            fila['Congruencia_Min'] = congruencia.min()
+        filas.append(fila)
+    df_soluciones = pd.DataFrame(filas)
+    
+    # Congruencia media entre cada par de soluciones
+    congruencias = np.ones((len(soluciones), len(soluciones)))
+    for i in range(len(soluciones)):
+        for j in range(i + 1, len(soluciones)):
+            congruencias[i, j] = congruencias[j, i] = congruencia_emparejada(
+                soluciones[i]['cargas'], soluciones[j]['cargas']).mean()
+    df_congruencias = pd.DataFrame(congruencias, index=nombres, columns=nombres)
+    
+    # Cargas de todas las soluciones en formato largo
+    df_cargas = pd.concat([
+        pd.DataFrame(solucion['cargas'], index=pd.Index(columnas, name='Variable'),
+                     columns=[f'Factor{i+1}' for i in range(solucion['n_factores'])])
+        .reset_index().melt(id_vars='Variable', var_name='Factor', value_name='Carga')
+        .assign(Solucion=nombre)
+        for nombre, solucion in zip(nombres, soluciones)
+    ])[['Solucion', 'Variable', 'Factor', 'Carga']]
+    
+    path = Path(output_dir) / 'comparacion_soluciones_afe.xlsx'
+    with pd.ExcelWriter(path) as writer:
+        df_soluciones.to_excel(writer, sheet_name='Soluciones', index=False)
+        df_congruencias.to_excel(writer, sheet_name='Congruencia')
+        df_cargas.to_excel(writer, sheet_name='Cargas', index=False)
+    
+    print(f"✓ {len(soluciones)} soluciones ({len(metodos)} extracciones × "
+          f"{len(valores_n)} números de factores × {len(rotaciones)} rotaciones)")
+    if df_soluciones['BIC'].notna().any():
+        mejor = df_soluciones.loc[df_soluciones['BIC'].idxmin()]
+        print(f"✓ Menor BIC: {mejor['Metodo']} con {mejor['Factores']} factores "
+              f"(RMSR {mejor['RMSR']:.3f})")
+    else:
+        # R o la matriz reproducida no es definida positiva (p. ej. R casi
+        # singular): sin chi² de máxima verosimilitud no hay BIC
+        mejor = df_soluciones.loc[df_soluciones['RMSR'].idxmin()]
+        print(f"⚠️  No se pudo calcular el BIC (matriz no definida positiva); "
+              f"menor RMSR: {mejor['Metodo']} con {mejor['Factores']} factores "
+              f"(RMSR {mejor['RMSR']:.3f})")
+    print(f"📊 Comparación de soluciones guardada: {path}")
+    
+    return df_soluciones
+
+def bootstrap_estabilidad(df, df_loadings, rotation='varimax', n_replicas=1000, semilla=42,
+                          output_dir='../resultados'):
+    """
+    Intervalos de confianza bootstrap (percentil 95%) de cargas y comunalidades
+    
+    Cada réplica remuestrea encuestados con pesos multinomiales sobre la
+    matriz compartida, reajusta el AFE y se alinea con la solución principal
+    por Procrustes ortogonal (motor_factorial.bootstrap_cargas).
+    
+    Returns:
+        dict con 'n_replicas', 'cargas' y 'comunalidades' (DataFrames con
+        error estándar e intervalos) para el reporte
+    """
+    print(f"\n🎲 Bootstrap de cargas ({n_replicas} réplicas)...")
+    
+    Path(output_dir).mkdir(exist_ok=True)
+    
+    factor_cols = factores_de(df_loadings)
+    referencia = df_loadings[factor_cols].to_numpy()
+    resultado = bootstrap_cargas(df.to_numpy(), referencia, rotacion=rotation,
+                                 n_replicas=n_replicas, semilla=semilla)
+    
+    def largo(matriz, nombre):
+        return (pd.DataFrame(matriz, index=pd.Index(df.columns, name='Variable'),
+                             columns=factor_cols)
+                .reset_index().melt(id_vars='Variable', var_name='Factor', value_name=nombre))
+    
+    df_cargas = largo(referencia, 'Carga')
+    for nombre, clave in [('Media_Bootstrap', 'media'), ('Error_Estandar', 'error_estandar'),
+                          ('IC_Inf', 'ic_inf'), ('IC_Sup', 'ic_sup')]:
+        df_cargas[nombre] = largo(resultado[clave], nombre)[nombre]
+    df_cargas['Excluye_Cero'] = (df_cargas['IC_Inf'] > 0) | (df_cargas['IC_Sup'] < 0)
+    
+    df_comunalidades = pd.DataFrame({
+        'Variable': df.columns,
+        'Comunalidad': df_loadings['Comunalidad'].to_numpy(),
+        'Error_Estandar': resultado['comunalidad_error_estandar'],
+        'IC_Inf': resultado['comunalidad_ic_inf'],
+        'IC_Sup': resultado['comunalidad_ic_sup'],
+    })
+    
+    path = Path(output_dir) / 'bootstrap_cargas_afe.xlsx'
+    with pd.ExcelWriter(path) as writer:
+        df_cargas.to_excel(writer, sheet_name='Cargas', index=False)
+        df_comunalidades.to_excel(writer, sheet_name='Comunalidades', index=False)
+    
+    relevantes = df_cargas[df_cargas['Carga'].abs() > 0.4]
+    print(f"✓ Cargas > 0.4 con IC que excluye 0: "
+          f"{relevantes['Excluye_Cero'].sum()} de {len(relevantes)}")
+    print(f"✓ Ancho medio del IC de las cargas: "
+          f"{(df_cargas['IC_Sup'] - df_cargas['IC_Inf']).mean():.3f}")
+    print(f"📊 Bootstrap de cargas guardado: {path}")
+    
+    return {'n_replicas': n_replicas, 'cargas': df_cargas, 'comunalidades': df_comunalidades}
+
 def comparar_con_pca(df_loadings, output_dir='../resultados'):
     """Compara resultados de AFE con PCA"""
     
@@ -257,7 +529,15 @@ def comparar_con_pca(df_loadings, output_dir='../resultados'):
     
     print(f"\n💾 Comparación guardada: {path}")
 
-def generar_reporte_afe(n_factors, df_loadings, variance, adecuacion, output_dir='../resultados'):
+# Descripción de cada criterio de retención en el reporte
+CRITERIOS_RETENCION = {
+    'paralelo': 'análisis paralelo de Horn',
+    'map': 'MAP de Velicer',
+    'kaiser': 'criterio de Kaiser: autovalores > 1',
+}
+
+def generar_reporte_afe(n_factors, df_loadings, variance, adecuacion, criterio='paralelo',
+                        estabilidad=None, output_dir='../resultados'):
     """Genera reporte completo del AFE"""
     
     Path(output_dir).mkdir(exist_ok=True)
@@ -273,13 +553,18 @@ def generar_reporte_afe(n_factors, df_loadings, variance, adecuacion, output_dir
     reporte.append("-" * 80)
     reporte.append(f"   • KMO: {adecuacion['kmo']:.3f}")
     reporte.append(f"   • Test de Bartlett (p-valor): {adecuacion['bartlett_p']:.6f}")
+    trayectoria = adecuacion.get('depuracion')
+    if trayectoria is not None and len(trayectoria) > 0:
+        reporte.append(f"   • Variables eliminadas por MSA bajo: {len(trayectoria)} "
+                       f"({', '.join(trayectoria['Variable'].astype(str))})")
+        reporte.append(f"   • KMO tras la depuración: {trayectoria['KMO_Despues'].iloc[-1]:.3f}")
     reporte.append("")
     
     # Número de factores
     reporte.append("2️⃣ NÚMERO DE FACTORES ELEGIDOS")
     reporte.append("-" * 80)
     reporte.append(f"   ✅ Se retuvieron {n_factors} factores")
-    reporte.append("      (Basado en criterio de Kaiser: autovalores > 1)")
+    reporte.append(f"      (Basado en {CRITERIOS_RETENCION[criterio]})")
     reporte.append("")
     
     # Varianza explicada
@@ -295,7 +580,7 @@ def generar_reporte_afe(n_factors, df_loadings, variance, adecuacion, output_dir
     reporte.append("4️⃣ VARIABLES MÁS RELEVANTES POR FACTOR")
     reporte.append("-" * 80)
     
-    factor_cols = [col for col in df_loadings.columns if col.startswith('Factor')]
+    factor_cols = factores_de(df_loadings)
     for factor in factor_cols:
         reporte.append(f"\n   📌 {factor}:")
         top_vars = df_loadings[factor].abs().nlargest(5)
@@ -306,8 +591,27 @@ def generar_reporte_afe(n_factors, df_loadings, variance, adecuacion, output_dir
     
     reporte.append("")
     
+    # Estabilidad bootstrap de las cargas
+    if estabilidad is not None:
+        df_cargas = estabilidad['cargas']
+        relevantes = df_cargas[df_cargas['Carga'].abs() > 0.4]
+        ancho = df_cargas['IC_Sup'] - df_cargas['IC_Inf']
+        reporte.append("5️⃣ ESTABILIDAD DE LAS CARGAS (BOOTSTRAP)")
+        reporte.append("-" * 80)
+        reporte.append(f"   • Réplicas: {estabilidad['n_replicas']} (IC percentil 95%, "
+                       f"alineadas por Procrustes)")
+        reporte.append(f"   • Cargas > 0.4 con IC que excluye 0: "
+                       f"{relevantes['Excluye_Cero'].sum()} de {len(relevantes)}")
+        reporte.append(f"   • Ancho medio del IC: {ancho.mean():.3f}")
+        reporte.append("   • Cargas relevantes menos estables (IC más ancho):")
+        for i in ancho[relevantes.index].nlargest(5).index:
+            fila = df_cargas.loc[i]
+            reporte.append(f"      • {fila['Variable']} en {fila['Factor']}: {fila['Carga']:.3f} "
+                           f"[{fila['IC_Inf']:.3f}, {fila['IC_Sup']:.3f}]")
+        reporte.append("")
+    
     # Coherencia de factores
-    reporte.append("5️⃣ COHERENCIA DE FACTORES")
+    reporte.append(f"{'6️⃣' if estabilidad is not None else '5️⃣'} COHERENCIA DE FACTORES")
     reporte.append("-" * 80)
     reporte.append("   Los factores son coherentes si:")
     reporte.append("   ✓ Las variables con altas cargas tienen sentido temático")
@@ -335,27 +639,60 @@ def main():
     print("🔬 ANÁLISIS 2B: ANÁLISIS FACTORIAL EXPLORATORIO (AFE)")
     print("=" * 80)
     
+    # Quitar salidas opcionales desactivadas (restos de ejecuciones anteriores)
+    for ruta, activa in SALIDAS_OPCIONALES.items():
+        if not activa:
+            Path(ruta).unlink(missing_ok=True)
+    
     # 1. Cargar datos
-    df = cargar_y_preparar_datos()
+    df, estructura = cargar_y_preparar_datos()
     
     # 2. Evaluar adecuación muestral
-    adecuacion = evaluar_adecuacion_muestral(df)
-    
-    # 3. Determinar número de factores
-    n_factors, eigenvalues = determinar_numero_factores(df)
+    adecuacion = evaluar_adecuacion_muestral(estructura)
+    
+    # 2b. Depurar variables con MSA bajo (el AFE usa solo las que quedan)
+    if PARAMETROS['umbral_msa'] is not None:
+        estructura, columnas, trayectoria = depurar_variables(estructura, df.columns,
+                                                              PARAMETROS['umbral_msa'])
+        df = df[columnas]
+        adecuacion['depuracion'] = trayectoria
+    
+    # 3. Determinar número de factores (solo las referencias por permutación
+    #    leen los datos; las normales dependen únicamente de n y p)
+    referencia = PARAMETROS['referencia_paralelo']
+    n_factors, eigenvalues = determinar_numero_factores(estructura,
+                                                        PARAMETROS['criterio_retencion'],
+                                                        PARAMETROS['percentil_paralelo'],
+                                                        referencia,
+                                                        datos=(df.to_numpy() if referencia ==
+                                                               'permutacion' else None))
     
     # 4. Realizar AFE
-    fa, df_loadings, variance = realizar_afe(df, n_factors)
+    fa, df_loadings, variance = realizar_afe(df, n_factors, rotation=PARAMETROS['rotation'],
+                                             estructura=estructura)
+    
+    # 4b. Estabilidad de las cargas (antes de añadir columnas derivadas)
+    estabilidad = None
+    if PARAMETROS['replicas_bootstrap']:
+        estabilidad = bootstrap_estabilidad(df, df_loadings, rotation=PARAMETROS['rotation'],
+                                            n_replicas=PARAMETROS['replicas_bootstrap'],
+                                            semilla=PARAMETROS['semilla_bootstrap'])
     
     # 5. Crear tablas y gráficos
     df_loadings_sorted = crear_tabla_cargas_afe(df_loadings)
     crear_mapa_calor_afe(df_loadings)
     
-    # 6. Comparar con PCA
+    # 6. Comparar con PCA y entre soluciones del AFE
     comparar_con_pca(df_loadings)
+    if PARAMETROS['metodos_comparacion']:
+        comparar_soluciones(estructura, df.columns, n_factors, rotation=PARAMETROS['rotation'],
+                            metodos=PARAMETROS['metodos_comparacion'],
+                            rotaciones=PARAMETROS['rotaciones_comparacion'],
+                            rango_factores=PARAMETROS['rango_factores'])
     
     # 7. Generar reporte
-    generar_reporte_afe(n_factors, df_loadings, variance, adecuacion)
+    generar_reporte_afe(n_factors, df_loadings, variance, adecuacion,
+                        criterio=PARAMETROS['criterio_retencion'], estabilidad=estabilidad)
     
     print("\n✅ ¡Análisis Factorial Exploratorio completado!")
     
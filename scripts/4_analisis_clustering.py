@@ -1,6 +1,6 @@
 """
 Script 4: Análisis de Cluster (Agrupamiento)
-Implementa K-means con método del codo y descripción de grupos.
+Implementa K-means (o clustering jerárquico) con método del codo y descripción de grupos.
 """
 
 import pandas as pd
@@ -8,90 +8,226 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
-from sklearn.metrics import silhouette_score, calinski_harabasz_score, davies_bouldin_score
 from pathlib import Path
 
+from cache_datos import DIRECTORIO_CACHE, escribir_atomico
+from contrastes import contrastar_variables
+from graficos_densidad import UMBRAL_PUNTOS, dispersion_densidad
+from jerarquico import METODOS, barrido_jerarquico
+from motor_correlacion import componentes_principales, componentes_retenidos, obtener_estructura
+from motor_clustering import (asignar_por_bloques, barrido_incremental, barrido_k,
+                              kmeans_minilotes, perfil_clusters)
+from preprocesamiento import preparar_matriz, preparar_matriz_por_bloques, como_dataframe
+
 # Configuración de estilo
 plt.style.use('seaborn-v0_8-darkgrid')
 sns.set_palette("husl")
 
-def cargar_y_preparar_datos():
-    """Carga y prepara los datos para clustering"""
+# Entradas, parámetros y salidas de la etapa (definen su huella en main.py)
+ENTRADAS = ['../BASE_NOMBRES_Y_VALORES.xlsx']
+PARAMETROS = {
+    'max_clusters': 10,
+    # Silhouette exacta hasta este número de filas; por encima, estimada
+    # sobre una muestra estratificada de este tamaño (con IC 95%)
+    'muestra_silueta': 10_000,
+    'semilla_silueta': 42,
+    # 'independiente' (cada K desde cero, en paralelo) o 'incremental'
+    # (cada K parte del anterior bisecando su peor cluster)
+    'barrido': 'independiente',
+    # 'kmeans', 'ward' o 'promedio' (jerárquicos: un solo árbol para todos
+    # los K, construido sobre hasta 'muestra_jerarquico' filas)
+    'algoritmo': 'kmeans',
+    'muestra_jerarquico': 10_000,
+    # 'memoria' (K-means completo) o 'streaming' (K-means por minilotes que
+    # lee la matriz por bloques desde disco, memoria acotada)
+    'modo': 'memoria',
+    'tamano_bloque': 50_000,
+    # 'original' (todas las variables estandarizadas) o 'pca' (puntuaciones
+    # de las componentes retenidas según 'criterio_pca': 'kaiser' o un
+    # umbral de varianza acumulada, p. ej. 0.8)
+    'espacio': 'original',
+    'criterio_pca': 'kaiser',
+    # Nivel de FDR para los contrastes de variables entre clusters
+    'alfa_fdr': 0.05,
+}
+SALIDAS = [
+    '../graficos/metricas_clustering.png',
+    '../graficos/visualizacion_clusters.png',
+    '../resultados/estadisticas_clusters.xlsx',
+    '../resultados/descripcion_clusters.xlsx',
+    '../resultados/pruebas_clusters.xlsx',
+    '../resultados/interpretacion_clusters.txt',
+    '../resultados/reporte_clustering.txt',
+]
+
+def cargar_y_preparar_datos(por_bloques=False, tamano_bloque=50_000):
+    """
+    Carga y prepara los datos para clustering
+    
+    Con por_bloques=True el archivo se lee por bloques de filas y las
+    matrices se escriben en disco sin cargarlo entero.
+    
+    Returns:
+        (df_scaled, df_imputed, datos); datos es la matriz preprocesada
+        (ver preprocesamiento.preparar_matriz)
+    """
     print("📂 Cargando datos...")
     
-    df = pd.read_excel('../BASE_NOMBRES_Y_VALORES.xlsx')
-    print(f"✓ Datos cargados: {df.shape[0]} filas, {df.shape[1]} columnas")
+    # Matriz imputada y estandarizada (compartida entre etapas)
+    if por_bloques:
+        datos = preparar_matriz_por_bloques('../BASE_NOMBRES_Y_VALORES.xlsx', tamano_bloque)
+    else:
+        datos = preparar_matriz('../BASE_NOMBRES_Y_VALORES.xlsx')
+    print(f"✓ Datos cargados: {datos['forma_origen'][0]} filas, {datos['forma_origen'][1]} columnas")
+    print(f"✓ Columnas numéricas: {len(datos['columnas'])}")
     
-    # Seleccionar columnas numéricas
-    df_numeric = df.select_dtypes(include=[np.number])
-    print(f"✓ Columnas numéricas: {df_numeric.shape[1]}")
+    df_imputed = como_dataframe(datos['imputada'], datos['columnas'])
+    df_scaled = como_dataframe(datos['estandarizada'], datos['columnas'])
     
-    # Imputar valores faltantes
-    imputer = SimpleImputer(strategy='mean')
-    df_imputed = pd.DataFrame(
-        imputer.fit_transform(df_numeric),
-        columns=df_numeric.columns
-    )
+    print(f"✓ Datos estandarizados")
     
-    # Estandarizar datos
-    scaler = StandardScaler()
-    datos_estandarizados = scaler.fit_transform(df_imputed)
+    return df_scaled, df_imputed, datos
+
+def proyectar_en_componentes(datos, criterio='kaiser', por_bloques=False, tamano_bloque=50_000):
+    """
+    Puntuaciones en el subespacio de las componentes principales retenidas
     
-    df_scaled = pd.DataFrame(
-        datos_estandarizados,
-        columns=df_numeric.columns
-    )
+    Usa la matriz de correlación compartida con la etapa de PCA (en caché),
+    así que no se vuelve a ajustar ningún PCA.
     
-    print(f"✓ Datos estandarizados")
+    Args:
+        datos: Matriz preprocesada (de cargar_y_preparar_datos)
+        criterio: 'kaiser' o umbral de varianza acumulada (p. ej. 0.8)
+        por_bloques: Escribir las puntuaciones bloque a bloque en un .npy
+            junto a la matriz preprocesada (cache/matrices/) y abrirlas como
+            memmap, sin tener la matriz n×r en memoria
     
-    return df_scaled, df_imputed
+    Returns:
+        (DataFrame de puntuaciones PC1..PCr, proporción de varianza de cada una)
+    """
+    estructura = obtener_estructura(datos)
+    # Al menos dos componentes, para la visualización 2D
+    r = max(2, componentes_retenidos(estructura, criterio))
+    columnas = [f'PC{i + 1}' for i in range(r)]
+    
+    if por_bloques:
+        ruta = Path(DIRECTORIO_CACHE) / 'matrices' / datos['clave'] / f'componentes-{r}.npy'
+        if not ruta.exists():
+            def escribir(tmp):
+                salida = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float64,
+                                                   shape=(estructura['n'], r))
+                componentes_principales(estructura, datos['estandarizada'], r, tamano_bloque,
+                                        salida=salida)
+                salida.flush()
+                del salida
+            escribir_atomico(ruta, escribir)
+        puntuaciones = np.load(ruta, mmap_mode='r')
+        proporcion = estructura['autovalores'][:r] / np.trace(estructura['R'])
+    else:
+        resultado = componentes_principales(estructura, datos['estandarizada'], r)
+        puntuaciones, proporcion = resultado['puntuaciones'], resultado['proporcion']
+    
+    print(f"✓ Clustering en {r} componentes principales (criterio {criterio}, "
+          f"{proporcion.sum():.1%} de la varianza)")
+    
+    return como_dataframe(puntuaciones, columnas), proporcion
 
-def metodo_del_codo(df, max_clusters=10, output_dir='../graficos'):
+def metodo_del_codo(df, max_clusters=10, output_dir='../graficos', tamano_muestra=None,
+                    semilla=42, n_workers=None, por_bloques=False, tamano_bloque=50_000,
+                    incremental=False, algoritmo='kmeans', muestra_arbol=10_000):
     """
     Implementa el método del codo para determinar número óptimo de clusters
+    
+    Args:
+        df: Datos estandarizados
+        max_clusters: Mayor K a probar
+        output_dir: Carpeta del gráfico de métricas
+        tamano_muestra: Si hay más filas que esto, la silhouette se estima
+            sobre una muestra estratificada (None = siempre exacta)
+        semilla: Semilla del muestreo de la silhouette
+        n_workers: Procesos para el barrido de K (None = núcleos disponibles)
+        por_bloques: K-means por minilotes leyendo df por bloques de filas;
+            la silhouette se calcula sobre una submuestra estratificada
+        tamano_bloque: Filas por bloque en el modo por bloques
+        incremental: Construir cada K a partir del anterior (secuencial)
+        algoritmo: 'kmeans', 'ward' o 'promedio'
+        muestra_arbol: Filas para construir el árbol jerárquico; el resto
+            se asigna al centroide más cercano de cada corte
+    
+    Returns:
+        (mejor_k, metricas); metricas['centros'] (centros de mejor_k) y
+        metricas['modelo'] (la partición jerárquica de mejor_k, o None con
+        K-means) se reutilizan en el ajuste final
     """
     print(f"\n📊 Aplicando método del codo (probando 2-{max_clusters} clusters)...")
     
     # Listas para almacenar métricas
     inercias = []
     silhouette_scores = []
+    silhouette_ic = []
     calinski_scores = []
     davies_bouldin_scores = []
     
     range_clusters = range(2, max_clusters + 1)
     
-    for k in range_clusters:
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-        labels = kmeans.fit_predict(df)
-        
-        # Calcular métricas
-        inercias.append(kmeans.inertia_)
-        silhouette_scores.append(silhouette_score(df, labels))
-        calinski_scores.append(calinski_harabasz_score(df, labels))
-        davies_bouldin_scores.append(davies_bouldin_score(df, labels))
+    if algoritmo in METODOS:
+        # Un único árbol, cortado en cada K
+        print(f"   Clustering jerárquico ({METODOS[algoritmo]}), árbol sobre "
+              f"{min(len(df), muestra_arbol)} filas")
+        resultados = barrido_jerarquico(df.to_numpy(), range_clusters, metodo=algoritmo,
+                                        tamano_muestra=tamano_muestra, semilla_silueta=semilla,
+                                        muestra_arbol=muestra_arbol, semilla=42,
+                                        tamano_bloque=tamano_bloque)
+    elif incremental:
+        # Cada K parte de la solución del anterior
+        resultados = barrido_incremental(df.to_numpy(), range_clusters, semilla=42, n_init=10,
+                                         tamano_muestra=tamano_muestra, semilla_silueta=semilla,
+                                         por_bloques=por_bloques, tamano_bloque=tamano_bloque)
+    else:
+        # Cada K es independiente: se ajustan en paralelo sobre memoria compartida
+        resultados = barrido_k(df.to_numpy(), range_clusters, semilla=42, n_init=10,
+                               tamano_muestra=tamano_muestra, semilla_silueta=semilla,
+                               n_workers=n_workers, por_bloques=por_bloques,
+                               tamano_bloque=tamano_bloque)
+    
+    for k, resultado in zip(range_clusters, resultados):
+        # Recoger métricas (en orden de K)
+        sil = resultado['silueta']
+        inercias.append(resultado['inercia'])
+        silhouette_scores.append(sil['valor'])
+        silhouette_ic.append((sil['ic_inf'], sil['ic_sup']))
+        calinski_scores.append(resultado['calinski'])
+        davies_bouldin_scores.append(resultado['davies_bouldin'])
         
-        print(f"   K={k}: Inercia={kmeans.inertia_:.2f}, Silhouette={silhouette_scores[-1]:.3f}")
-    
-    # Crear gráfico del codo
-    crear_graficos_metricas(range_clusters, inercias, silhouette_scores, 
-                           calinski_scores, davies_bouldin_scores, output_dir)
+        detalle = "" if sil['exacta'] else (f" (IC95% {sil['ic_inf']:.3f}-{sil['ic_sup']:.3f}, "
+                                           f"muestra {sil['n_muestra']})")
+        print(f"   K={k}: Inercia={resultado['inercia']:.2f}, Silhouette={silhouette_scores[-1]:.3f}{detalle}")
     
     # Determinar mejor K usando silhouette
-    mejor_k = range_clusters[np.argmax(silhouette_scores)]
+    indice_mejor = int(np.argmax(silhouette_scores))
+    mejor_k = range_clusters[indice_mejor]
+    sil_mejor = resultados[indice_mejor]['silueta']
+    
+    # Crear gráfico del codo (con IC si la silhouette del K elegido es estimada)
+    crear_graficos_metricas(range_clusters, inercias, silhouette_scores, 
+                           calinski_scores, davies_bouldin_scores, output_dir,
+                           silhouette_ic=None if sil_mejor['exacta'] else silhouette_ic)
     
     print(f"\n✅ Mejor número de clusters (según Silhouette): {mejor_k}")
     
     return mejor_k, {
         'inercias': inercias,
         'silhouette': silhouette_scores,
+        'silhouette_ic': silhouette_ic,
         'calinski': calinski_scores,
-        'davies_bouldin': davies_bouldin_scores
+        'davies_bouldin': davies_bouldin_scores,
+        'centros': resultados[indice_mejor]['centros'],
+        'modelo': resultados[indice_mejor].get('modelo'),
     }
 
-def crear_graficos_metricas(range_clusters, inercias, silhouette, calinski, davies, output_dir):
-    """Crea gráficos de las métricas de clustering"""
+def crear_graficos_metricas(range_clusters, inercias, silhouette, calinski, davies, output_dir,
+                            silhouette_ic=None):
+    """Crea gráficos de las métricas de clustering (con IC de la silhouette si se estimó)"""
     
     Path(output_dir).mkdir(exist_ok=True)
     
@@ -106,6 +242,10 @@ def crear_graficos_metricas(range_clusters, inercias, silhouette, calinski, davi
     
     # Gráfico 2: Coeficiente de Silhouette
     axes[0, 1].plot(range_clusters, silhouette, 'go-', linewidth=2, markersize=8)
+    if silhouette_ic is not None:
+        ic = np.array(silhouette_ic)
+        axes[0, 1].fill_between(range_clusters, ic[:, 0], ic[:, 1], color='g', alpha=0.2,
+                                label='IC 95% (muestra)')
     axes[0, 1].set_xlabel('Número de Clusters', fontsize=11)
     axes[0, 1].set_ylabel('Coeficiente de Silhouette', fontsize=11)
     axes[0, 1].set_title('Coeficiente de Silhouette (mayor es mejor)', fontsize=12, fontweight='bold')
@@ -134,88 +274,186 @@ def crear_graficos_metricas(range_clusters, inercias, silhouette, calinski, davi
     print(f"📊 Gráficos de métricas guardados: {path}")
     plt.close()
 
-def realizar_clustering(df, n_clusters):
-    """Realiza clustering con K-means"""
+def realizar_clustering(df, n_clusters, modelo=None, centros=None):
+    """
+    Realiza clustering con K-means
+    
+    Si se pasa el modelo del barrido (partición jerárquica), se reutiliza; si
+    se pasan los centros de K-means del barrido (mismos datos y K), el ajuste
+    parte de ellos y converge en una iteración en vez de repetir n_init inicios.
+    """
     print(f"\n🔬 Realizando clustering con {n_clusters} grupos...")
     
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    labels = kmeans.fit_predict(df)
+    if modelo is not None:
+        kmeans = modelo
+        labels = modelo.labels_ if modelo.labels_ is not None else modelo.predict(df.to_numpy())
+        print(f"✓ Modelo reutilizado del método del codo")
+    elif centros is not None:
+        kmeans = KMeans(n_clusters=n_clusters, init=centros, n_init=1, random_state=42)
+        labels = kmeans.fit_predict(df)
+        print(f"✓ Ajuste desde los centros del método del codo")
+    else:
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        labels = kmeans.fit_predict(df)
     
     print(f"✓ Clustering completado")
     
     return kmeans, labels
 
-def describir_clusters(df_original, labels, n_clusters, output_dir='../resultados'):
-    """Describe cada cluster basándose en las características promedio"""
+def realizar_clustering_por_bloques(X, n_clusters, tamano_bloque=50_000,
+                                    ruta_etiquetas='../resultados/etiquetas_clusters.npy',
+                                    centros=None):
+    """
+    K-means por minilotes sobre una matriz leída por bloques (p. ej. un memmap)
     
-    Path(output_dir).mkdir(exist_ok=True)
+    Las etiquetas finales se asignan en una pasada y se escriben bloque a
+    bloque en un .npy mapeado en memoria. Si se pasan los centros del
+    barrido, solo se hace la pasada de asignación.
     
-    print(f"\n📝 Describiendo clusters...")
+    Returns:
+        (centros k×p, etiquetas memmap)
+    """
+    print(f"\n🔬 Realizando clustering por minilotes con {n_clusters} grupos...")
     
-    # Añadir etiquetas al DataFrame
-    df_con_clusters = df_original.copy()
-    df_con_clusters['Cluster'] = labels
+    if centros is None:
+        centros = kmeans_minilotes(X, n_clusters, semilla=42, n_init=10,
+                                   tamano_bloque=tamano_bloque).cluster_centers_
+    else:
+        print(f"✓ Centros reutilizados del método del codo")
     
-    # Calcular estadísticas por cluster
-    descripciones = []
+    Path(ruta_etiquetas).parent.mkdir(exist_ok=True)
+    etiquetas = np.lib.format.open_memmap(ruta_etiquetas, mode='w+', dtype=np.int32,
+                                          shape=(len(X),))
+    asignacion = asignar_por_bloques(centros, X, tamano_bloque, etiquetas)
+    etiquetas.flush()
     
-    for cluster_id in range(n_clusters):
-        cluster_data = df_con_clusters[df_con_clusters['Cluster'] == cluster_id]
-        n_miembros = len(cluster_data)
-        
-        # Calcular medias
-        medias = cluster_data.drop('Cluster', axis=1).mean()
-        
-        # Encontrar características más distintivas (mayor desviación de la media global)
-        media_global = df_original.mean()
-        diferencias = abs(medias - media_global)
-        top_caracteristicas = diferencias.nlargest(5)
-        
-        descripciones.append({
-            'Cluster': f'Cluster {cluster_id}',
-            'N_Miembros': n_miembros,
-            'Porcentaje': f'{(n_miembros/len(df_con_clusters)*100):.1f}%',
-            'Top_Caracteristicas': top_caracteristicas.to_dict()
-        })
+    print(f"✓ Clustering completado (inercia {asignacion['inercia']:.2f})")
+    print(f"✓ Etiquetas guardadas en {ruta_etiquetas}")
     
-    # Crear DataFrame de descripción
-    df_descripcion = pd.DataFrame(descripciones)
+    return centros, etiquetas
+
+def describir_clusters(df_original, labels, n_clusters, output_dir='../resultados', n_top=5):
+    """
+    Describe cada cluster en formato largo (una fila por cluster y variable)
     
-    # Guardar estadísticas detalladas
-    stats_completas = df_con_clusters.groupby('Cluster').mean()
+    El perfil completo (tamaño, media, desviación, cuartiles y diferencia
+    estandarizada con el perfil global) se guarda en estadisticas_clusters.xlsx;
+    las n_top variables más distintivas de cada cluster (mayor diferencia
+    estandarizada absoluta), en descripcion_clusters.xlsx.
     
+    Returns:
+        (df_descripcion, perfil)
+    """
+    
+    Path(output_dir).mkdir(exist_ok=True)
+    
+    print(f"\n📝 Describiendo clusters...")
+    
+    # Una pasada agrupada sobre la matriz (puede ser un memmap)
+    perfil = perfil_clusters(df_original.to_numpy(), labels, df_original.columns, n_clusters)
+    perfil['Porcentaje'] = perfil['N'] / len(labels) * 100
+    
+    # Características más distintivas de cada cluster
+    df_descripcion = (perfil.assign(Distancia=perfil['Diferencia_Estandarizada'].abs())
+                      .sort_values(['Cluster', 'Distancia'], ascending=[True, False], kind='stable')
+                      .groupby('Cluster').head(n_top))
+    df_descripcion = df_descripcion.assign(
+        Rango=df_descripcion.groupby('Cluster').cumcount() + 1
+    )[['Cluster', 'N', 'Porcentaje', 'Rango', 'Variable', 'Media', 'Media_Global',
+       'Diferencia_Estandarizada']].reset_index(drop=True)
+    
+    # Guardar estadísticas detalladas
     path_stats = Path(output_dir) / 'estadisticas_clusters.xlsx'
-    stats_completas.to_excel(path_stats)
+    perfil.to_excel(path_stats, index=False)
     print(f"📊 Estadísticas de clusters guardadas: {path_stats}")
     
     path_desc = Path(output_dir) / 'descripcion_clusters.xlsx'
     df_descripcion.to_excel(path_desc, index=False)
     print(f"📊 Descripción de clusters guardada: {path_desc}")
     
-    return df_con_clusters, df_descripcion, stats_completas
+    return df_descripcion, perfil
+
+def contrastar_clusters(df_original, labels, faltantes=None, alfa=0.05,
+                        output_dir='../resultados'):
+    """
+    Contrasta todas las variables entre clusters (ANOVA, Kruskal-Wallis y
+    chi-cuadrado con tamaños de efecto y FDR; ver contrastes.py)
+    
+    Con faltantes (máscara de la matriz preprocesada) los valores imputados
+    se excluyen: las tablas de contingencia usan solo los códigos originales.
+    
+    Returns:
+        DataFrame con una fila por variable, ordenado por η²
+    """
+    
+    Path(output_dir).mkdir(exist_ok=True)
+    
+    print(f"\n🧪 Contrastando variables entre clusters...")
+    
+    pruebas = contrastar_variables(df_original.to_numpy(), labels, df_original.columns,
+                                   faltantes=faltantes)
+    pruebas = pruebas.sort_values('Eta2', ascending=False, na_position='last',
+                                  kind='stable').reset_index(drop=True)
+    
+    n_significativas = int((pruebas['q_F'] < alfa).sum())
+    print(f"✓ {n_significativas} de {len(pruebas)} variables difieren entre clusters "
+          f"(ANOVA, FDR {alfa:.0%})")
+    
+    path = Path(output_dir) / 'pruebas_clusters.xlsx'
+    pruebas.to_excel(path, index=False)
+    print(f"📊 Contrastes guardados: {path}")
+    
+    return pruebas
 
-def visualizar_clusters_2d(df_scaled, labels, n_clusters, output_dir='../graficos'):
-    """Visualiza clusters en 2D usando las dos primeras componentes principales"""
+def visualizar_clusters_2d(df_scaled, labels, n_clusters, output_dir='../graficos',
+                           max_puntos=50_000, proporcion=None, umbral_densidad=UMBRAL_PUNTOS):
+    """
+    Visualiza clusters en 2D usando las dos primeras componentes principales
+    
+    Con más de max_puntos filas el PCA se ajusta sobre una muestra aleatoria
+    de ese tamaño. Si df_scaled ya son puntuaciones de componentes
+    principales (proporcion = su varianza explicada), se grafican PC1 y PC2
+    directamente, sin reajustar el PCA. Con más de umbral_densidad puntos se
+    dibuja la densidad de cada cluster en una rejilla (graficos_densidad) en
+    vez de un marcador por punto.
+    """
     
     from sklearn.decomposition import PCA
     
     Path(output_dir).mkdir(exist_ok=True)
+    labels = np.asarray(labels)
     
-    # Reducir a 2D con PCA
-    pca = PCA(n_components=2)
-    datos_2d = pca.fit_transform(df_scaled)
+    # Reducir a 2D con PCA (o reutilizar la proyección del clustering)
+    if proporcion is not None:
+        datos_2d = df_scaled.to_numpy()[:, :2]
+    else:
+        pca = PCA(n_components=2)
+        if len(df_scaled) > max_puntos:
+            muestra = np.sort(np.random.default_rng(42).choice(len(df_scaled), max_puntos,
+                                                               replace=False))
+            pca.fit(df_scaled.iloc[muestra])
+            datos_2d = pca.transform(df_scaled)
+        else:
+            datos_2d = pca.fit_transform(df_scaled)
+        proporcion = pca.explained_variance_ratio_
     
     # Crear gráfico
     plt.figure(figsize=(12, 8))
     
-    scatter = plt.scatter(datos_2d[:, 0], datos_2d[:, 1], 
-                         c=labels, cmap='viridis', 
-                         s=50, alpha=0.6, edgecolors='black', linewidth=0.5)
+    if len(datos_2d) > umbral_densidad:
+        clusters = np.unique(labels)
+        scatter = plt.cm.ScalarMappable(plt.Normalize(clusters.min(), clusters.max()), 'viridis')
+        dispersion_densidad(plt.gca(), datos_2d[:, 0], datos_2d[:, 1], labels, clusters,
+                            scatter.to_rgba(clusters))
+    else:
+        scatter = plt.scatter(datos_2d[:, 0], datos_2d[:, 1], 
+                             c=labels, cmap='viridis', 
+                             s=50, alpha=0.6, edgecolors='black', linewidth=0.5)
     
-    plt.xlabel(f'PC1 ({pca.explained_variance_ratio_[0]*100:.1f}% varianza)', fontsize=12)
-    plt.ylabel(f'PC2 ({pca.explained_variance_ratio_[1]*100:.1f}% varianza)', fontsize=12)
+    plt.xlabel(f'PC1 ({proporcion[0]*100:.1f}% varianza)', fontsize=12)
+    plt.ylabel(f'PC2 ({proporcion[1]*100:.1f}% varianza)', fontsize=12)
     plt.title(f'Visualización de Clusters (K={n_clusters})', fontsize=14, fontweight='bold')
-    plt.colorbar(scatter, label='Cluster')
+    plt.colorbar(scatter, ax=plt.gca(), label='Cluster')
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
     
@@ -224,8 +462,13 @@ def visualizar_clusters_2d(df_scaled, labels, n_clusters, output_dir='../grafico
     print(f"📊 Visualización de clusters guardada: {path}")
     plt.close()
 
-def interpretar_clusters(df_descripcion, stats_completas, output_dir='../resultados'):
-    """Genera interpretación narrativa de los clusters"""
+def interpretar_clusters(df_descripcion, pruebas=None, alfa=0.05, output_dir='../resultados'):
+    """
+    Genera interpretación narrativa de los clusters
+    
+    Con pruebas (de contrastar_clusters) marca las variables que difieren
+    significativamente entre clusters y lista las de mayor efecto.
+    """
     
     Path(output_dir).mkdir(exist_ok=True)
     
@@ -235,21 +478,25 @@ def interpretar_clusters(df_descripcion, stats_completas, output_dir='../resulta
     interpretacion.append("=" * 80)
     interpretacion.append("")
     
-    for idx, row in df_descripcion.iterrows():
-        cluster_name = row['Cluster']
-        n_miembros = row['N_Miembros']
-        porcentaje = row['Porcentaje']
+    for cluster_id, filas in df_descripcion.groupby('Cluster'):
+        n_miembros = filas['N'].iloc[0]
+        porcentaje = f"{filas['Porcentaje'].iloc[0]:.1f}%"
         
-        interpretacion.append(f"\n📌 {cluster_name}")
+        interpretacion.append(f"\n📌 Cluster {cluster_id}")
         interpretacion.append("-" * 80)
         interpretacion.append(f"   Tamaño: {n_miembros} personas ({porcentaje})")
         interpretacion.append("")
-        interpretacion.append("   Características distintivas:")
+        interpretacion.append("   Características distintivas (media del grupo vs. global):")
         
         # Mostrar top características
-        top_cars = row['Top_Caracteristicas']
-        for var, valor in list(top_cars.items())[:5]:
-            interpretacion.append(f"      • {var}: {valor:.3f}")
+        for _, fila in filas.iterrows():
+            marca = ""
+            if pruebas is not None:
+                q = pruebas.loc[pruebas['Variable'] == fila['Variable'], 'q_F'].iloc[0]
+                marca = " ✱" if q < alfa else ""
+            interpretacion.append(f"      • {fila['Variable']}: {fila['Media']:.3f} vs. "
+                                  f"{fila['Media_Global']:.3f} "
+                                  f"(d = {fila['Diferencia_Estandarizada']:+.2f}){marca}")
         
         interpretacion.append("")
         interpretacion.append("   💡 Perfil del grupo:")
@@ -257,6 +504,24 @@ def interpretar_clusters(df_descripcion, stats_completas, output_dir='../resulta
         interpretacion.append("      Se caracteriza por los valores mostrados arriba.")
         interpretacion.append("      [INTERPRETAR MANUALMENTE según el contexto de tus datos]")
     
+    if pruebas is not None:
+        interpretacion.append("")
+        interpretacion.append(f"   ✱ Difiere significativamente entre clusters (ANOVA, FDR {alfa:.0%})")
+        interpretacion.append("")
+        interpretacion.append("=" * 80)
+        interpretacion.append("🧪 VARIABLES QUE MÁS DIFERENCIAN A LOS GRUPOS")
+        interpretacion.append("=" * 80)
+        interpretacion.append("")
+        interpretacion.append("   η² = proporción de varianza explicada por el cluster (ANOVA);")
+        interpretacion.append("   q = p-valor ajustado por FDR (Benjamini-Hochberg)")
+        interpretacion.append("")
+        for _, fila in pruebas[pruebas['q_F'] < alfa].head(10).iterrows():
+            linea = (f"   • {fila['Variable']}: η² = {fila['Eta2']:.3f} (q = {fila['q_F']:.2g}), "
+                     f"Kruskal-Wallis q = {fila['q_H']:.2g}")
+            if pd.notna(fila['V_Cramer']):
+                linea += f", V de Cramér = {fila['V_Cramer']:.3f}"
+            interpretacion.append(linea)
+    
     interpretacion.append("")
     interpretacion.append("=" * 80)
     interpretacion.append("👥 TIPOS DE PERSONAS EN CADA GRUPO")
@@ -285,7 +550,8 @@ def interpretar_clusters(df_descripcion, stats_completas, output_dir='../resulta
     
     print(f"\n💾 Interpretación guardada: {path}")
 
-def generar_reporte_clustering(n_clusters, metricas, df_descripcion, output_dir='../resultados'):
+def generar_reporte_clustering(n_clusters, metricas, df_descripcion, pruebas=None, alfa=0.05,
+                               algoritmo='kmeans', n_componentes=None, output_dir='../resultados'):
     """Genera reporte completo del análisis de clustering"""
     
     Path(output_dir).mkdir(exist_ok=True)
@@ -299,8 +565,15 @@ def generar_reporte_clustering(n_clusters, metricas, df_descripcion, output_dir=
     # Metodología
     reporte.append("1️⃣ METODOLOGÍA")
     reporte.append("-" * 80)
-    reporte.append("   • Algoritmo: K-Means")
-    reporte.append("   • Datos: Estandarizados (media=0, sd=1)")
+    if algoritmo in METODOS:
+        reporte.append(f"   • Algoritmo: Jerárquico aglomerativo ({METODOS[algoritmo]})")
+    else:
+        reporte.append("   • Algoritmo: K-Means")
+    if n_componentes is not None:
+        reporte.append(f"   • Datos: Puntuaciones en {n_componentes} componentes principales "
+                       "de las variables estandarizadas")
+    else:
+        reporte.append("   • Datos: Estandarizados (media=0, sd=1)")
     reporte.append("   • Métrica: Distancia Euclidiana")
     reporte.append("")
     
@@ -310,7 +583,7 @@ def generar_reporte_clustering(n_clusters, metricas, df_descripcion, output_dir=
     reporte.append(f"   ✅ Clusters elegidos: {n_clusters}")
     reporte.append("")
     reporte.append("   Método del codo:")
-    reporte.append("      • Evaluamos de 2 a 10 clusters")
+    reporte.append(f"      • Evaluamos de 2 a {len(metricas['inercias']) + 1} clusters")
     reporte.append("      • Usamos 4 métricas de validación:")
     reporte.append("        - Inercia (WCSS)")
     reporte.append("        - Coeficiente de Silhouette")
@@ -334,12 +607,26 @@ def generar_reporte_clustering(n_clusters, metricas, df_descripcion, output_dir=
     # Descripción de grupos
     reporte.append("4️⃣ DESCRIPCIÓN DE GRUPOS")
     reporte.append("-" * 80)
-    for idx, row in df_descripcion.iterrows():
-        reporte.append(f"   • {row['Cluster']}: {row['N_Miembros']} miembros ({row['Porcentaje']})")
+    for _, row in df_descripcion.drop_duplicates('Cluster').iterrows():
+        reporte.append(f"   • Cluster {row['Cluster']}: {row['N']} miembros ({row['Porcentaje']:.1f}%)")
     reporte.append("")
     reporte.append("   Ver 'interpretacion_clusters.txt' para detalles completos")
     reporte.append("")
     
+    # Variables que diferencian a los grupos
+    if pruebas is not None:
+        reporte.append("5️⃣ VARIABLES QUE DIFERENCIAN A LOS GRUPOS")
+        reporte.append("-" * 80)
+        for prueba, columna in [('ANOVA F', 'q_F'), ('Kruskal-Wallis', 'q_H'),
+                                ('Chi-cuadrado', 'q_Chi2')]:
+            evaluadas = pruebas[columna].notna().sum()
+            significativas = (pruebas[columna] < alfa).sum()
+            reporte.append(f"   • {prueba}: {significativas} de {evaluadas} variables "
+                           f"significativas (FDR {alfa:.0%})")
+        reporte.append("")
+        reporte.append("   Ver 'pruebas_clusters.xlsx' (η², V de Cramér y p-valores ajustados)")
+        reporte.append("")
+    
     reporte.append("=" * 80)
     
     # Guardar e imprimir
@@ -358,30 +645,58 @@ def main():
     print("🔬 ANÁLISIS 2C: ANÁLISIS DE CLUSTERING (K-MEANS)")
     print("=" * 80)
     
+    por_bloques = PARAMETROS['modo'] == 'streaming'
+    
     # 1. Cargar y preparar datos
-    df_scaled, df_original = cargar_y_preparar_datos()
+    df_scaled, df_original, datos = cargar_y_preparar_datos(por_bloques, PARAMETROS['tamano_bloque'])
     
-    # 2. Método del codo
-    mejor_k, metricas = metodo_del_codo(df_scaled, max_clusters=10)
+    # Opcional: agrupar en el subespacio de las componentes retenidas
+    proporcion = None
+    if PARAMETROS['espacio'] == 'pca':
+        df_scaled, proporcion = proyectar_en_componentes(datos, PARAMETROS['criterio_pca'],
+                                                         por_bloques, PARAMETROS['tamano_bloque'])
     
-    # 3. Realizar clustering
-    kmeans, labels = realizar_clustering(df_scaled, mejor_k)
+    # 2. Método del codo
+    mejor_k, metricas = metodo_del_codo(df_scaled, max_clusters=PARAMETROS['max_clusters'],
+                                        tamano_muestra=PARAMETROS['muestra_silueta'],
+                                        semilla=PARAMETROS['semilla_silueta'],
+                                        por_bloques=por_bloques,
+                                        tamano_bloque=PARAMETROS['tamano_bloque'],
+                                        incremental=PARAMETROS['barrido'] == 'incremental',
+                                        algoritmo=PARAMETROS['algoritmo'],
+                                        muestra_arbol=PARAMETROS['muestra_jerarquico'])
+    
+    # 3. Realizar clustering reutilizando los centros de mejor_k (en modo
+    #    streaming, solo la pasada de asignación desde disco)
+    if por_bloques:
+        kmeans, labels = realizar_clustering_por_bloques(df_scaled.to_numpy(), mejor_k,
+                                                         PARAMETROS['tamano_bloque'],
+                                                         centros=metricas['centros'])
+    else:
+        kmeans, labels = realizar_clustering(df_scaled, mejor_k, modelo=metricas['modelo'],
+                                             centros=metricas['centros'])
     
     # 4. Describir clusters
-    df_con_clusters, df_descripcion, stats = describir_clusters(df_original, labels, mejor_k)
+    df_descripcion, perfil = describir_clusters(df_original, labels, mejor_k)
+    
+    # 5. Contrastar variables entre clusters
+    pruebas = contrastar_clusters(df_original, labels, faltantes=datos['faltantes'],
+                                  alfa=PARAMETROS['alfa_fdr'])
     
-    # 5. Visualizar clusters
-    visualizar_clusters_2d(df_scaled, labels, mejor_k)
+    # 6. Visualizar clusters
+    visualizar_clusters_2d(df_scaled, labels, mejor_k, proporcion=proporcion)
     
-    # 6. Interpretar clusters
-    interpretar_clusters(df_descripcion, stats)
+    # 7. Interpretar clusters
+    interpretar_clusters(df_descripcion, pruebas, alfa=PARAMETROS['alfa_fdr'])
     
-    # 7. Generar reporte
-    generar_reporte_clustering(mejor_k, metricas, df_descripcion)
+    # 8. Generar reporte
+    generar_reporte_clustering(mejor_k, metricas, df_descripcion, pruebas,
+                               alfa=PARAMETROS['alfa_fdr'], algoritmo=PARAMETROS['algoritmo'],
+                               n_componentes=None if proporcion is None else len(proporcion))
     
     print("\n✅ ¡Análisis de Clustering completado!")
     
-    return kmeans, labels, df_con_clusters
+    return kmeans, labels, perfil
 
 if __name__ == "__main__":
-    kmeans, labels, df_con_clusters = main()
+    kmeans, labels, perfil = main()
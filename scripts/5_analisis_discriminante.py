@@ -10,22 +10,43 @@ import seaborn as sns
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.impute import SimpleImputer
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 from pathlib import Path
 
+from cache_datos import cargar_excel
+from graficos_densidad import UMBRAL_PUNTOS, dispersion_densidad
+from libro_codigos import compactar, obtener_libro_codigos
+from preprocesamiento import a_numerico, imputar_media
+
 # Configuración de estilo
 plt.style.use('seaborn-v0_8-darkgrid')
 sns.set_palette("husl")
 
+# Entradas, parámetros y salidas de la etapa (definen su huella en main.py)
+ENTRADAS = ['../BASE_NOMBRES_Y_VALORES.xlsx', '../BASE_ETIQUETAS.xlsx']
+PARAMETROS = {'test_size': 0.3, 'random_state': 42}
+SALIDAS = [
+    '../graficos/matriz_confusion_lda.png',
+    '../graficos/espacio_discriminante.png',
+    '../resultados/coeficientes_discriminantes.xlsx',
+    '../resultados/reporte_discriminante.txt',
+]
+
 def cargar_y_preparar_datos():
-    """Carga y prepara los datos"""
+    """
+    Carga y prepara los datos
+    
+    Los valores se guardan en formato compacto (códigos int8 según el libro
+    de códigos) y se pasan a float solo al preparar los predictores
+    """
     print("📂 Cargando datos...")
     
-    df_valores = pd.read_excel('../BASE_NOMBRES_Y_VALORES.xlsx')
-    df_etiquetas = pd.read_excel('../BASE_ETIQUETAS.xlsx')
+    libro = obtener_libro_codigos('../BASE_ETIQUETAS.xlsx', '../BASE_NOMBRES_Y_VALORES.xlsx')
+    df_valores = compactar(cargar_excel('../BASE_NOMBRES_Y_VALORES.xlsx'), libro)
+    df_etiquetas = cargar_excel('../BASE_ETIQUETAS.xlsx')
     
-    print(f"✓ Valores: {df_valores.shape}")
+    print(f"✓ Valores: {df_valores.shape} "
+          f"({df_valores.memory_usage(deep=True).sum() / 1024:.0f} KB en memoria)")
     print(f"✓ Etiquetas: {df_etiquetas.shape}")
     
     return df_valores, df_etiquetas
@@ -61,8 +82,9 @@ def identificar_variable_categorica(df_valores, df_etiquetas):
         print("   Creando variable artificial basada en cuartiles de la primera variable numérica...")
         
         # Crear variable categórica artificial
-        primera_numerica = df_valores.select_dtypes(include=[np.number]).columns[0]
-        df_valores['Grupo_Artificial'] = pd.qcut(df_valores[primera_numerica].dropna(), 
+        numericas = a_numerico(df_valores)
+        primera_numerica = numericas.columns[0]
+        df_valores['Grupo_Artificial'] = pd.qcut(numericas[primera_numerica].dropna(), 
                                                    q=3, labels=['Bajo', 'Medio', 'Alto'])
         return 'Grupo_Artificial', df_valores
     
@@ -88,8 +110,14 @@ def preparar_datos_discriminante(df_valores, variable_objetivo):
     y = df_valores[variable_objetivo].copy()
     X = df_valores.drop(variable_objetivo, axis=1)
     
-    # Seleccionar solo columnas numéricas
-    X_numeric = X.select_dtypes(include=[np.number])
+    # Una variable objetivo compacta (códigos) se clasifica por sus códigos
+    if y.dtype.name == 'category':
+        y_numerica = a_numerico(y.to_frame())
+        if variable_objetivo in y_numerica.columns:
+            y = y_numerica[variable_objetivo]
+    
+    # Seleccionar solo columnas numéricas (frontera numérica: pasan a float64)
+    X_numeric = a_numerico(X)
     
     # Eliminar filas con valores faltantes en y
     mask = y.notna()
@@ -97,12 +125,8 @@ def preparar_datos_discriminante(df_valores, variable_objetivo):
     y = y[mask]
     
     # Imputar valores faltantes en X
-    imputer = SimpleImputer(strategy='mean')
-    X_imputed = pd.DataFrame(
-        imputer.fit_transform(X_numeric),
-        columns=X_numeric.columns,
-        index=X_numeric.index
-    )
+    matriz, columnas, _ = imputar_media(X_numeric)
+    X_imputed = pd.DataFrame(matriz, columns=columnas, index=X_numeric.index, copy=False)
     
     # Codificar variable objetivo si es categórica
     if y.dtype == 'object' or y.dtype.name == 'category':
@@ -126,13 +150,13 @@ def preparar_datos_discriminante(df_valores, variable_objetivo):
     
     return X_imputed, y_encoded, clases
 
-def realizar_analisis_discriminante(X, y, clases):
+def realizar_analisis_discriminante(X, y, clases, test_size=0.3, random_state=42):
     """Realiza el análisis discriminante lineal"""
     print(f"\n🔬 Realizando Análisis Discriminante Lineal (LDA)...")
     
     # Dividir en entrenamiento y prueba
     X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.3, random_state=42, stratify=y
+        X, y, test_size=test_size, random_state=random_state, stratify=y
     )
     
     print(f"✓ Datos de entrenamiento: {len(X_train)}")
@@ -184,8 +208,14 @@ def crear_matriz_confusion(y_true, y_pred, clases, output_dir='../graficos'):
     
     return cm
 
-def visualizar_discriminantes(lda, X_test, y_test, clases, output_dir='../graficos'):
-    """Visualiza las funciones discriminantes"""
+def visualizar_discriminantes(lda, X_test, y_test, clases, output_dir='../graficos',
+                              umbral_densidad=UMBRAL_PUNTOS):
+    """
+    Visualiza las funciones discriminantes
+    
+    Con más de umbral_densidad puntos el gráfico 2D muestra la densidad de
+    cada clase en una rejilla (graficos_densidad) en vez de un marcador por punto.
+    """
     
     Path(output_dir).mkdir(exist_ok=True)
     
@@ -196,15 +226,23 @@ def visualizar_discriminantes(lda, X_test, y_test, clases, output_dir='../grafic
     if X_lda.shape[1] >= 2:
         plt.figure(figsize=(10, 7))
         
-        for i, clase in enumerate(np.unique(y_test)):
-            mask = y_test == clase
-            plt.scatter(X_lda[mask, 0], X_lda[mask, 1], 
-                       label=clases[i], alpha=0.6, s=50, edgecolors='black', linewidth=0.5)
+        if len(X_lda) > umbral_densidad:
+            # Muchos puntos: densidad de cada clase en una rejilla
+            valores = np.unique(y_test)
+            parches = dispersion_densidad(plt.gca(), X_lda[:, 0], X_lda[:, 1], y_test, valores,
+                                          [f'C{i}' for i in range(len(valores))],
+                                          nombres=clases[:len(valores)])
+            plt.legend(handles=parches)
+        else:
+            for i, clase in enumerate(np.unique(y_test)):
+                mask = y_test == clase
+                plt.scatter(X_lda[mask, 0], X_lda[mask, 1], 
+                           label=clases[i], alpha=0.6, s=50, edgecolors='black', linewidth=0.5)
+            plt.legend()
         
         plt.xlabel('LD1 (Primera Función Discriminante)', fontsize=12)
         plt.ylabel('LD2 (Segunda Función Discriminante)', fontsize=12)
         plt.title('Visualización en Espacio Discriminante', fontsize=14, fontweight='bold')
-        plt.legend()
         plt.grid(True, alpha=0.3)
         plt.tight_layout()
         
@@ -370,7 +408,8 @@ def main():
     X, y, clases = preparar_datos_discriminante(df_valores, variable_obj)
     
     # 4. Realizar análisis discriminante
-    lda, X_test, y_test, y_pred, clases, accuracy = realizar_analisis_discriminante(X, y, clases)
+    lda, X_test, y_test, y_pred, clases, accuracy = realizar_analisis_discriminante(
+        X, y, clases, test_size=PARAMETROS['test_size'], random_state=PARAMETROS['random_state'])
     
     # 5. Crear matriz de confusión
     cm = crear_matriz_confusion(y_test, y_pred, clases)
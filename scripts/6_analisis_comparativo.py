@@ -12,6 +12,15 @@ from pathlib import Path
 plt.style.use('seaborn-v0_8-darkgrid')
 sns.set_palette("husl")
 
+# Entradas, parámetros y salidas de la etapa (definen su huella en main.py)
+ENTRADAS = []
+PARAMETROS = {}
+SALIDAS = [
+    '../resultados/tabla_comparativa.xlsx',
+    '../resultados/analisis_comparativo.txt',
+    '../graficos/comparacion_metodos.png',
+]
+
 def generar_analisis_comparativo(output_dir='../resultados'):
     """Genera un análisis comparativo completo de los 4 métodos"""
     
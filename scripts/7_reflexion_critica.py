@@ -5,6 +5,11 @@ Plantilla para reflexión personal sobre el proceso de análisis.
 
 from pathlib import Path
 
+# Entradas, parámetros y salidas de la etapa (definen su huella en main.py)
+ENTRADAS = []
+PARAMETROS = {}
+SALIDAS = ['../resultados/plantilla_reflexion_critica.txt']
+
 def generar_plantilla_reflexion(output_dir='../resultados'):
     """Genera plantilla para reflexión crítica"""
     
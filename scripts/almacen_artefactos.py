@@ -0,0 +1,119 @@
+"""
+Almacén de artefactos
+Permite re-ejecuciones incrementales: cada etapa se identifica con una
+huella de sus datos de entrada, sus parámetros y la versión de su código.
+Si la huella no cambió, las salidas registradas se reutilizan (y se
+restauran desde el almacén si se borraron o modificaron) en lugar de
+volver a calcularlas.
+
+Cada script de etapa declara a nivel de módulo:
+    ENTRADAS   - archivos de datos que lee
+    PARAMETROS - parámetros que usa su main()
+    SALIDAS    - archivos que genera
+"""
+
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+from cache_datos import DIRECTORIO_CACHE, calcular_hash_archivo, escribir_atomico, obtener_huella
+
+DIRECTORIO_SCRIPTS = Path(__file__).resolve().parent
+
+# Holgura al comparar mtimes con el inicio de la etapa: el núcleo fecha los
+# archivos con un reloj de baja resolución que puede ir algo por detrás
+MARGEN_RELOJ = 0.05
+
+# Módulos que no forman parte del código de las etapas
+NO_COMPARTIDOS = {'main.py', 'planificador.py', 'almacen_artefactos.py',
+                  'benchmark_escalabilidad.py', 'datos_sinteticos.py'}
+
+def _hash_codigo(archivo_etapa):
+    """Hash del script de la etapa y de los módulos auxiliares compartidos"""
+    h = hashlib.sha256()
+    compartidos = sorted(
+        p for p in DIRECTORIO_SCRIPTS.glob('*.py')
+        if not p.name[0].isdigit() and p.name not in NO_COMPARTIDOS
+    )
+    for ruta in [DIRECTORIO_SCRIPTS / archivo_etapa] + compartidos:
+        h.update(ruta.name.encode())
+        h.update(ruta.read_bytes())
+    return h.hexdigest()
+
+def calcular_huella_etapa(archivo_etapa, modulo, directorio_cache=DIRECTORIO_CACHE):
+    """Huella de una etapa: datos de entrada + parámetros + código"""
+    contenido = {
+        'entradas': {ruta: obtener_huella(ruta, directorio_cache)
+                     for ruta in getattr(modulo, 'ENTRADAS', [])},
+        'parametros': getattr(modulo, 'PARAMETROS', {}),
+        'codigo': _hash_codigo(archivo_etapa),
+    }
+    texto = json.dumps(contenido, sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+def _directorio(directorio_cache):
+    return Path(directorio_cache) / 'artefactos'
+
+def _ruta_manifiesto(archivo_etapa, directorio_cache):
+    return _directorio(directorio_cache) / 'etapas' / f'{archivo_etapa}.json'
+
+def restaurar_salidas(archivo_etapa, huella, directorio_cache=DIRECTORIO_CACHE):
+    """
+    Si la etapa ya se ejecutó con esta huella, deja sus salidas en su sitio
+    (copiándolas desde el almacén cuando falten o hayan cambiado).
+
+    Returns:
+        True si la etapa puede omitirse
+    """
+    try:
+        with open(_ruta_manifiesto(archivo_etapa, directorio_cache), encoding='utf-8') as f:
+            manifiesto = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if manifiesto.get('huella') != huella:
+        return False
+
+    objetos = _directorio(directorio_cache) / 'objetos'
+    for ruta, hash_salida in manifiesto['salidas'].items():
+        if not (objetos / hash_salida).exists():
+            return False
+
+    for ruta, hash_salida in manifiesto['salidas'].items():
+        ruta = Path(ruta)
+        if ruta.exists() and calcular_hash_archivo(ruta) == hash_salida:
+            continue
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        escribir_atomico(ruta, lambda tmp: shutil.copyfile(objetos / hash_salida, tmp))
+
+    return True
+
+def registrar_salidas(archivo_etapa, huella, salidas, inicio, directorio_cache=DIRECTORIO_CACHE):
+    """
+    Guarda las salidas de una ejecución correcta en el almacén
+
+    Args:
+        inicio: Instante (time.time()) en que empezó la ejecución; solo se
+            registran las salidas escritas desde entonces, de modo que los
+            restos de ejecuciones anteriores (p. ej. salidas opcionales que
+            ya no se generan) no entran en el manifiesto
+    """
+    objetos = _directorio(directorio_cache) / 'objetos'
+    objetos.mkdir(parents=True, exist_ok=True)
+
+    registradas = {}
+    for ruta in salidas:
+        if not Path(ruta).exists() or Path(ruta).stat().st_mtime < inicio - MARGEN_RELOJ:
+            continue
+        hash_salida = calcular_hash_archivo(ruta)
+        destino = objetos / hash_salida
+        if not destino.exists():
+            escribir_atomico(destino, lambda tmp: shutil.copyfile(ruta, tmp))
+        registradas[ruta] = hash_salida
+
+    ruta_manifiesto = _ruta_manifiesto(archivo_etapa, directorio_cache)
+    ruta_manifiesto.parent.mkdir(parents=True, exist_ok=True)
+    manifiesto = {'huella': huella, 'salidas': registradas}
+    escribir_atomico(ruta_manifiesto, lambda tmp: Path(tmp).write_text(
+        json.dumps(manifiesto, indent=2), encoding='utf-8'))
@@ -0,0 +1,215 @@
+"""
+Benchmark de escalabilidad
+Mide las funciones centrales de cada etapa sobre encuestas sintéticas de
+estructura conocida (datos_sinteticos.py) para una rejilla de tamaños n × p
+e informa tiempo, filas por segundo y pico de memoria. Como los factores,
+los clusters y la clase están plantados, comprueba además que se recuperan:
+una optimización que cambie los resultados aparece como comprobación fallida.
+
+Uso:
+    python benchmark_escalabilidad.py
+    python benchmark_escalabilidad.py --n 1000 10000 100000 --p 10 100 --etapas pca afe
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from sklearn.metrics import adjusted_rand_score
+
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import perfilado
+from datos_sinteticos import generar_encuesta
+from motor_correlacion import calcular_estructura
+from planificador import cargar_modulo
+from preprocesamiento import calcular_escala, como_dataframe, imputar_media
+
+ETAPAS_BENCHMARK = ['pca', 'afe', 'clustering', 'discriminante']
+
+# Umbrales de recuperación de la estructura plantada
+UMBRALES = {
+    'subespacio_pca': 0.90,     # fracción del subespacio de cargas capturada por las k primeras CP
+    'congruencia_afe': 0.90,    # congruencia de Tucker mínima entre cargas estimadas y verdaderas
+    'ari_clusters': 0.70,       # Adjusted Rand Index de K-means con los clusters plantados
+    'exactitud_lda': 0.80,      # exactitud en prueba del LDA sobre la clase plantada
+}
+
+def _medir(nombre, funcion, *args, **kwargs):
+    """Ejecuta la función en silencio y devuelve (resultado, evento de perfilado)"""
+    perfilado.extraer_eventos()
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultado = perfilado.tramo(nombre, funcion, *args, **kwargs)
+    eventos = [e for e in perfilado.extraer_eventos() if e['nombre'] == nombre]
+    return resultado, eventos[-1]
+
+def fraccion_subespacio(componentes, cargas):
+    """Fracción (0-1) del subespacio de las cargas verdaderas contenido en las componentes"""
+    Q, _ = np.linalg.qr(cargas)
+    V, _ = np.linalg.qr(componentes.T)
+    return float(np.linalg.norm(V.T @ Q) ** 2 / Q.shape[1])
+
+def congruencia_tucker(cargas_estimadas, cargas):
+    """
+    Congruencia de Tucker de cada factor verdadero con el factor estimado
+    emparejado (asignación húngara sobre la congruencia absoluta)
+    """
+    A = cargas_estimadas / np.linalg.norm(cargas_estimadas, axis=0)
+    B = cargas / np.linalg.norm(cargas, axis=0)
+    congruencia = np.abs(A.T @ B)
+    filas, cols = linear_sum_assignment(-congruencia)
+    return congruencia[filas, cols]
+
+def medir_tamano(n, p, etapas, modulos, semilla=42):
+    """Genera una encuesta n × p y mide las etapas indicadas"""
+    encuesta = generar_encuesta(n, p, semilla=semilla)
+    verdad = encuesta['estructura']
+    k = verdad['n_factores']
+
+    X, columnas, _ = imputar_media(pd.DataFrame(encuesta['X'], columns=encuesta['columnas']))
+    medias, escalas = calcular_escala(X)
+    Z = (X - medias) / escalas
+    df_imputed = como_dataframe(X, columnas)
+    df_scaled = como_dataframe(Z, columnas)
+
+    filas = []
+
+    def registrar(etapa, evento, comprobacion, valor, umbral, detalle=''):
+        filas.append({
+            'n': n, 'p': p, 'etapa': etapa, 'funcion': evento['nombre'],
+            'tiempo_s': evento['duracion_s'], 'cpu_s': evento['cpu_s'],
+            'filas_por_s': n / evento['duracion_s'] if evento['duracion_s'] > 0 else np.inf,
+            'pico_memoria_mb': evento['pico_memoria_mb'], 'rss_maximo_mb': evento['rss_maximo_mb'],
+            'comprobacion': comprobacion, 'valor': valor, 'umbral': umbral,
+            'ok': None if umbral is None else bool(valor >= umbral), 'detalle': detalle,
+        })
+
+    if 'pca' in etapas:
+        (pca, _, _), evento = _medir('realizar_pca', modulos['pca'].realizar_pca, df_imputed,
+                                     datos_estandarizados=Z, metodo='auto')
+        valor = fraccion_subespacio(pca.components_[:k], verdad['cargas'])
+        kaiser = int(np.sum(pca.explained_variance_ > 1))
+        registrar('pca', evento, 'subespacio_pca', valor, UMBRALES['subespacio_pca'],
+                  f'Kaiser={kaiser} (plantados {k})')
+
+    if 'afe' in etapas:
+        estructura, evento = _medir('calcular_estructura', calcular_estructura, Z)
+        registrar('afe', evento, 'estructura_correlacion', np.nan, None)
+
+        (n_retenidos, _), evento = _medir('determinar_numero_factores',
+                                          modulos['afe'].determinar_numero_factores, estructura)
+        registrar('afe', evento, 'factores_paralelo', n_retenidos, None, f'plantados {k}')
+
+        (_, df_loadings, _), evento = _medir('realizar_afe', modulos['afe'].realizar_afe,
+                                             df_imputed, k, estructura=estructura)
+        congruencia = congruencia_tucker(df_loadings[modulos['afe'].factores_de(df_loadings)].to_numpy(),
+                                         verdad['cargas'])
+        registrar('afe', evento, 'congruencia_afe', float(congruencia.min()),
+                  UMBRALES['congruencia_afe'])
+
+    if 'clustering' in etapas:
+        (mejor_k, _), evento = _medir('metodo_del_codo', modulos['clustering'].metodo_del_codo,
+                                      df_scaled, max_clusters=10, output_dir='../graficos')
+        registrar('clustering', evento, 'k_elegido', mejor_k, None,
+                  f"plantados {verdad['n_clusters']}")
+
+        (_, labels), evento = _medir('realizar_clustering', modulos['clustering'].realizar_clustering,
+                                     df_scaled, verdad['n_clusters'])
+        registrar('clustering', evento, 'ari_clusters',
+                  adjusted_rand_score(encuesta['clusters'], labels), UMBRALES['ari_clusters'])
+
+        (_, labels), evento = _medir('realizar_clustering_por_bloques',
+                                     modulos['clustering'].realizar_clustering_por_bloques,
+                                     Z, verdad['n_clusters'])
+        registrar('clustering', evento, 'ari_clusters',
+                  adjusted_rand_score(encuesta['clusters'], labels), UMBRALES['ari_clusters'],
+                  'minilotes')
+
+    if 'discriminante' in etapas:
+        clases = np.unique(encuesta['clase'])
+        resultado, evento = _medir('realizar_analisis_discriminante',
+                                   modulos['discriminante'].realizar_analisis_discriminante,
+                                   df_imputed, encuesta['clase'], clases)
+        registrar('discriminante', evento, 'exactitud_lda', resultado[-1], UMBRALES['exactitud_lda'])
+
+    return filas
+
+def parsear_argumentos():
+    """Lee las opciones de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Benchmark de escalabilidad con datos sintéticos")
+    parser.add_argument('--n', type=int, nargs='+', default=[1_000, 10_000],
+                        help="Tamaños de muestra (filas)")
+    parser.add_argument('--p', type=int, nargs='+', default=[10, 50, 200],
+                        help="Número de variables")
+    parser.add_argument('--etapas', nargs='+', choices=ETAPAS_BENCHMARK, default=ETAPAS_BENCHMARK,
+                        help="Etapas a medir")
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--salida', default='../resultados/benchmark_escalabilidad.xlsx')
+    return parser.parse_args()
+
+def main():
+    """Función principal"""
+    args = parsear_argumentos()
+    salida = Path(args.salida).resolve()
+
+    print("=" * 80)
+    print("⏱️  BENCHMARK DE ESCALABILIDAD (DATOS SINTÉTICOS)")
+    print("=" * 80)
+
+    modulos = {
+        'pca': cargar_modulo('2_analisis_pca.py'),
+        'afe': cargar_modulo('3_analisis_afe.py'),
+        'clustering': cargar_modulo('4_analisis_clustering.py'),
+        'discriminante': cargar_modulo('5_analisis_discriminante.py'),
+    }
+    perfilado.activar()
+
+    filas = []
+    directorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as temporal:
+        # Los gráficos de las etapas ('../graficos') van a la carpeta temporal
+        trabajo = Path(temporal) / 'trabajo'
+        trabajo.mkdir()
+        os.chdir(trabajo)
+        try:
+            for n in args.n:
+                for p in args.p:
+                    print(f"\n📐 n={n:,}  p={p}")
+                    inicio = time.perf_counter()
+                    resultado = medir_tamano(n, p, args.etapas, modulos, semilla=args.semilla)
+                    for r in resultado:
+                        estado = '' if r['ok'] is None else ('✅' if r['ok'] else '❌')
+                        print(f"   {r['funcion']:<34} {r['tiempo_s']:>9.2f} s "
+                              f"{r['filas_por_s']:>12,.0f} filas/s "
+                              f"{r['pico_memoria_mb']:>9.1f} MB   "
+                              f"{r['comprobacion']}={r['valor']:.3f} {estado} {r['detalle']}")
+                    print(f"   (total {time.perf_counter() - inicio:.1f} s)")
+                    filas.extend(resultado)
+        finally:
+            os.chdir(directorio_original)
+
+    df = pd.DataFrame(filas)
+    salida.parent.mkdir(exist_ok=True)
+    df.to_excel(salida, index=False)
+    print(f"\n💾 Resultados guardados: {salida}")
+
+    fallidas = df[df['ok'] == False]
+    if len(fallidas) > 0:
+        print(f"\n❌ {len(fallidas)} comprobaciones de estructura fallidas:")
+        print(fallidas[['n', 'p', 'comprobacion', 'valor', 'umbral']].to_string(index=False))
+        return 1
+
+    print("\n✅ Estructura plantada recuperada en todos los tamaños")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Caché de datos de entrada
+Convierte cada libro Excel una única vez a un formato columnar binario
+(Parquet si pyarrow está disponible, pickle de pandas en caso contrario)
+y lo reutiliza mientras el archivo original no cambie.
+
+La validez de la caché se decide con un manifiesto por archivo que guarda
+mtime, tamaño y hash SHA-256 del contenido: si mtime y tamaño coinciden se
+carga directamente; si cambiaron se recalcula el hash y solo se vuelve a
+parsear el Excel cuando el contenido es realmente distinto.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from perfilado import perfilar
+
+DIRECTORIO_CACHE = '../cache'
+
+# Celdas de error de Excel: pd.read_excel las convierte en NaN
+ERRORES_EXCEL = {'#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A'}
+
+def calcular_hash_archivo(ruta, tamano_bloque=1 << 20):
+    """Calcula el hash SHA-256 del contenido de un archivo leyendo por bloques"""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+def escribir_atomico(ruta, escribir):
+    """Escribe un archivo vía un temporal + os.replace (seguro entre procesos)"""
+    ruta = Path(ruta)
+    tmp = ruta.with_name(f'.{ruta.name}.{os.getpid()}.tmp')
+    try:
+        escribir(tmp)
+        os.replace(tmp, ruta)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+def _leer_manifiesto(ruta_manifiesto):
+    try:
+        with open(ruta_manifiesto, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _guardar_cache(df, base):
+    """Guarda el DataFrame en Parquet o, si no es posible, en pickle"""
+    try:
+        ruta = base.with_suffix('.parquet')
+        escribir_atomico(ruta, lambda tmp: df.to_parquet(tmp, index=False))
+        return ruta, 'parquet'
+    except Exception:
+        # pyarrow no instalado o columnas con tipos mixtos no representables
+        ruta = base.with_suffix('.pkl')
+        escribir_atomico(ruta, lambda tmp: df.to_pickle(tmp))
+        return ruta, 'pickle'
+
+def _leer_cache(ruta, formato):
+    if formato == 'parquet':
+        return pd.read_parquet(ruta)
+    return pd.read_pickle(ruta)
+
+def obtener_huella(ruta, directorio_cache=DIRECTORIO_CACHE):
+    """
+    Devuelve el hash de contenido de un archivo de entrada.
+    Reutiliza el del manifiesto si mtime y tamaño no cambiaron.
+    """
+    ruta = Path(ruta)
+    stat = ruta.stat()
+    manifiesto = _leer_manifiesto(Path(directorio_cache) / 'datos' / f'{ruta.name}.json')
+    if (manifiesto and manifiesto['origen'] == str(ruta.resolve())
+            and manifiesto['mtime_ns'] == stat.st_mtime_ns
+            and manifiesto['tamano'] == stat.st_size):
+        return manifiesto['hash']
+    return calcular_hash_archivo(ruta)
+
+@perfilar(categoria='datos')
+def cargar_excel(ruta, directorio_cache=DIRECTORIO_CACHE):
+    """
+    Carga un libro Excel usando la caché columnar
+
+    Args:
+        ruta: Ruta del archivo .xlsx
+        directorio_cache: Carpeta donde se guardan caché y manifiestos
+    """
+    ruta = Path(ruta)
+    dir_datos = Path(directorio_cache) / 'datos'
+    dir_datos.mkdir(parents=True, exist_ok=True)
+    ruta_manifiesto = dir_datos / f'{ruta.name}.json'
+
+    stat = ruta.stat()
+    manifiesto = _leer_manifiesto(ruta_manifiesto)
+
+    if manifiesto and manifiesto['origen'] != str(ruta.resolve()):
+        manifiesto = None
+
+    if manifiesto and Path(manifiesto['archivo']).exists():
+        # Camino rápido: el archivo no se tocó
+        if (manifiesto['mtime_ns'] == stat.st_mtime_ns
+                and manifiesto['tamano'] == stat.st_size):
+            return _leer_cache(manifiesto['archivo'], manifiesto['formato'])
+
+        # Se tocó pero el contenido puede ser el mismo
+        huella = calcular_hash_archivo(ruta)
+        if huella == manifiesto['hash']:
+            manifiesto.update(mtime_ns=stat.st_mtime_ns, tamano=stat.st_size)
+            escribir_atomico(ruta_manifiesto, lambda tmp: Path(tmp).write_text(
+                json.dumps(manifiesto, indent=2), encoding='utf-8'))
+            return _leer_cache(manifiesto['archivo'], manifiesto['formato'])
+    else:
+        huella = calcular_hash_archivo(ruta)
+
+    # Caché inexistente u obsoleta: parsear el Excel y regenerarla
+    df = pd.read_excel(ruta)
+    ruta_cache, formato = _guardar_cache(df, dir_datos.resolve() / f'{ruta.stem}-{huella[:16]}')
+
+    if manifiesto and manifiesto['archivo'] != str(ruta_cache):
+        Path(manifiesto['archivo']).unlink(missing_ok=True)
+
+    nuevo = {
+        'origen': str(ruta.resolve()),
+        'mtime_ns': stat.st_mtime_ns,
+        'tamano': stat.st_size,
+        'hash': huella,
+        'formato': formato,
+        'archivo': str(ruta_cache),
+    }
+    escribir_atomico(ruta_manifiesto, lambda tmp: Path(tmp).write_text(
+        json.dumps(nuevo, indent=2), encoding='utf-8'))
+
+    return df
+
+def leer_por_bloques(ruta, tamano_bloque=50_000):
+    """
+    Lee un archivo de datos por bloques de filas sin cargarlo entero
+
+    Admite .xlsx (primera hoja, modo read_only de openpyxl), .csv y
+    .parquet (requiere pyarrow). Cada bloque es un DataFrame con los
+    encabezados de la primera fila; en .xlsx las celdas de error se leen
+    como faltantes, igual que con pd.read_excel.
+    """
+    ruta = Path(ruta)
+
+    if ruta.suffix == '.csv':
+        yield from pd.read_csv(ruta, chunksize=tamano_bloque)
+        return
+
+    if ruta.suffix == '.parquet':
+        import pyarrow.parquet as pq
+        for lote in pq.ParquetFile(ruta).iter_batches(batch_size=tamano_bloque):
+            yield lote.to_pandas()
+        return
+
+    from openpyxl import load_workbook
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        encabezado = next(filas)
+        buffer = []
+        for fila in filas:
+            if all(valor is None for valor in fila):
+                continue
+            buffer.append([None if isinstance(valor, str) and valor in ERRORES_EXCEL else valor
+                           for valor in fila])
+            if len(buffer) == tamano_bloque:
+                yield pd.DataFrame.from_records(buffer, columns=encabezado)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame.from_records(buffer, columns=encabezado)
+    finally:
+        libro.close()
@@ -0,0 +1,329 @@
+"""
+Contrastes de variables entre grupos
+ANOVA F (con η²), Kruskal-Wallis y chi-cuadrado (con V de Cramér) de todas
+las variables frente a unas etiquetas de grupo, con corrección FDR de
+Benjamini-Hochberg, calculados en lote para todas las variables a la vez.
+
+Las variables discretas (códigos de encuesta) se resumen en tablas grupo ×
+valor construidas con un único bincount por bloque de filas (los códigos
+enteros se calculan por aritmética, sin búsquedas); de esas tablas salen
+los tres contrastes (Kruskal-Wallis con rangos medios y corrección por
+empates). Las continuas usan momentos por grupo para el ANOVA y rangos
+(por bloques de columnas) para Kruskal-Wallis, y no tienen chi-cuadrado.
+
+Los faltantes se excluyen variable a variable: con la máscara de faltantes
+de la matriz preprocesada, los valores imputados vuelven a ser NaN y no
+cuentan como categorías (ni como datos en los demás contrastes).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.stats import chi2, f as distribucion_f
+
+def benjamini_hochberg(p_valores):
+    """p-valores ajustados por FDR (Benjamini-Hochberg); los NaN se ignoran"""
+    p_valores = np.asarray(p_valores, dtype=np.float64)
+    q = np.full_like(p_valores, np.nan)
+    validos = np.flatnonzero(~np.isnan(p_valores))
+    if len(validos) == 0:
+        return q
+    orden = validos[np.argsort(p_valores[validos], kind='stable')]
+    ajustados = p_valores[orden] * len(validos) / np.arange(1, len(validos) + 1)
+    q[orden] = np.minimum(np.minimum.accumulate(ajustados[::-1])[::-1], 1.0)
+    return q
+
+def _indicadora(grupos, k):
+    """Matriz dispersa k×n con un 1 en (grupo, fila)"""
+    return sparse.csr_matrix((np.ones(len(grupos)), (grupos, np.arange(len(grupos)))),
+                             shape=(k, len(grupos)))
+
+# Celdas (filas × columnas) por bloque al ordenar las variables continuas
+CELDAS_RANGOS = 1 << 22
+
+def _con_faltantes(valores, faltantes):
+    """Copia float64 de valores con NaN donde faltantes (None = sin máscara)"""
+    valores = np.array(valores, dtype=np.float64)
+    if faltantes is not None:
+        valores[np.asarray(faltantes)] = np.nan
+    return valores
+
+def _selector(columnas):
+    """Índice de columnas: un slice si son contiguas (lectura más rápida), si no el array"""
+    if columnas is None:
+        return slice(None)
+    columnas = np.asarray(columnas)
+    if len(columnas) > 0 and np.array_equal(columnas, np.arange(columnas[0], columnas[-1] + 1)):
+        return slice(int(columnas[0]), int(columnas[-1]) + 1)
+    return columnas
+
+def _recorrer(X, tamano_bloque, faltantes=None, columnas=None):
+    """
+    Recorre X por bloques de filas (solo las columnas indicadas)
+
+    Yields:
+        (inicio, bloque float64 propio, máscara de faltantes o None si no hay)
+    """
+    selector = _selector(columnas)
+    for inicio in range(0, len(X), tamano_bloque):
+        fin = inicio + tamano_bloque
+        bloque = np.array(X[inicio:fin, selector], dtype=np.float64)
+        faltan = np.isnan(bloque)
+        if faltantes is not None:
+            faltan |= faltantes[inicio:fin, selector]
+        yield inicio, bloque, faltan if faltan.any() else None
+
+def _valores_discretos(X, max_categorias, faltantes=None, tamano_muestra=10_000, semilla=42,
+                       max_rango=1000):
+    """
+    Columnas discretas y sus valores posibles, estimados en una muestra
+    (los NaN no cuentan como valor)
+
+    Los valores enteros se codifican como un rango [minimo, minimo + R) y
+    los no enteros como una lista aparte.
+
+    Returns:
+        (máscara de columnas discretas, minimo, R, valores no enteros ordenados)
+    """
+    n = len(X)
+    filas = np.arange(n) if n <= tamano_muestra else np.sort(
+        np.random.default_rng(semilla).choice(n, tamano_muestra, replace=False))
+    muestra = np.sort(_con_faltantes(X[filas], None if faltantes is None else faltantes[filas]),
+                      axis=0)
+    # Valores distintos no faltantes (los NaN quedan al final de cada columna)
+    nuevos = np.ones(muestra.shape, dtype=bool)
+    nuevos[1:] = muestra[1:] != muestra[:-1]
+    distintos = (nuevos & ~np.isnan(muestra)).sum(axis=0)
+    discretas = distintos <= max_categorias
+
+    def valores_de(columnas):
+        valores = np.unique(muestra[:, columnas])
+        return valores[~np.isnan(valores)]
+
+    valores = valores_de(discretas)
+    enteros = valores[valores == np.round(valores)]
+    if len(enteros) > 0 and enteros[-1] - enteros[0] >= max_rango:
+        # Códigos enteros muy dispersos: esas columnas se tratan como continuas
+        disperso = (np.fmax.reduce(muestra, axis=0) - np.fmin.reduce(muestra, axis=0)) >= max_rango
+        discretas &= ~disperso
+        valores = valores_de(discretas)
+        enteros = valores[valores == np.round(valores)]
+    minimo = int(enteros[0]) if len(enteros) > 0 else 0
+    rango = int(enteros[-1]) - minimo + 1 if len(enteros) > 0 else 0
+    return discretas, minimo, rango, valores[valores != np.round(valores)]
+
+def _codificar(bloque, minimo, rango, no_enteros):
+    """
+    Código de cada valor de un bloque de columnas discretas
+
+    Returns:
+        (códigos int32, columnas con valores fuera de los posibles)
+    """
+    codigos = bloque.astype(np.int32)
+    enteros = codigos == bloque
+    todos_enteros = enteros.all()
+    if not todos_enteros:
+        filas, cols = np.nonzero(~enteros)
+        codigos[filas, cols] = minimo
+    codigos -= minimo
+    fuera = (codigos.min(axis=0) < 0) | (codigos.max(axis=0) >= rango)
+
+    if not todos_enteros:
+        valores = bloque[filas, cols]
+        if len(no_enteros) > 0:
+            posicion = np.minimum(np.searchsorted(no_enteros, valores), len(no_enteros) - 1)
+            fuera[np.unique(cols[no_enteros[posicion] != valores])] = True
+        else:
+            posicion = np.zeros(len(filas), dtype=np.int64)
+            fuera[np.unique(cols)] = True
+        codigos[filas, cols] = rango + posicion
+
+    if fuera.any():
+        np.clip(codigos, 0, rango + max(len(no_enteros), 1) - 1, out=codigos)
+    return codigos, fuera
+
+def _momentos(X, labels, k, columnas, tamano_bloque, faltantes=None):
+    """Conteos, sumas y sumas de cuadrados por grupo (k×p) de las columnas indicadas, sin NaN"""
+    conteos = np.zeros((k, len(columnas)))
+    sumas = np.zeros((k, len(columnas)))
+    cuadrados = np.zeros((k, len(columnas)))
+    for inicio, bloque, faltan in _recorrer(X, tamano_bloque, faltantes, columnas):
+        indicadora = _indicadora(labels[inicio:inicio + len(bloque)], k)
+        if faltan is None:
+            conteos += indicadora @ np.ones((len(bloque), 1))
+        else:
+            np.copyto(bloque, 0.0, where=faltan)
+            conteos += indicadora @ (~faltan).astype(np.float64)
+        sumas += indicadora @ bloque
+        cuadrados += indicadora @ (bloque * bloque)
+    return conteos, sumas, cuadrados
+
+def _anova(n_g, sumas, cuadrados):
+    """ANOVA de un factor desde los tamaños y momentos por grupo (k×p)"""
+    presentes = n_g > 0
+    n, k = n_g.sum(axis=0), presentes.sum(axis=0)
+    media = sumas.sum(axis=0) / n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        entre = np.where(presentes, sumas ** 2 / n_g, 0.0).sum(axis=0) - n * media ** 2
+        total = cuadrados.sum(axis=0) - n * media ** 2
+        dentro = total - entre
+        F = (entre / (k - 1)) / (dentro / (n - k))
+        eta2 = entre / total
+    return F, distribucion_f.sf(F, k - 1, n - k), eta2
+
+def _kruskal_continuas(X, labels, k, columnas, faltantes=None):
+    """
+    Kruskal-Wallis (H, p) de columnas continuas por bloques de columnas (a lo
+    sumo CELDAS_RANGOS celdas a la vez)
+
+    Cada columna se ordena una vez: de las rachas de valores iguales salen
+    los rangos medios, la corrección por empates y, con las etiquetas en ese
+    orden, las sumas de rangos por grupo (un bincount). Los NaN se ordenan
+    al final y no cuentan.
+    """
+    n = len(X)
+    H, p_H = np.full(len(columnas), np.nan), np.full(len(columnas), np.nan)
+    ancho = max(1, CELDAS_RANGOS // n)
+    for inicio in range(0, len(columnas), ancho):
+        cols = columnas[inicio:inicio + ancho]
+        b = len(cols)
+        valores = _con_faltantes(X[:, cols], None if faltantes is None else faltantes[:, cols]).T
+        np.copyto(valores, np.inf, where=np.isnan(valores))
+        orden = np.argsort(valores, axis=1)
+        ordenados = np.take_along_axis(valores, orden, axis=1).ravel()
+
+        # Rachas de valores iguales en cada columna ordenada
+        inicio_racha = np.ones(len(ordenados), dtype=bool)
+        inicio_racha[1:] = ordenados[1:] != ordenados[:-1]
+        inicio_racha[::n] = True
+        inicios = np.flatnonzero(inicio_racha)
+        t = np.diff(np.append(inicios, len(ordenados))).astype(np.float64)
+        validas = np.isfinite(ordenados[inicios])
+        rangos = np.repeat(np.where(validas, inicios % n + (t + 1) / 2, 0.0), t.astype(np.int64))
+        presentes = np.repeat(validas, t.astype(np.int64)).astype(np.float64)
+
+        claves = (labels[orden] + k * np.arange(b)[:, None]).ravel()
+        sumas_rangos = np.bincount(claves, weights=rangos, minlength=b * k).reshape(b, k)
+        n_g = np.bincount(claves, weights=presentes, minlength=b * k).reshape(b, k)
+        n_j = n_g.sum(axis=1)
+        empates = np.bincount(inicios // n, weights=np.where(validas, t ** 3 - t, 0.0), minlength=b)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correccion = 1 - empates / (n_j ** 3 - n_j)
+            Hc = (12 / (n_j * (n_j + 1)) * np.where(n_g > 0, sumas_rangos ** 2 / n_g, 0.0).sum(axis=1)
+                  - 3 * (n_j + 1)) / correccion
+        H[inicio:inicio + b] = Hc
+        p_H[inicio:inicio + b] = chi2.sf(Hc, (n_g > 0).sum(axis=1) - 1)
+    return H, p_H
+
+def _desde_tablas(tablas):
+    """
+    Kruskal-Wallis y chi-cuadrado desde tablas grupo × valor (p×k×C)
+
+    Returns:
+        (H, p_H, chi2, gl, p_chi2, V de Cramér)
+    """
+    n_g = tablas.sum(axis=2)                      # p×k
+    totales = tablas.sum(axis=1)                  # p×C
+    n = totales.sum(axis=1)                       # p
+    k_efectivo = (n_g > 0).sum(axis=1)
+    c_efectivo = (totales > 0).sum(axis=1)
+
+    # Rango medio de cada valor: acumulado anterior + (empates + 1) / 2
+    rangos = np.cumsum(totales, axis=1) - totales + (totales + 1) / 2
+    sumas_rangos = np.einsum('pkc,pc->pk', tablas, rangos)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        H = 12 / (n * (n + 1)) * np.nansum(sumas_rangos ** 2 / n_g, axis=1) - 3 * (n + 1)
+        H /= 1 - (totales ** 3 - totales).sum(axis=1) / (n ** 3 - n)
+    p_H = chi2.sf(H, k_efectivo - 1)
+
+    esperados = n_g[:, :, None] * totales[:, None, :] / n[:, None, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        celdas = np.where(esperados > 0, (tablas - esperados) ** 2 / esperados, 0.0)
+    gl = (k_efectivo - 1) * (c_efectivo - 1)
+    estadistico = np.where(gl > 0, celdas.sum(axis=(1, 2)), np.nan)
+    p_chi2 = np.where(gl > 0, chi2.sf(estadistico, np.maximum(gl, 1)), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        V = np.sqrt(estadistico / (n * np.minimum(k_efectivo - 1, c_efectivo - 1)))
+    return H, p_H, estadistico, gl, p_chi2, V
+
+def contrastar_variables(X, labels, columnas, faltantes=None, max_categorias=20,
+                         tamano_bloque=50_000):
+    """
+    Contrasta cada variable contra las etiquetas de grupo
+
+    Una variable es discreta si tiene como mucho max_categorias valores
+    distintos; solo las discretas tienen chi-cuadrado (sin corrección de
+    Yates). Los p-valores de cada contraste se ajustan por FDR sobre el
+    conjunto de variables (columnas q_*). Los NaN de X (o las celdas
+    marcadas en faltantes) se excluyen de los contrastes de su variable.
+
+    Args:
+        X: Matriz n×p (puede ser un memmap; p. ej. la imputada)
+        labels: Etiquetas enteras 0..k-1
+        columnas: Nombres de las p variables
+        faltantes: Máscara bool n×p de valores imputados (None = ninguno)
+
+    Returns:
+        DataFrame con una fila por variable: Tipo, F, p_F, q_F, Eta2, H,
+        p_H, q_H, Chi2, gl_Chi2, p_Chi2, q_Chi2 y V_Cramer
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    k = int(labels.max()) + 1
+    n, p = X.shape
+
+    discretas, minimo, rango, no_enteros = _valores_discretos(X, max_categorias, faltantes)
+    indices_d = np.flatnonzero(discretas)
+    C = rango + len(no_enteros)
+    # Valor de cada código (para ordenar las tablas por valor)
+    valores = np.concatenate([np.arange(minimo, minimo + rango, dtype=np.float64), no_enteros])
+
+    # Tablas grupo × valor de todas las columnas discretas: un bincount por
+    # bloque; los NaN van a una celda extra que se descarta
+    tablas = np.zeros(len(indices_d) * k * C)
+    fuera = np.zeros(len(indices_d), dtype=bool)
+    if len(indices_d) > 0 and C > 0:
+        base = np.arange(len(indices_d), dtype=np.int32) * (k * C)
+        relleno = minimo if rango > 0 else no_enteros[0]
+        for inicio, bloque, faltan in _recorrer(X, tamano_bloque, faltantes, indices_d):
+            if faltan is not None:
+                np.copyto(bloque, relleno, where=faltan)
+            codigos, fuera_bloque = _codificar(bloque, minimo, rango, no_enteros)
+            fuera |= fuera_bloque
+            grupos = labels[inicio:inicio + len(bloque)].astype(np.int32)
+            codigos += base
+            codigos += (grupos * C)[:, None]
+            if faltan is not None:
+                np.copyto(codigos, len(tablas), where=faltan)
+            tablas += np.bincount(codigos.ravel(), minlength=len(tablas) + 1)[:len(tablas)]
+
+    # Las columnas con valores no vistos en la muestra pasan a continuas
+    validas = indices_d[~fuera]
+    discretas[indices_d[fuera]] = False
+    orden = np.argsort(valores, kind='stable')
+    tablas = tablas.reshape(len(indices_d), k, C)[~fuera][:, :, orden]
+    valores = valores[orden]
+
+    F, p_F, eta2 = (np.full(p, np.nan) for _ in range(3))
+    H, p_H, estadistico, gl, p_chi2, V = (np.full(p, np.nan) for _ in range(6))
+
+    if len(validas) > 0:
+        sumas = np.einsum('jkc,c->kj', tablas, valores)
+        cuadrados = np.einsum('jkc,c->kj', tablas, valores ** 2)
+        F[validas], p_F[validas], eta2[validas] = _anova(tablas.sum(axis=2).T, sumas, cuadrados)
+        for arreglo, valor in zip((H, p_H, estadistico, gl, p_chi2, V), _desde_tablas(tablas)):
+            arreglo[validas] = valor
+
+    continuas = np.flatnonzero(~discretas)
+    if len(continuas) > 0:
+        conteos, sumas, cuadrados = _momentos(X, labels, k, continuas, tamano_bloque, faltantes)
+        F[continuas], p_F[continuas], eta2[continuas] = _anova(conteos, sumas, cuadrados)
+        H[continuas], p_H[continuas] = _kruskal_continuas(X, labels, k, continuas, faltantes)
+
+    return pd.DataFrame({
+        'Variable': list(columnas),
+        'Tipo': np.where(discretas, 'discreta', 'continua'),
+        'F': F, 'p_F': p_F, 'q_F': benjamini_hochberg(p_F), 'Eta2': eta2,
+        'H': H, 'p_H': p_H, 'q_H': benjamini_hochberg(p_H),
+        'Chi2': estadistico, 'gl_Chi2': gl, 'p_Chi2': p_chi2, 'q_Chi2': benjamini_hochberg(p_chi2),
+        'V_Cramer': V,
+    })
@@ -0,0 +1,138 @@
+"""
+Datos sintéticos de encuesta
+Genera matrices tipo encuesta (respuestas Likert 1..niveles) con estructura
+conocida, para medir y validar los análisis a cualquier escala:
+
+    - factores latentes: cada variable carga en un único factor
+      (estructura simple, cargas ±carga)
+    - clusters: cada grupo desplaza la media de un factor distinto
+    - clase: variable binaria (o multiclase) que depende del primer factor
+      (incluido el desplazamiento de su cluster)
+
+Los datos se generan por bloques con semillas independientes, así que el
+resultado es reproducible y puede escribirse directamente a un .npy en
+disco para tamaños que no caben en memoria.
+"""
+
+import numpy as np
+from scipy.stats import norm
+
+def estructura_plantada(p, n_factores=3, n_clusters=3, carga=0.7, separacion=3.0, semilla=42):
+    """
+    Parámetros verdaderos de la encuesta sintética
+
+    Returns:
+        dict con 'cargas' (p×k), 'factor' (factor de cada variable),
+        'centros' (n_clusters×k, medias de los factores por cluster),
+        'escala' (desviación teórica de cada variable) y los parámetros
+    """
+    factor = np.arange(p) % n_factores
+    # Una de cada cuatro variables de cada factor está invertida (ítems inversos)
+    signo = np.where((np.arange(p) // n_factores) % 4 == 3, -1.0, 1.0)
+    cargas = np.zeros((p, n_factores))
+    cargas[np.arange(p), factor] = carga * signo
+
+    # Cluster g desplaza el factor g % k (en sentido opuesto en cada vuelta)
+    centros = np.zeros((n_clusters, n_factores))
+    for g in range(n_clusters):
+        centros[g, g % n_factores] = separacion * (1 if (g // n_factores) % 2 == 0 else -1)
+
+    # Varianza de cada factor: 1 + varianza de las medias de los clusters
+    var_factor = 1 + centros.var(axis=0)
+    escala = np.sqrt(carga ** 2 * var_factor[factor] + (1 - carga ** 2))
+
+    return {
+        'cargas': cargas,
+        'factor': factor,
+        'centros': centros,
+        'escala': escala,
+        'n_factores': n_factores,
+        'n_clusters': n_clusters,
+        'carga': carga,
+        'semilla': semilla,
+    }
+
+def generar_bloques(n, estructura, niveles=5, n_clases=2, faltantes=0.01, tamano_bloque=100_000):
+    """
+    Genera la encuesta por bloques de filas
+
+    Yields:
+        dict con 'X' (bloque n_b×p de códigos 1..niveles, NaN = faltante),
+        'clusters' y 'clase' (etiquetas plantadas del bloque)
+    """
+    cargas, centros = estructura['cargas'], estructura['centros']
+    p, k = cargas.shape
+    unicidad = np.sqrt(1 - estructura['carga'] ** 2)
+
+    # Cortes Likert equiespaciados sobre la variable tipificada
+    cortes = np.linspace(-1.5, 1.5, niveles - 1)
+    # Puntaje de clase = factor 1 + ruido; cortes en los cuantiles de una
+    # normal con su media y varianza (clases aproximadamente equilibradas)
+    media_f1 = centros[:, 0].mean()
+    desviacion_f1 = np.sqrt(1 + centros[:, 0].var() + 0.25)
+    cortes_clase = norm.ppf(np.arange(1, n_clases) / n_clases, loc=media_f1, scale=desviacion_f1)
+
+    n_bloques = max(1, -(-n // tamano_bloque))
+    semillas = np.random.SeedSequence(estructura['semilla']).spawn(n_bloques)
+
+    for b, semilla in enumerate(semillas):
+        rng = np.random.default_rng(semilla)
+        filas = min(tamano_bloque, n - b * tamano_bloque)
+
+        clusters = rng.integers(len(centros), size=filas)
+        latente = rng.standard_normal((filas, k))
+        F = centros[clusters] + latente
+
+        X = F @ cargas.T + unicidad * rng.standard_normal((filas, p))
+        X /= estructura['escala']
+        X = (np.digitize(X, cortes) + 1).astype(np.float64)
+
+        if faltantes > 0:
+            X[rng.random((filas, p)) < faltantes] = np.nan
+
+        puntaje = F[:, 0] + 0.5 * rng.standard_normal(filas)
+        clase = np.digitize(puntaje, cortes_clase)
+
+        yield {'X': X, 'clusters': clusters, 'clase': clase}
+
+def generar_encuesta(n, p, n_factores=3, n_clusters=3, niveles=5, n_clases=2, carga=0.7,
+                     separacion=3.0, faltantes=0.01, semilla=42, ruta=None,
+                     tamano_bloque=100_000):
+    """
+    Genera una encuesta sintética completa de n filas y p variables
+
+    Args:
+        ruta: Si se indica, X se escribe en un .npy en disco (memmap) en vez
+              de en memoria
+        (resto: ver estructura_plantada y generar_bloques)
+
+    Returns:
+        dict con 'X', 'columnas', 'clusters', 'clase' y 'estructura'
+    """
+    estructura = estructura_plantada(p, n_factores, n_clusters, carga, separacion, semilla)
+
+    if ruta is not None:
+        X = np.lib.format.open_memmap(ruta, mode='w+', dtype=np.float64, shape=(n, p))
+    else:
+        X = np.empty((n, p))
+    clusters = np.empty(n, dtype=np.int64)
+    clase = np.empty(n, dtype=np.int64)
+
+    inicio = 0
+    for bloque in generar_bloques(n, estructura, niveles, n_clases, faltantes, tamano_bloque):
+        fin = inicio + len(bloque['X'])
+        X[inicio:fin] = bloque['X']
+        clusters[inicio:fin] = bloque['clusters']
+        clase[inicio:fin] = bloque['clase']
+        inicio = fin
+
+    if ruta is not None:
+        X.flush()
+
+    return {
+        'X': X,
+        'columnas': [f'V{j + 1}' for j in range(p)],
+        'clusters': clusters,
+        'clase': clase,
+        'estructura': estructura,
+    }
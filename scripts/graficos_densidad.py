@@ -0,0 +1,73 @@
+"""
+Gráficos de dispersión por densidad
+Con cientos de miles de puntos, dibujar un marcador por fila tarda minutos y
+el PNG se vuelve una mancha. Aquí los puntos se agregan en una rejilla 2D
+por clase (histogram2d) y cada celda toma la mezcla de los colores de las
+clases, ponderada por sus conteos, con opacidad según la densidad total
+(escala logarítmica). El coste de dibujo depende de la rejilla, no de n.
+"""
+
+import numpy as np
+from matplotlib.colors import to_rgba
+from matplotlib.patches import Patch
+
+# Por encima de este número de puntos los gráficos 2D usan la rejilla
+UMBRAL_PUNTOS = 20_000
+
+def conteos_por_clase(x, y, etiquetas, clases, resolucion=400):
+    """
+    Histograma 2D de cada clase sobre una rejilla común
+
+    Returns:
+        (conteos clases×resolucion×resolucion, extent [xmin, xmax, ymin, ymax])
+    """
+    rango = [[np.min(x), np.max(x)], [np.min(y), np.max(y)]]
+    # Rango degenerado (todos los puntos en una línea): ensanchar un poco
+    for eje in rango:
+        if eje[0] == eje[1]:
+            eje[0], eje[1] = eje[0] - 0.5, eje[1] + 0.5
+
+    conteos = np.empty((len(clases), resolucion, resolucion))
+    for i, clase in enumerate(clases):
+        mascara = etiquetas == clase
+        # histogram2d indexa [x, y]; la imagen necesita [fila=y, columna=x]
+        conteos[i] = np.histogram2d(x[mascara], y[mascara], bins=resolucion,
+                                    range=rango)[0].T
+    return conteos, [rango[0][0], rango[0][1], rango[1][0], rango[1][1]]
+
+def mezclar_colores(conteos, colores):
+    """
+    Imagen RGBA: color medio de las clases de cada celda ponderado por sus
+    conteos; opacidad log(1 + total) relativa a la celda más densa
+    """
+    colores = np.array([to_rgba(c)[:3] for c in colores])
+    total = conteos.sum(axis=0)
+    ocupadas = total > 0
+
+    imagen = np.zeros(total.shape + (4,))
+    imagen[..., :3] = np.tensordot(conteos, colores, axes=(0, 0))
+    imagen[ocupadas, :3] /= total[ocupadas, None]
+    imagen[..., 3] = np.log1p(total) / np.log1p(total.max())
+    return imagen
+
+def dispersion_densidad(ax, x, y, etiquetas, clases, colores, nombres=None, resolucion=400):
+    """
+    Dibuja en ax la densidad de cada clase sobre una rejilla 2D
+
+    Args:
+        x, y: Coordenadas de los puntos
+        etiquetas: Clase de cada punto
+        clases: Clases a dibujar (en el orden de colores)
+        colores: Un color de matplotlib por clase
+        nombres: Texto de cada clase en la leyenda (None = la propia clase)
+        resolucion: Celdas por eje
+
+    Returns:
+        Lista de parches para la leyenda (uno por clase)
+    """
+    x, y, etiquetas = np.asarray(x), np.asarray(y), np.asarray(etiquetas)
+    conteos, extent = conteos_por_clase(x, y, etiquetas, clases, resolucion)
+    ax.imshow(mezclar_colores(conteos, colores), origin='lower', extent=extent,
+              aspect='auto', interpolation='nearest')
+    nombres = clases if nombres is None else nombres
+    return [Patch(color=color, label=str(nombre)) for nombre, color in zip(nombres, colores)]
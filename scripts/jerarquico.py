@@ -0,0 +1,161 @@
+"""
+Clustering jerárquico con memoria acotada
+Construye el dendrograma una sola vez y lo corta en cada K del barrido,
+así que toda la curva de selección de modelo cuesta un único ajuste.
+
+Ward se calcula con el algoritmo de la cadena de vecinos más cercanos
+sobre centroides y tamaños de los clusters (distancia de Ward entre
+clusters), sin matriz de distancias n×n: memoria O(n·p). El enlace
+promedio no admite esa reducción y usa scipy (matriz condensada), por lo
+que conviene limitarlo a una muestra.
+
+Con más filas que la muestra del árbol, el árbol se construye sobre una
+muestra aleatoria y todas las filas se asignan al centroide más cercano
+de cada corte, en pasadas por bloques (la matriz puede ser un memmap).
+"""
+
+import numpy as np
+from scipy.cluster.hierarchy import cut_tree, linkage
+
+from motor_clustering import (asignar_por_bloques, indices_validez, sumas_por_etiqueta,
+                              validez_por_bloques)
+
+METODOS = {'ward': 'Ward', 'promedio': 'enlace promedio'}
+
+class ParticionJerarquica:
+    """
+    Corte del árbol en k grupos, con la interfaz de KMeans que usa la etapa
+    de clustering (cluster_centers_, labels_, n_clusters y predict)
+    """
+
+    def __init__(self, centros, etiquetas=None):
+        self.cluster_centers_ = centros
+        self.labels_ = etiquetas  # None = centroide más cercano (ver predict)
+        self.n_clusters = len(centros)
+
+    def predict(self, X):
+        """Etiqueta cada fila con el centroide más cercano"""
+        return asignar_por_bloques(self.cluster_centers_, X)['etiquetas']
+
+def ward_cadena_vecinos(X):
+    """
+    Enlace de Ward por cadena de vecinos más cercanos
+
+    La distancia de Ward entre dos clusters depende solo de sus centroides
+    y tamaños: sqrt(2·na·nb / (na + nb)) · ||ca - cb||. Cada paso calcula
+    las distancias del extremo de la cadena a los clusters activos (O(n·p))
+    y la cadena fusiona vecinos recíprocos; como Ward es reducible, ordenar
+    las fusiones por distancia da el mismo dendrograma que scipy.
+
+    Returns:
+        Matriz de enlace (n-1)×4 en el formato de scipy.cluster.hierarchy
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n = len(X)
+    centros = X.copy()
+    tamanos = np.ones(n)
+    activos = np.ones(n, dtype=bool)
+    fusiones = np.empty((n - 1, 3))
+    cadena = []
+
+    for paso in range(n - 1):
+        if not cadena:
+            cadena.append(int(np.argmax(activos)))
+        while True:
+            a = cadena[-1]
+            diferencias = centros - centros[a]
+            distancias = np.einsum('ij,ij->i', diferencias, diferencias)
+            distancias *= 2 * tamanos * tamanos[a] / (tamanos + tamanos[a])
+            distancias[~activos] = np.inf
+            distancias[a] = np.inf
+            b = int(np.argmin(distancias))
+            # Vecinos recíprocos: se fusionan (el anterior gana los empates)
+            if len(cadena) > 1 and distancias[cadena[-2]] <= distancias[b]:
+                b = cadena[-2]
+                break
+            cadena.append(b)
+        del cadena[-2:]
+
+        total = tamanos[a] + tamanos[b]
+        centros[b] = (tamanos[a] * centros[a] + tamanos[b] * centros[b]) / total
+        tamanos[b] = total
+        activos[a] = False
+        fusiones[paso] = a, b, np.sqrt(distancias[b])
+
+    return _enlace_ordenado(fusiones, n)
+
+def _enlace_ordenado(fusiones, n):
+    """Ordena las fusiones por distancia y numera los clusters como scipy"""
+    padre = np.arange(n)
+    identificador = np.arange(n)
+    tamano = np.ones(n, dtype=np.int64)
+
+    def raiz(i):
+        while padre[i] != i:
+            padre[i] = padre[padre[i]]
+            i = padre[i]
+        return i
+
+    Z = np.empty((n - 1, 4))
+    for paso, fila in enumerate(np.argsort(fusiones[:, 2], kind='stable')):
+        a, b = raiz(int(fusiones[fila, 0])), raiz(int(fusiones[fila, 1]))
+        ida, idb = identificador[a], identificador[b]
+        padre[a] = b
+        tamano[b] += tamano[a]
+        identificador[b] = n + paso
+        Z[paso] = min(ida, idb), max(ida, idb), fusiones[fila, 2], tamano[b]
+    return Z
+
+def barrido_jerarquico(X, valores_k, metodo='ward', tamano_muestra=None, semilla_silueta=42,
+                       muestra_arbol=20_000, semilla=42, tamano_bloque=50_000):
+    """
+    Construye el árbol una vez y evalúa cada corte en valores_k
+
+    Args:
+        X: Matriz n×p estandarizada (puede ser un memmap)
+        metodo: 'ward' o 'promedio'
+        tamano_muestra: Muestra de la silhouette (ver silueta.silueta)
+        muestra_arbol: Filas para construir el árbol; si n es mayor, las
+            demás se asignan al centroide más cercano (None = todas)
+
+    Returns:
+        Lista de dicts como motor_clustering.evaluar_k, más 'modelo' (una
+        ParticionJerarquica), en el orden de valores_k. Solo los cortes de
+        un árbol sobre todas las filas guardan sus etiquetas; con muestra,
+        las etiquetas son las del centroide más cercano y no se guardan
+    """
+    n = len(X)
+    muestreado = muestra_arbol is not None and n > muestra_arbol
+    if muestreado:
+        filas = np.sort(np.random.default_rng(semilla).choice(n, muestra_arbol, replace=False))
+        X_arbol = np.asarray(X[filas], dtype=np.float64)
+    else:
+        X_arbol = np.asarray(X, dtype=np.float64)
+
+    if metodo == 'ward':
+        Z = ward_cadena_vecinos(X_arbol)
+    else:
+        Z = linkage(X_arbol, method='average')
+    cortes = cut_tree(Z, n_clusters=list(valores_k))
+
+    resultados = []
+    for j, k in enumerate(valores_k):
+        etiquetas = cortes[:, j]
+        tamanos = np.bincount(etiquetas, minlength=k)
+        centros = sumas_por_etiqueta(etiquetas, X_arbol, k) / tamanos[:, None]
+
+        if muestreado:
+            asignacion = asignar_por_bloques(centros, X, tamano_bloque)
+            resultados.append({
+                'k': k, 'centros': centros, 'modelo': ParticionJerarquica(centros),
+                'inercia': asignacion['inercia'],
+                **validez_por_bloques(X, asignacion, tamano_muestra, semilla_silueta, tamano_bloque),
+            })
+        else:
+            diferencias = X_arbol - centros[etiquetas]
+            resultados.append({
+                'k': k, 'centros': centros, 'modelo': ParticionJerarquica(centros, etiquetas),
+                'inercia': float(np.einsum('ij,ij->', diferencias, diferencias)),
+                **indices_validez(X_arbol, etiquetas, tamano_muestra, semilla_silueta),
+            })
+    return resultados
@@ -0,0 +1,227 @@
+"""
+Libro de códigos
+Infiere la correspondencia código → etiqueta de cada variable a partir de
+la co-ocurrencia fila a fila entre BASE_NOMBRES_Y_VALORES.xlsx (códigos) y
+BASE_ETIQUETAS.xlsx (etiquetas), para todas las columnas a la vez.
+
+El resultado es un diccionario {variable: entrada} con arrays de códigos y
+etiquetas y un CategoricalDtype, de modo que decodificar millones de filas
+es una búsqueda binaria vectorizada (ver decodificar). Con compactar() las
+columnas codificadas se guardan como Categorical de códigos int8, que ocupan
+una fracción de las columnas float64/int64 originales.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cache_datos import DIRECTORIO_CACHE, cargar_excel, escribir_atomico, obtener_huella
+from perfilado import perfilar
+
+# Cambiar si cambia la forma de inferir el libro (invalida los libros en caché)
+VERSION = 1
+
+def alinear_columnas(etiquetas, valores):
+    """
+    Empareja columnas de ambos libros: por nombre si comparten nombres y,
+    si no, por posición (los libros se exportan con las mismas columnas
+    en el mismo orden)
+
+    Returns:
+        Lista de pares (columna en valores, columna en etiquetas)
+    """
+    if len(etiquetas) != len(valores):
+        raise ValueError(f"Los libros no están alineados por filas: "
+                         f"{len(etiquetas)} vs {len(valores)} filas")
+
+    nombres_etiquetas = set(etiquetas.columns)
+    comunes = [c for c in valores.columns if c in nombres_etiquetas]
+    if comunes:
+        return [(c, c) for c in comunes]
+
+    if etiquetas.shape[1] != valores.shape[1]:
+        raise ValueError(f"Los libros no comparten nombres de columna ni número de columnas: "
+                         f"{etiquetas.shape[1]} vs {valores.shape[1]}")
+    return list(zip(valores.columns, etiquetas.columns))
+
+def construir_libro_codigos(etiquetas, valores, max_categorias=50):
+    """
+    Construye el libro de códigos de todas las columnas en una sola pasada
+
+    Para cada variable, la etiqueta de un código es la que más veces
+    aparece en las mismas filas. Una variable es numérica (sin libro) si
+    sus etiquetas coinciden con los códigos (p. ej. edad) o si tiene más
+    de max_categorias códigos distintos.
+
+    Returns:
+        dict {variable: entrada}, con entrada = {'pregunta', 'tipo'
+        ('categorica' o 'numerica'), 'n_valores', 'codigos', 'etiquetas',
+        'consistencia' (fracción de filas que siguen el mapeo)}; las
+        entradas categóricas incluyen además 'dtype' (CategoricalDtype)
+        y 'indice' (posición de la etiqueta de cada código en el dtype)
+    """
+    pares = alinear_columnas(etiquetas, valores)
+    columnas_valores = [v for v, _ in pares]
+    columnas_etiquetas = [e for _, e in pares]
+    p = len(pares)
+
+    # Formato largo: una fila por celda (variable, código, etiqueta)
+    codigos = valores[columnas_valores].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    textos = etiquetas[columnas_etiquetas].to_numpy(dtype=object)
+    variable = np.tile(np.arange(p), len(valores))
+    codigos = codigos.ravel()
+    textos = textos.ravel()
+
+    presentes = ~np.isnan(codigos) & pd.notna(textos)
+    variable, codigos, textos = variable[presentes], codigos[presentes], textos[presentes]
+    id_etiqueta, etiquetas_unicas = pd.factorize(textos)
+
+    # Etiquetas que son el propio código (variables numéricas)
+    identidad = pd.to_numeric(pd.Series(textos, dtype=object), errors='coerce').to_numpy() == codigos
+    es_numerica = np.bincount(variable, weights=~identidad, minlength=p) == 0
+
+    conteos = (pd.DataFrame({'variable': variable, 'codigo': codigos, 'etiqueta': id_etiqueta})
+                 .groupby(['variable', 'codigo', 'etiqueta'], sort=False).size()
+                 .rename('n').reset_index())
+    total_por_codigo = conteos.groupby(['variable', 'codigo'])['n'].transform('sum')
+    conteos['total'] = total_por_codigo
+    modas = (conteos.sort_values(['variable', 'codigo', 'n'], ascending=[True, True, False])
+                    .drop_duplicates(['variable', 'codigo']))
+
+    libro = {}
+    for i, tabla in modas.groupby('variable', sort=True):
+        nombre = str(columnas_valores[i])
+        codigos_var = tabla['codigo'].to_numpy()
+        etiquetas_var = etiquetas_unicas[tabla['etiqueta'].to_numpy()].astype(str)
+        numerica = bool(es_numerica[i]) or len(codigos_var) > max_categorias
+
+        entrada = {
+            'pregunta': str(columnas_etiquetas[i]),
+            'tipo': 'numerica' if numerica else 'categorica',
+            'n_valores': len(codigos_var),
+            'codigos': codigos_var,
+            'etiquetas': etiquetas_var,
+            'consistencia': float(tabla['n'].sum() / tabla['total'].sum()),
+        }
+        if not numerica:
+            entrada.update(_tipo_categorico(etiquetas_var))
+        libro[nombre] = entrada
+
+    return libro
+
+def _tipo_categorico(etiquetas_var):
+    """CategoricalDtype en orden de código e índice código → categoría"""
+    categorias, indice = np.unique(etiquetas_var, return_index=True)
+    categorias = etiquetas_var[np.sort(indice)]
+    posicion = {c: k for k, c in enumerate(categorias)}
+    return {
+        'dtype': pd.CategoricalDtype(categories=categorias, ordered=False),
+        'indice': np.array([posicion[e] for e in etiquetas_var], dtype=np.int64),
+    }
+
+def _posiciones(x, tabla):
+    """Posición de cada valor de x en la tabla ordenada de códigos (-1 si no está)"""
+    pos = np.clip(np.searchsorted(tabla, x), 0, len(tabla) - 1)
+    return np.where(tabla[pos] == x, pos, -1)
+
+def decodificar(codigos, entrada):
+    """
+    Traduce códigos a etiquetas con búsqueda binaria (vectorizado)
+
+    Args:
+        codigos: Serie o array de códigos
+        entrada: Entrada categórica del libro de códigos
+
+    Returns:
+        pd.Categorical con las etiquetas (NaN para códigos desconocidos)
+    """
+    pos = _posiciones(np.asarray(codigos, dtype=np.float64), entrada['codigos'])
+    return pd.Categorical.from_codes(np.where(pos >= 0, entrada['indice'][pos], -1),
+                                     dtype=entrada['dtype'])
+
+def decodificar_dataframe(df, libro):
+    """Devuelve df con las columnas categóricas del libro decodificadas"""
+    decodificadas = {col: decodificar(df[col], entrada) for col, entrada in libro.items()
+                     if entrada['tipo'] == 'categorica' and col in df.columns}
+    return df.assign(**decodificadas)
+
+def compactar(df, libro):
+    """
+    Versión compacta de un DataFrame de códigos
+
+    Las columnas categóricas del libro pasan a Categorical cuyas categorías
+    son los propios códigos (internamente int8), y las enteras se reducen
+    al tipo entero más pequeño. Los valores no cambian: a_numerico() en
+    preprocesamiento.py los devuelve a float64 en la frontera numérica.
+    Una columna con códigos que no están en el libro se deja como está.
+    """
+    compacto = {}
+    for col in df.columns:
+        serie = df[col]
+        entrada = libro.get(str(col))
+        es_codigo = entrada is not None and entrada['tipo'] == 'categorica'
+        if es_codigo and pd.api.types.is_numeric_dtype(serie):
+            x = pd.to_numeric(serie, errors='coerce').to_numpy(dtype=np.float64)
+            pos = _posiciones(x, entrada['codigos'])
+            if not np.any((pos < 0) & ~np.isnan(x)):
+                serie = pd.Series(pd.Categorical.from_codes(pos, categories=entrada['codigos']),
+                                  index=df.index, name=col)
+        elif pd.api.types.is_integer_dtype(serie):
+            serie = pd.to_numeric(serie, downcast='integer')
+        compacto[col] = serie
+    return pd.DataFrame(compacto, index=df.index)
+
+@perfilar(categoria='datos')
+def obtener_libro_codigos(ruta_etiquetas='../BASE_ETIQUETAS.xlsx',
+                          ruta_valores='../BASE_NOMBRES_Y_VALORES.xlsx',
+                          max_categorias=50, directorio_cache=DIRECTORIO_CACHE):
+    """
+    Libro de códigos de un par de archivos, inferido solo la primera vez
+    y guardado en cache/libros/ (la clave son las huellas de ambos archivos)
+    """
+    huella_e = obtener_huella(ruta_etiquetas, directorio_cache)
+    huella_v = obtener_huella(ruta_valores, directorio_cache)
+    ruta = (Path(directorio_cache) / 'libros' /
+            f'{huella_e[:16]}-{huella_v[:16]}-{max_categorias}-v{VERSION}.json')
+
+    if not ruta.exists():
+        libro = construir_libro_codigos(cargar_excel(ruta_etiquetas, directorio_cache),
+                                        cargar_excel(ruta_valores, directorio_cache),
+                                        max_categorias=max_categorias)
+        guardar_libro_codigos(libro, ruta)
+        return libro
+
+    return cargar_libro_codigos(ruta)
+
+def guardar_libro_codigos(libro, ruta):
+    """Guarda el libro de códigos en JSON (sin los dtypes, que se reconstruyen)"""
+    contenido = {
+        col: {
+            'pregunta': e['pregunta'],
+            'tipo': e['tipo'],
+            'n_valores': e['n_valores'],
+            'codigos': e['codigos'].tolist(),
+            'etiquetas': e['etiquetas'].tolist(),
+            'consistencia': e['consistencia'],
+        }
+        for col, e in libro.items()
+    }
+    Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+    escribir_atomico(ruta, lambda tmp: Path(tmp).write_text(
+        json.dumps(contenido, ensure_ascii=False, indent=1), encoding='utf-8'))
+
+def cargar_libro_codigos(ruta):
+    """Lee un libro de códigos guardado con guardar_libro_codigos"""
+    with open(ruta, encoding='utf-8') as f:
+        contenido = json.load(f)
+
+    libro = {}
+    for col, e in contenido.items():
+        entrada = dict(e, codigos=np.array(e['codigos'], dtype=np.float64),
+                       etiquetas=np.array(e['etiquetas'], dtype=object))
+        if entrada['tipo'] == 'categorica':
+            entrada.update(_tipo_categorico(entrada['etiquetas']))
+        libro[col] = entrada
+    return libro
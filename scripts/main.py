@@ -1,32 +1,54 @@
 """
 SCRIPT PRINCIPAL - Ejecuta todos los análisis
-Este script ejecuta los 7 análisis en secuencia.
+Este script ejecuta los 7 análisis; los que no dependen entre sí
+corren en paralelo (ver planificador.py).
+
+Uso:
+    python main.py                 # paralelo, pide ENTER para empezar
+    python main.py --sin-pausa     # modo desatendido
+    python main.py --secuencial    # una etapa tras otra
+    python main.py --forzar        # recalcular aunque nada haya cambiado
+    python main.py --perfilar      # medir cada función (resumen y traza en ../perfiles)
 """
 
+import argparse
 import sys
-import os
+import time
 from pathlib import Path
-import importlib.util
 
 # Añadir el directorio de scripts al path
 sys.path.insert(0, str(Path(__file__).parent))
 
+import perfilado
+from cache_datos import cargar_excel
+from planificador import ejecutar_etapas, imprimir_resumen
+from preprocesamiento import preparar_matriz
+
 def print_header(titulo, emoji="🔬"):
     """Imprime un encabezado bonito"""
     print("\n" + "=" * 100)
     print(f"{emoji} {titulo}")
     print("=" * 100 + "\n")
 
-def cargar_modulo(nombre_archivo):
-    """Carga un módulo Python dinámicamente"""
-    ruta = Path(__file__).parent / nombre_archivo
-    spec = importlib.util.spec_from_file_location(nombre_archivo[:-3], ruta)
-    modulo = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(modulo)
-    return modulo
+def parsear_argumentos():
+    """Lee las opciones de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Ejecuta todos los análisis")
+    parser.add_argument('--sin-pausa', action='store_true',
+                        help="No esperar ENTER antes de comenzar (modo desatendido)")
+    parser.add_argument('--secuencial', action='store_true',
+                        help="Ejecutar las etapas una tras otra en este proceso")
+    parser.add_argument('--forzar', action='store_true',
+                        help="Recalcular todas las etapas aunque no hayan cambiado")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Número de procesos en paralelo (por defecto: núcleos disponibles)")
+    parser.add_argument('--perfilar', action='store_true',
+                        help="Medir tiempo, CPU y memoria de cada función (../perfiles)")
+    return parser.parse_args()
 
 def main():
-    """Ejecuta todos los análisis en secuencia"""
+    """Ejecuta todos los análisis respetando sus dependencias"""
+    
+    args = parsear_argumentos()
     
     print_header("SISTEMA DE ANÁLISIS ESTADÍSTICO MULTIVARIADO", "🚀")
     print("Este script ejecutará 7 análisis completos:")
@@ -37,93 +59,36 @@ def main():
     print("   5️⃣  Análisis Discriminante")
     print("   6️⃣  Análisis Comparativo")
     print("   7️⃣  Plantilla de Reflexión Crítica")
+    if not args.secuencial:
+        print("\n⚡ ACP, AFE, Clustering y Discriminante se ejecutan en paralelo")
     print("\n⏱️  Tiempo estimado: 2-5 minutos\n")
     
-    input("Presiona ENTER para comenzar...")
+    if not args.sin_pausa and sys.stdin.isatty():
+        input("Presiona ENTER para comenzar...")
+    
+    if args.perfilar:
+        perfilado.activar()
     
     try:
-        # ==========================================
-        # 1️⃣ HOJA DE CODIFICACIÓN
-        # ==========================================
-        print_header("1/7 - HOJA DE CODIFICACIÓN", "1️⃣")
-        try:
-            mod1 = cargar_modulo("1_hoja_codificacion.py")
-            df_codificacion = mod1.main()
-            print("✅ Completado: Hoja de codificación")
-        except Exception as e:
-            print(f"❌ Error en hoja de codificación: {e}")
-            print("Continuando con el siguiente análisis...")
+        inicio = time.perf_counter()
         
-        # ==========================================
-        # 2️⃣ ANÁLISIS DE COMPONENTES PRINCIPALES
-        # ==========================================
-        print_header("2/7 - ANÁLISIS DE COMPONENTES PRINCIPALES (ACP)", "2️⃣")
+        # Preparar cachés compartidas antes de lanzar etapas en paralelo
         try:
-            mod2 = cargar_modulo("2_analisis_pca.py")
-            pca, componentes, df_cargas_pca = mod2.main()
-            print("✅ Completado: ACP")
+            cargar_excel('../BASE_ETIQUETAS.xlsx')
+            preparar_matriz('../BASE_NOMBRES_Y_VALORES.xlsx')
         except Exception as e:
-            print(f"❌ Error en ACP: {e}")
-            print("Continuando con el siguiente análisis...")
+            print(f"⚠️  No se pudo preparar la caché de datos: {e}")
         
-        # ==========================================
-        # 3️⃣ ANÁLISIS FACTORIAL EXPLORATORIO
-        # ==========================================
-        print_header("3/7 - ANÁLISIS FACTORIAL EXPLORATORIO (AFE)", "3️⃣")
-        try:
-            mod3 = cargar_modulo("3_analisis_afe.py")
-            fa, df_loadings = mod3.main()
-            print("✅ Completado: AFE")
-        except Exception as e:
-            print(f"❌ Error en AFE: {e}")
-            print("Continuando con el siguiente análisis...")
+        print_header("EJECUCIÓN DE ETAPAS", "🔬")
+        resultados = ejecutar_etapas(n_workers=args.workers, secuencial=args.secuencial,
+                                     incremental=not args.forzar, perfilar=args.perfilar)
+        imprimir_resumen(resultados, time.perf_counter() - inicio)
         
-        # ==========================================
-        # 4️⃣ ANÁLISIS DE CLUSTERING
-        # ==========================================
-        print_header("4/7 - ANÁLISIS DE CLUSTERING", "4️⃣")
-        try:
-            mod4 = cargar_modulo("4_analisis_clustering.py")
-            kmeans, labels, df_clusters = mod4.main()
-            print("✅ Completado: Clustering")
-        except Exception as e:
-            print(f"❌ Error en Clustering: {e}")
-            print("Continuando con el siguiente análisis...")
-        
-        # ==========================================
-        # 5️⃣ ANÁLISIS DISCRIMINANTE
-        # ==========================================
-        print_header("5/7 - ANÁLISIS DISCRIMINANTE", "5️⃣")
-        try:
-            mod5 = cargar_modulo("5_analisis_discriminante.py")
-            lda, accuracy, cm = mod5.main()
-            print("✅ Completado: Análisis Discriminante")
-        except Exception as e:
-            print(f"❌ Error en Discriminante: {e}")
-            print("Continuando con el siguiente análisis...")
-        
-        # ==========================================
-        # 6️⃣ ANÁLISIS COMPARATIVO
-        # ==========================================
-        print_header("6/7 - ANÁLISIS COMPARATIVO", "6️⃣")
-        try:
-            mod6 = cargar_modulo("6_analisis_comparativo.py")
-            df_comparacion = mod6.main()
-            print("✅ Completado: Análisis Comparativo")
-        except Exception as e:
-            print(f"❌ Error en Comparativo: {e}")
-            print("Continuando con el siguiente análisis...")
-        
-        # ==========================================
-        # 7️⃣ REFLEXIÓN CRÍTICA
-        # ==========================================
-        print_header("7/7 - PLANTILLA DE REFLEXIÓN CRÍTICA", "7️⃣")
-        try:
-            mod7 = cargar_modulo("7_reflexion_critica.py")
-            mod7.main()
-            print("✅ Completado: Plantilla de Reflexión")
-        except Exception as e:
-            print(f"❌ Error en Reflexión: {e}")
+        if args.perfilar:
+            perfilado.imprimir_resumen()
+            ruta_resumen, ruta_traza = perfilado.guardar()
+            print(f"💾 Perfil guardado: {ruta_resumen}")
+            print(f"💾 Traza (Perfetto / chrome://tracing): {ruta_traza}")
         
         # ==========================================
         # RESUMEN FINAL
@@ -138,6 +103,7 @@ def main():
         print("   • tabla_cargas_afe.xlsx - Cargas del AFE")
         print("   • estadisticas_clusters.xlsx - Estadísticas por cluster")
         print("   • descripcion_clusters.xlsx - Descripción de clusters")
+        print("   • pruebas_clusters.xlsx - Contrastes de variables entre clusters")
         print("   • coeficientes_discriminantes.xlsx - Coeficientes LDA")
         print("   • tabla_comparativa.xlsx - Tabla comparativa de métodos")
         print("   • reporte_pca.txt - Reporte completo PCA")
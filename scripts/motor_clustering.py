@@ -0,0 +1,384 @@
+"""
+Motor de clustering
+Funciones de K-means compartidas por la etapa de clustering: ajuste y
+métricas de validez de un K, y barrido de K en paralelo sobre una copia
+en memoria compartida de la matriz estandarizada (ver paralelo.py).
+
+Para archivos de encuestados que no caben en memoria hay un modo por
+bloques: K-means por minilotes que lee la matriz (un memmap en disco) por
+bloques de filas, y pasadas de asignación que calculan etiquetas, inercia
+e índices de validez exactos sin cargarla entera.
+
+El barrido incremental construye la solución de k+1 grupos a partir de la
+de k (bisecando el cluster de mayor inercia), en vez de reiniciar cada K.
+
+perfil_clusters describe los grupos en pasadas por bloques de filas, con
+reducciones por segmentos sobre tramos ordenados por cluster (sin bucles
+por cluster).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import cdist
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score
+
+from paralelo import mapa_compartido
+from silueta import silueta, silueta_submuestra
+
+def evaluar_k(X, k, semilla=42, n_init=10, tamano_muestra=None, semilla_silueta=42,
+              centros_iniciales=None):
+    """
+    Ajusta K-means con k grupos y calcula sus índices de validez
+
+    Args:
+        centros_iniciales: Centros k×p de partida (un solo inicio); None =
+            n_init inicios k-means++
+
+    Returns:
+        dict con 'k', 'centros' (k×p), 'inercia', 'silueta' (resultado de
+        silueta.silueta), 'calinski' y 'davies_bouldin'. No se devuelve el
+        modelo: sus etiquetas (n enteros por K) viajarían de vuelta desde
+        cada worker
+    """
+    if centros_iniciales is None:
+        kmeans = KMeans(n_clusters=k, random_state=semilla, n_init=n_init)
+    else:
+        kmeans = KMeans(n_clusters=k, init=centros_iniciales, n_init=1, random_state=semilla)
+    labels = kmeans.fit_predict(X)
+
+    return {'k': k, 'centros': kmeans.cluster_centers_, 'inercia': kmeans.inertia_,
+            **indices_validez(X, labels, tamano_muestra, semilla_silueta)}
+
+def indices_validez(X, labels, tamano_muestra=None, semilla_silueta=42):
+    """Silhouette (silueta.silueta), Calinski-Harabasz y Davies-Bouldin de una partición"""
+    return {
+        'silueta': silueta(X, labels, tamano_muestra=tamano_muestra, semilla=semilla_silueta),
+        'calinski': calinski_harabasz_score(X, labels),
+        'davies_bouldin': davies_bouldin_score(X, labels),
+    }
+
+def _bloques(X, tamano_bloque):
+    """Recorre X por bloques de filas: (inicio, bloque float64 en memoria)"""
+    for inicio in range(0, len(X), tamano_bloque):
+        yield inicio, np.asarray(X[inicio:inicio + tamano_bloque], dtype=np.float64)
+
+def sumas_por_etiqueta(etiquetas, X, k):
+    """Suma de las filas de X por etiqueta (k×p), con bincount por columna en vez de one-hot"""
+    return np.column_stack([np.bincount(etiquetas, weights=X[:, j], minlength=k)
+                            for j in range(X.shape[1])])
+
+def kmeans_minilotes(X, k, semilla=42, n_init=10, tamano_lote=4096, tamano_bloque=50_000,
+                     n_pasadas=2, tamano_inicial=20_000, centros_iniciales=None):
+    """
+    K-means por minilotes leyendo X por bloques de filas
+
+    Los centros iniciales salen de un KMeans completo (n_init inicios) sobre
+    una muestra aleatoria de filas. Después se dan n_pasadas recorriendo los
+    bloques en orden aleatorio; cada bloque se baraja y se parte en lotes de
+    ~tamano_lote filas para MiniBatchKMeans.partial_fit. Solo hay un bloque
+    en memoria a la vez. Con centros_iniciales se parte de ellos y se omite
+    el ajuste sobre la muestra.
+
+    Returns:
+        MiniBatchKMeans ajustado
+    """
+    rng = np.random.default_rng(semilla)
+    n = len(X)
+
+    muestra = np.sort(rng.choice(n, size=min(n, tamano_inicial), replace=False))
+    if centros_iniciales is None:
+        inicial = KMeans(n_clusters=k, random_state=semilla, n_init=n_init)
+        centros_iniciales = inicial.fit(np.asarray(X[muestra], dtype=np.float64)).cluster_centers_
+
+    modelo = MiniBatchKMeans(n_clusters=k, init=centros_iniciales, n_init=1,
+                             batch_size=tamano_lote, random_state=semilla)
+    inicios = np.arange(0, n, tamano_bloque)
+    for _ in range(n_pasadas):
+        for inicio in rng.permutation(inicios):
+            bloque = np.asarray(X[inicio:inicio + tamano_bloque], dtype=np.float64)
+            n_lotes = max(1, len(bloque) // tamano_lote)
+            for lote in np.array_split(rng.permutation(len(bloque)), n_lotes):
+                modelo.partial_fit(bloque[lote])
+    return modelo
+
+def asignar_por_bloques(centros, X, tamano_bloque=50_000, etiquetas=None):
+    """
+    Pasada de asignación: cada fila al centro más cercano
+
+    Args:
+        centros: Centros k×p
+        X: Matriz n×p (puede ser un memmap)
+        etiquetas: Array n donde escribir las etiquetas (p. ej. un memmap
+                   en disco); None = array nuevo en memoria
+
+    Returns:
+        dict con 'etiquetas', 'inercia' (suma de distancias al cuadrado a
+        los centros, como KMeans.inertia_), 'tamanos' y 'sumas' (k×p) por
+        cluster
+    """
+    k, p = centros.shape
+    if etiquetas is None:
+        etiquetas = np.empty(len(X), dtype=np.int32)
+    normas_centros = np.einsum('ij,ij->i', centros, centros)
+    tamanos = np.zeros(k, dtype=np.int64)
+    sumas = np.zeros((k, p))
+    inercia = 0.0
+
+    for inicio, bloque in _bloques(X, tamano_bloque):
+        distancias = np.einsum('ij,ij->i', bloque, bloque)[:, None] - 2 * bloque @ centros.T
+        distancias += normas_centros
+        cercano = distancias.argmin(axis=1)
+        inercia += np.maximum(distancias[np.arange(len(bloque)), cercano], 0).sum()
+
+        etiquetas[inicio:inicio + len(bloque)] = cercano
+        tamanos += np.bincount(cercano, minlength=k)
+        sumas += sumas_por_etiqueta(cercano, bloque, k)
+
+    return {'etiquetas': etiquetas, 'inercia': float(inercia), 'tamanos': tamanos, 'sumas': sumas}
+
+def indices_por_bloques(X, asignacion, tamano_bloque=50_000):
+    """
+    Calinski-Harabasz y Davies-Bouldin de una asignación, en una pasada
+
+    Usan las medias exactas de cada cluster (de asignar_por_bloques), así
+    que coinciden con las funciones de sklearn.metrics sobre las mismas
+    etiquetas.
+
+    Returns:
+        (calinski, davies_bouldin)
+    """
+    presentes = asignacion['tamanos'] > 0
+    tamanos = asignacion['tamanos'][presentes]
+    medias = asignacion['sumas'][presentes] / tamanos[:, None]
+    # Posición de cada etiqueta entre los clusters no vacíos
+    posicion = np.cumsum(presentes) - 1
+    n, k = tamanos.sum(), len(tamanos)
+
+    intra_cuadrados = 0.0
+    suma_distancias = np.zeros(k)
+    for inicio, bloque in _bloques(X, tamano_bloque):
+        cluster = posicion[asignacion['etiquetas'][inicio:inicio + len(bloque)]]
+        diferencias = bloque - medias[cluster]
+        cuadrados = np.einsum('ij,ij->i', diferencias, diferencias)
+        intra_cuadrados += cuadrados.sum()
+        suma_distancias += np.bincount(cluster, weights=np.sqrt(cuadrados), minlength=k)
+
+    media_global = asignacion['sumas'].sum(axis=0) / n
+    entre = float(np.sum(tamanos * np.sum((medias - media_global) ** 2, axis=1)))
+    calinski = 1.0 if intra_cuadrados == 0 else entre * (n - k) / (intra_cuadrados * (k - 1))
+
+    intra = suma_distancias / tamanos
+    distancias_centros = cdist(medias, medias)
+    if np.allclose(intra, 0) or np.allclose(distancias_centros, 0):
+        return calinski, 0.0
+    distancias_centros[distancias_centros == 0] = np.inf
+    davies = float(np.mean(np.max((intra[:, None] + intra) / distancias_centros, axis=1)))
+    return calinski, davies
+
+def evaluar_k_por_bloques(X, k, semilla=42, n_init=10, tamano_muestra=None, semilla_silueta=42,
+                          tamano_bloque=50_000, centros_iniciales=None):
+    """
+    Como evaluar_k, con K-means por minilotes y pasadas por bloques
+
+    La inercia y los índices se calculan sobre todas las filas; la
+    silhouette, sobre una submuestra estratificada (silueta_submuestra).
+    """
+    modelo = kmeans_minilotes(X, k, semilla=semilla, n_init=n_init, tamano_bloque=tamano_bloque,
+                              centros_iniciales=centros_iniciales)
+    asignacion = asignar_por_bloques(modelo.cluster_centers_, X, tamano_bloque)
+
+    return {'k': k, 'centros': modelo.cluster_centers_, 'inercia': asignacion['inercia'],
+            **validez_por_bloques(X, asignacion, tamano_muestra, semilla_silueta, tamano_bloque)}
+
+def validez_por_bloques(X, asignacion, tamano_muestra=None, semilla_silueta=42,
+                        tamano_bloque=50_000):
+    """Como indices_validez, desde una asignación por bloques (silhouette en submuestra)"""
+    calinski, davies = indices_por_bloques(X, asignacion, tamano_bloque)
+    return {
+        'silueta': silueta_submuestra(X, asignacion['etiquetas'], tamano_muestra,
+                                      semilla=semilla_silueta),
+        'calinski': calinski,
+        'davies_bouldin': davies,
+    }
+
+def barrido_k(X, valores_k, semilla=42, n_init=10, tamano_muestra=None, semilla_silueta=42,
+              n_workers=None, por_bloques=False, tamano_bloque=50_000):
+    """
+    Evalúa cada K de forma independiente, en paralelo
+
+    Cada K usa la misma semilla fija, así que el resultado no depende del
+    número de workers ni del orden en que terminen. Con por_bloques=True se
+    usa evaluar_k_por_bloques (X puede ser un memmap que no cabe en memoria).
+
+    Returns:
+        Lista de resultados de evaluar_k, en el orden de valores_k
+    """
+    if por_bloques:
+        tareas = [(k, semilla, n_init, tamano_muestra, semilla_silueta, tamano_bloque)
+                  for k in valores_k]
+        return mapa_compartido(evaluar_k_por_bloques, X, tareas, n_workers=n_workers)
+
+    tareas = [(k, semilla, n_init, tamano_muestra, semilla_silueta) for k in valores_k]
+    return mapa_compartido(evaluar_k, X, tareas, n_workers=n_workers)
+
+def biseccionar(X, centros, semilla=42, tamano_muestra=20_000, n_init=3):
+    """
+    Centros de partida para k+1 grupos: parte en dos el cluster de mayor inercia
+
+    La inercia por cluster y el 2-means se calculan sobre una muestra de
+    filas (todas si n <= tamano_muestra), así que el coste no depende de n.
+
+    Returns:
+        Centros (k+1)×p: los k-1 centros restantes y los dos nuevos
+    """
+    n = len(X)
+    if n > tamano_muestra:
+        muestra = np.sort(np.random.default_rng(semilla).choice(n, tamano_muestra, replace=False))
+        X = X[muestra]
+    X = np.asarray(X, dtype=np.float64)
+
+    distancias = cdist(X, centros, 'sqeuclidean')
+    cercano = distancias.argmin(axis=1)
+    inercias = np.bincount(cercano, weights=distancias[np.arange(len(X)), cercano],
+                           minlength=len(centros))
+    peor = int(np.argmax(inercias))
+
+    miembros = X[cercano == peor]
+    dos = KMeans(n_clusters=2, random_state=semilla, n_init=n_init).fit(miembros).cluster_centers_
+    return np.vstack([np.delete(centros, peor, axis=0), dos])
+
+def barrido_incremental(X, valores_k, semilla=42, n_init=10, tamano_muestra=None,
+                        semilla_silueta=42, por_bloques=False, tamano_bloque=50_000):
+    """
+    Barrido de K con arranque en caliente
+
+    Solo el menor K se ajusta desde cero (n_init inicios). Cada K siguiente
+    parte de la solución anterior con su peor cluster bisecado
+    (biseccionar) y se refina con un único ajuste, que converge en pocas
+    iteraciones: el barrido cuesta unas pocas veces un ajuste. Es secuencial
+    por construcción.
+
+    Returns:
+        Lista de resultados de evaluar_k (o evaluar_k_por_bloques), en el
+        orden de valores_k
+    """
+    evaluar = evaluar_k_por_bloques if por_bloques else evaluar_k
+    extra = {'tamano_bloque': tamano_bloque} if por_bloques else {}
+
+    resultados = {}
+    centros = None
+    for k in sorted(valores_k):
+        while centros is not None and len(centros) < k:
+            centros = biseccionar(X, centros, semilla=semilla)
+        resultados[k] = evaluar(X, k, semilla=semilla, n_init=n_init, tamano_muestra=tamano_muestra,
+                                semilla_silueta=semilla_silueta, centros_iniciales=centros, **extra)
+        centros = resultados[k]['centros']
+    return [resultados[k] for k in valores_k]
+
+def perfil_clusters(X, labels, columnas, n_clusters=None, tamano_bloque=50_000, memoria_mb=256):
+    """
+    Perfil de cada cluster en formato largo (una fila por cluster y variable)
+
+    X se recorre por bloques de filas contiguos (nunca por columnas, que en
+    un memmap en orden C serían p pasadas salteadas por el archivo). Media y
+    desviación salen de una pasada: las filas de cada bloque se ordenan por
+    cluster una vez, np.add.reduceat reduce cada tramo y los tramos se
+    combinan con los acumulados (Chan et al.). Para los cuantiles, los
+    bloques se copian a grupos de columnas que caben en memoria_mb, y cada
+    columna se ordena por (cluster, valor) con np.lexsort. Los cuantiles
+    usan interpolación lineal, como pandas.
+
+    Args:
+        X: Matriz n×p (puede ser un memmap)
+        labels: Etiquetas enteras 0..k-1
+        columnas: Nombres de las p variables
+        n_clusters: Número de clusters (None = máximo de labels + 1)
+        tamano_bloque: Filas por bloque
+        memoria_mb: Memoria aproximada de cada grupo de columnas
+
+    Returns:
+        DataFrame con Cluster, Variable, N, Media, Desviacion (ddof=1), Q1,
+        Mediana, Q3, Media_Global, Desviacion_Global y
+        Diferencia_Estandarizada ((media - media global) / desviación global)
+    """
+    labels = np.asarray(labels)
+    n = len(labels)
+    k = int(labels.max()) + 1 if n_clusters is None else n_clusters
+    tamanos = np.bincount(labels, minlength=k)
+    presentes = np.flatnonzero(tamanos)
+    m = tamanos[presentes]
+    inicios = np.concatenate([[0], np.cumsum(m)[:-1]])
+    finales = inicios + m - 1
+
+    def cuantil(valores, q):
+        posicion = inicios + q * (m - 1)
+        bajo = np.floor(posicion).astype(np.int64)
+        alto = np.minimum(bajo + 1, finales)
+        return valores[bajo] + (posicion - bajo) * (valores[alto] - valores[bajo])
+
+    columnas = list(columnas)
+    p = len(columnas)
+
+    # Media y suma de cuadrados centrada de cada cluster, por bloques de filas
+    conteo = np.zeros(k)
+    medias = np.zeros((k, p))
+    cuadrados = np.zeros((k, p))
+    for inicio, bloque in _bloques(X, tamano_bloque):
+        etiquetas = labels[inicio:inicio + len(bloque)]
+        bloque = bloque[np.argsort(etiquetas, kind='stable')]
+        conteo_b = np.bincount(etiquetas, minlength=k)
+        en_bloque = np.flatnonzero(conteo_b)
+        n_b = conteo_b[en_bloque]
+        tramos = np.concatenate([[0], np.cumsum(n_b)[:-1]])
+        medias_b = np.add.reduceat(bloque, tramos, axis=0) / n_b[:, None]
+        cuadrados_b = np.add.reduceat((bloque - np.repeat(medias_b, n_b, axis=0)) ** 2, tramos,
+                                      axis=0)
+
+        n_a = conteo[en_bloque]
+        total = n_a + n_b
+        delta = medias_b - medias[en_bloque]
+        medias[en_bloque] += delta * (n_b / total)[:, None]
+        cuadrados[en_bloque] += cuadrados_b + delta ** 2 * (n_a * n_b / total)[:, None]
+        conteo[en_bloque] = total
+
+    medias, cuadrados = medias[presentes], cuadrados[presentes]
+    media_global = m @ medias / n
+    cuadrados_global = cuadrados.sum(axis=0) + m @ (medias - media_global) ** 2
+    estadisticas = {'Media': medias}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        estadisticas['Desviacion'] = np.sqrt(cuadrados / (m - 1)[:, None])
+        desviacion_global = np.sqrt(cuadrados_global / (n - 1))
+
+    # Cuantiles por grupos de columnas (cada columna contigua en memoria)
+    cuantiles = {'Q1': 0.25, 'Mediana': 0.5, 'Q3': 0.75}
+    for nombre in cuantiles:
+        estadisticas[nombre] = np.empty((len(presentes), p))
+    por_grupo = max(1, int(memoria_mb * 2 ** 20 // (8 * n)))
+    # Clave de cluster en el entero más pequeño posible (lexsort la ordena más rápido)
+    clave = labels.astype(np.min_scalar_type(k))
+    for primera in range(0, p, por_grupo):
+        ultima = min(p, primera + por_grupo)
+        grupo = np.empty((ultima - primera, n))
+        for inicio in range(0, n, tamano_bloque):
+            grupo[:, inicio:inicio + tamano_bloque] = X[inicio:inicio + tamano_bloque,
+                                                        primera:ultima].T
+        for j in range(primera, ultima):
+            valores = grupo[j - primera]
+            ordenados = valores[np.lexsort((valores, clave))]
+            for nombre, q in cuantiles.items():
+                estadisticas[nombre][:, j] = cuantil(ordenados, q)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        diferencia = (estadisticas['Media'] - media_global) / desviacion_global
+    diferencia[~np.isfinite(diferencia)] = 0.0
+
+    return pd.DataFrame({
+        'Cluster': np.repeat(presentes, p),
+        'Variable': np.tile(columnas, len(presentes)),
+        'N': np.repeat(m, p),
+        **{nombre: valores.ravel() for nombre, valores in estadisticas.items()},
+        'Media_Global': np.tile(media_global, len(presentes)),
+        'Desviacion_Global': np.tile(desviacion_global, len(presentes)),
+        'Diferencia_Estandarizada': diferencia.ravel(),
+    })
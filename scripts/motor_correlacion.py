@@ -0,0 +1,281 @@
+"""
+Motor de correlación
+Calcula una sola vez por conjunto de datos la matriz de correlación p×p,
+su descomposición espectral y su inversa, y las comparte entre PCA,
+Bartlett, KMO y el análisis factorial. Tras ese cálculo (una pasada
+O(n·p²) sobre los datos) todos los consumidores trabajan solo con
+objetos p×p, independientes de n.
+"""
+
+from pathlib import Path
+
+import numpy as np
+from scipy.stats import chi2
+
+from cache_datos import DIRECTORIO_CACHE, escribir_atomico
+from perfilado import perfilar
+
+# Estructuras ya calculadas en este proceso, por clave de la matriz
+_MEMORIA = {}
+
+def calcular_estructura(datos_estandarizados, tamano_bloque=100_000):
+    """
+    Calcula correlación, autovalores/autovectores e inversa
+
+    Args:
+        datos_estandarizados: Matriz n×p estandarizada (puede ser un memmap)
+        tamano_bloque: Filas por bloque al acumular Zᵀ·Z
+
+    Returns:
+        dict con 'n', 'p', 'R', 'autovalores' (descendentes),
+        'autovectores' (en columnas) y 'R_inv'
+    """
+    n, p = datos_estandarizados.shape
+
+    # Zᵀ·Z por bloques, acumulando en float64 aunque Z sea float32
+    R = np.zeros((p, p))
+    for inicio in range(0, n, tamano_bloque):
+        bloque = np.asarray(datos_estandarizados[inicio:inicio + tamano_bloque], dtype=np.float64)
+        R += bloque.T @ bloque
+    R /= n
+
+    # Normalizar a correlación exacta; las columnas constantes quedan en 0,
+    # como en la matriz de covarianzas que ve PCA
+    varianzas = np.diag(R).copy()
+    escala = np.sqrt(np.where(varianzas > 0, varianzas, 1.0))
+    R /= np.outer(escala, escala)
+    np.fill_diagonal(R, np.where(varianzas > 0, 1.0, 0.0))
+
+    autovalores, autovectores = np.linalg.eigh(R)
+    orden = np.argsort(autovalores)[::-1]
+    autovalores = autovalores[orden]
+    autovectores = autovectores[:, orden]
+
+    try:
+        R_inv = np.linalg.inv(R)
+    except np.linalg.LinAlgError:
+        R_inv = np.linalg.pinv(R)
+
+    return {
+        'n': n,
+        'p': p,
+        'R': R,
+        'autovalores': autovalores,
+        'autovectores': autovectores,
+        'R_inv': R_inv,
+    }
+
+@perfilar(categoria='datos')
+def obtener_estructura(datos, directorio_cache=DIRECTORIO_CACHE):
+    """
+    Devuelve la estructura de correlación de una matriz de preprocesamiento
+    (resultado de preparar_matriz), calculándola solo la primera vez.
+    Se guarda en memoria y en cache/correlacion/ para otros procesos.
+    """
+    clave = datos['clave']
+    if clave in _MEMORIA:
+        return _MEMORIA[clave]
+
+    ruta = Path(directorio_cache) / 'correlacion' / f'{clave}.npz'
+    if ruta.exists():
+        with np.load(ruta) as archivo:
+            estructura = {k: archivo[k] for k in archivo.files}
+        estructura['n'] = int(estructura['n'])
+        estructura['p'] = int(estructura['p'])
+    else:
+        estructura = calcular_estructura(datos['estandarizada'])
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+
+        def escribir(tmp):
+            with open(tmp, 'wb') as f:
+                np.savez(f, **estructura)
+        escribir_atomico(ruta, escribir)
+
+    _MEMORIA[clave] = estructura
+    return estructura
+
+def bartlett(estructura):
+    """
+    Test de esfericidad de Bartlett sobre log|R| (mismo estadístico que
+    calculate_bartlett_sphericity)
+
+    Las variables constantes (diagonal 0 en R) no entran en el test. Si R
+    sigue siendo singular (variables colineales), el estadístico no está
+    definido y se devuelve (nan, nan).
+    """
+    activas = np.diag(estructura['R']) > 0
+    R = estructura['R'][np.ix_(activas, activas)]
+    n, p = estructura['n'], len(R)
+    signo, log_det = np.linalg.slogdet(R)
+    if signo <= 0:
+        return np.nan, np.nan
+    estadistico = -log_det * (n - 1 - (2 * p + 5) / 6)
+    grados_libertad = p * (p - 1) / 2
+    return estadistico, chi2.sf(estadistico, grados_libertad)
+
+def correlaciones_parciales(R_inv):
+    """Correlaciones parciales (anti-imagen) a partir de la inversa de R"""
+    d = np.sqrt(np.diag(R_inv))
+    parcial = -R_inv / np.outer(d, d)
+    np.fill_diagonal(parcial, 1.0)
+    return parcial
+
+def kmo(estructura):
+    """
+    Medida KMO por variable (MSA) y global a partir de R y su inversa
+    (mismo resultado que calculate_kmo)
+    """
+    r2 = estructura['R'] ** 2
+    a2 = correlaciones_parciales(estructura['R_inv']) ** 2
+    np.fill_diagonal(r2, 0)
+    np.fill_diagonal(a2, 0)
+
+    suma_r = r2.sum(axis=0)
+    suma_a = a2.sum(axis=0)
+    kmo_por_variable = suma_r / (suma_r + suma_a)
+    kmo_total = suma_r.sum() / (suma_r.sum() + suma_a.sum())
+    return kmo_por_variable, kmo_total
+
+def _msa(R, R_inv):
+    """MSA por variable y KMO global de R (cualquier subconjunto) dada su inversa"""
+    d = np.sqrt(np.diag(R_inv))
+    r2 = R ** 2
+    a2 = (R_inv / np.outer(d, d)) ** 2
+    suma_r = r2.sum(axis=0) - np.diag(r2)
+    suma_a = a2.sum(axis=0) - np.diag(a2)
+    return suma_r / (suma_r + suma_a), suma_r.sum() / (suma_r.sum() + suma_a.sum())
+
+def depurar_kmo(estructura, umbral=0.5, minimo_variables=3):
+    """
+    Elimina una a una las variables con menor MSA hasta que todas superen
+    el umbral
+
+    Quitar la variable j de R no obliga a invertir de nuevo: la inversa de
+    la submatriz es R_inv[-j,-j] - R_inv[-j,j]·R_inv[j,-j] / R_inv[j,j]
+    (complemento de Schur, actualización de rango uno). Cada paso cuesta
+    O(p²) en vez de O(p³).
+
+    Args:
+        estructura: Estructura de correlación (ver calcular_estructura)
+        umbral: MSA mínimo que deben tener las variables que quedan
+        minimo_variables: No se baja de este número de variables
+
+    Returns:
+        dict con 'activas' (máscara de las variables que quedan),
+        'trayectoria' (lista de dicts por paso: índice eliminado, su MSA y
+        KMO global antes y después), 'kmo_por_variable' y 'kmo_total'
+        finales, y 'R_inv' (inversa de la submatriz final)
+    """
+    R = estructura['R']
+    R_inv = estructura['R_inv'].copy()
+    indices = np.arange(len(R))
+    msa, kmo_total = _msa(R, R_inv)
+
+    trayectoria = []
+    while len(indices) > minimo_variables and msa.min() < umbral:
+        j = int(np.argmin(msa))
+        resto = np.arange(len(indices)) != j
+        columna = R_inv[resto, j]
+        R_inv = R_inv[np.ix_(resto, resto)] - np.outer(columna, columna) / R_inv[j, j]
+
+        eliminada, msa_eliminada, kmo_antes = indices[j], msa[j], kmo_total
+        indices = indices[resto]
+        msa, kmo_total = _msa(R[np.ix_(indices, indices)], R_inv)
+        trayectoria.append({'indice': int(eliminada), 'msa': float(msa_eliminada),
+                            'kmo_antes': float(kmo_antes), 'kmo_despues': float(kmo_total)})
+
+    activas = np.zeros(len(R), dtype=bool)
+    activas[indices] = True
+    return {'activas': activas, 'trayectoria': trayectoria, 'kmo_por_variable': msa,
+            'kmo_total': kmo_total, 'R_inv': R_inv}
+
+def subestructura(estructura, activas, R_inv=None):
+    """
+    Estructura de correlación de un subconjunto de variables (sin volver a
+    recorrer los datos): submatriz de R, su descomposición y su inversa
+    (R_inv, si ya se conoce, p. ej. de depurar_kmo)
+    """
+    R = estructura['R'][np.ix_(activas, activas)]
+    autovalores, autovectores = np.linalg.eigh(R)
+    orden = np.argsort(autovalores)[::-1]
+    if R_inv is None:
+        try:
+            R_inv = np.linalg.inv(R)
+        except np.linalg.LinAlgError:
+            R_inv = np.linalg.pinv(R)
+    return {
+        'n': estructura['n'],
+        'p': len(R),
+        'R': R,
+        'autovalores': autovalores[orden],
+        'autovectores': autovectores[:, orden],
+        'R_inv': R_inv,
+    }
+
+def componentes_retenidos(estructura, criterio='kaiser'):
+    """
+    Número de componentes a retener según los autovalores de R
+
+    Args:
+        criterio: 'kaiser' (varianza > 1, como en la etapa de PCA) o un
+            umbral de varianza acumulada entre 0 y 1 (p. ej. 0.8)
+    """
+    n = estructura['n']
+    autovalores = estructura['autovalores']
+    if criterio == 'kaiser':
+        return int(np.sum(autovalores * n / (n - 1) > 1))
+    acumulada = np.cumsum(autovalores) / np.trace(estructura['R'])
+    return int(min(np.searchsorted(acumulada, criterio) + 1, len(acumulada)))
+
+def componentes_principales(estructura, datos_estandarizados, n_components=None,
+                            tamano_bloque=100_000, salida=None):
+    """
+    Componentes principales a partir de la descomposición de R
+
+    Proyecta los datos sobre los primeros autovectores y fija los signos con
+    la misma convención que sklearn.decomposition.PCA (el elemento de mayor
+    valor absoluto de cada columna de puntuaciones es positivo). Las
+    puntuaciones se escriben por bloques en salida (p. ej. un memmap en
+    disco); el elemento de mayor valor absoluto se sigue mientras tanto y
+    los signos se corrigen en una segunda pasada por bloques.
+
+    Args:
+        salida: Array n×k donde escribir las puntuaciones (None = nuevo
+            array en memoria)
+
+    Returns:
+        dict con 'puntuaciones' (n×k), 'componentes' (k×p), 'varianza'
+        (autovalores con ddof=1, como explained_variance_) y 'proporcion'
+    """
+    n, p = estructura['n'], estructura['p']
+    k = n_components or p
+    V = estructura['autovectores'][:, :k].copy()
+
+    puntuaciones = np.empty((n, k)) if salida is None else salida
+    # Mayor |puntuación| de cada columna y su valor (la primera, como argmax)
+    maximo = np.full(k, -1.0)
+    extremo = np.zeros(k)
+    for inicio in range(0, n, tamano_bloque):
+        bloque = np.asarray(datos_estandarizados[inicio:inicio + tamano_bloque], dtype=np.float64)
+        proyeccion = bloque @ V
+        filas = np.argmax(np.abs(proyeccion), axis=0)
+        valores = proyeccion[filas, np.arange(k)]
+        mayor = np.abs(valores) > maximo
+        maximo[mayor] = np.abs(valores[mayor])
+        extremo[mayor] = valores[mayor]
+        puntuaciones[inicio:inicio + len(bloque)] = proyeccion
+
+    signos = np.sign(extremo)
+    signos[signos == 0] = 1
+    if (signos < 0).any():
+        for inicio in range(0, n, tamano_bloque):
+            puntuaciones[inicio:inicio + tamano_bloque] *= signos
+    V *= signos
+
+    autovalores = estructura['autovalores']
+    return {
+        'puntuaciones': puntuaciones,
+        'componentes': V.T,
+        'varianza': autovalores[:k] * n / (n - 1),
+        'proporcion': autovalores[:k] / np.trace(estructura['R']),
+    }
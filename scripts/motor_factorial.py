@@ -0,0 +1,245 @@
+"""
+Motor factorial
+Ajusta una rejilla de soluciones del AFE (método de extracción × número de
+factores × rotación) a partir de una sola matriz de correlación.
+
+Solo la extracción es iterativa: cada (método, n_factores) se ajusta una
+vez, sin rotar, en un pool de procesos que comparte R (paralelo.py). Las
+rotaciones se aplican después sobre esas cargas con Rotator, sin volver a
+ajustar. Los índices de ajuste dependen solo de la extracción (la rotación
+no cambia la matriz reproducida); la congruencia de Tucker compara
+soluciones emparejando sus factores.
+
+El bootstrap de cargas remuestrea filas con pesos multinomiales: cada
+réplica acumula Σw·x y Σw·x·xᵀ por bloques sobre la matriz compartida (sin
+copiar filas), reajusta el modelo sobre su correlación, rota y alinea el
+resultado con la solución de referencia por Procrustes ortogonal.
+"""
+
+import warnings
+
+import numpy as np
+from factor_analyzer import FactorAnalyzer, Rotator
+from factor_analyzer.rotator import OBLIQUE_ROTATIONS
+from scipy.linalg import orthogonal_procrustes
+from scipy.optimize import linear_sum_assignment
+from scipy.stats import chi2
+
+from paralelo import mapa_compartido
+
+def _extraer(R, metodo, n_factores):
+    """Cargas sin rotar de un (método, n_factores) sobre R"""
+    fa = FactorAnalyzer(n_factors=n_factores, method=metodo, rotation=None, is_corr_matrix=True)
+    fa.fit(np.asarray(R))
+    return fa.loadings_
+
+def rotar_cargas(cargas, rotacion):
+    """
+    Rota cargas ya extraídas, con el mismo post-proceso que FactorAnalyzer
+    (signos según la suma de cada columna, factores ordenados de mayor a menor
+    varianza con el mismo argsort invertido, así que los empates quedan igual).
+    Los signos se alinean también con un solo factor, que FactorAnalyzer deja
+    como salen de la extracción
+
+    Returns:
+        (cargas rotadas, matriz de correlación entre factores phi)
+    """
+    k = cargas.shape[1]
+    phi = np.eye(k)
+    if rotacion is not None and k > 1:
+        rotador = Rotator(method=rotacion)
+        cargas = rotador.fit_transform(cargas)
+        if rotador.phi_ is not None:
+            phi = rotador.phi_
+
+    signos = np.sign(cargas.sum(axis=0))
+    signos[signos == 0] = 1
+    cargas = cargas * signos
+    phi = phi * np.outer(signos, signos)
+
+    orden = np.argsort((cargas ** 2).sum(axis=0))[::-1]
+    return cargas[:, orden], phi[np.ix_(orden, orden)]
+
+def indices_ajuste(R, cargas, n):
+    """
+    Índices de ajuste de una extracción (invariantes a la rotación)
+
+    Returns:
+        dict con RMSR y residuo máximo (fuera de la diagonal), proporción de
+        residuos > 0.05, chi² de máxima verosimilitud con corrección de
+        Bartlett, gl, p-valor, RMSEA, BIC y comunalidad media
+    """
+    p, k = cargas.shape
+    reproducida = cargas @ cargas.T
+    comunalidades = np.diag(reproducida).copy()
+    np.fill_diagonal(reproducida, 1.0)
+
+    residuos = (R - reproducida)[np.triu_indices(p, 1)]
+    indices = {
+        'RMSR': float(np.sqrt(np.mean(residuos ** 2))),
+        'Residuo_Max': float(np.abs(residuos).max()),
+        'Residuos_05': float(np.mean(np.abs(residuos) > 0.05)),
+    }
+
+    # Discrepancia ML entre R y la matriz implicada por el modelo
+    signo_s, logdet_s = np.linalg.slogdet(reproducida)
+    signo_r, logdet_r = np.linalg.slogdet(R)
+    gl = ((p - k) ** 2 - (p + k)) / 2
+    if signo_s > 0 and signo_r > 0:
+        discrepancia = logdet_s - logdet_r + np.trace(np.linalg.solve(reproducida, R)) - p
+        estadistico = (n - 1 - (2 * p + 5) / 6 - 2 * k / 3) * discrepancia
+    else:
+        estadistico = np.nan
+    indices.update({
+        'Chi2': estadistico,
+        'gl': gl,
+        'p_Chi2': chi2.sf(estadistico, gl) if gl > 0 else np.nan,
+        'RMSEA': (np.sqrt(max(estadistico - gl, 0) / (gl * (n - 1))) if gl > 0 else np.nan),
+        'BIC': estadistico - gl * np.log(n),
+        'Comunalidad_Media': float(comunalidades.mean()),
+    })
+    return indices
+
+def congruencia_emparejada(A, B):
+    """
+    Congruencia de Tucker entre dos matrices de cargas, emparejando cada
+    factor de la más pequeña con uno distinto de la otra (asignación que
+    maximiza la |congruencia| total)
+
+    Returns:
+        Vector de |congruencias| de los factores emparejados
+    """
+    A = A / np.linalg.norm(A, axis=0)
+    B = B / np.linalg.norm(B, axis=0)
+    congruencia = np.abs(A.T @ B)
+    filas, columnas = linear_sum_assignment(-congruencia)
+    return congruencia[filas, columnas]
+
+def rejilla_soluciones(estructura, metodos, rotaciones, valores_n, n_workers=None):
+    """
+    Ajusta todas las combinaciones de extracción, número de factores y rotación
+
+    Args:
+        estructura: Estructura de correlación (motor_correlacion)
+        metodos: Métodos de extracción de FactorAnalyzer ('minres', 'ml', ...)
+        rotaciones: Rotaciones de Rotator ('varimax', 'promax', ...; None = sin rotar)
+        valores_n: Números de factores
+        n_workers: Procesos para las extracciones (None = núcleos disponibles)
+
+    Returns:
+        Lista de dicts con 'metodo', 'n_factores', 'rotacion', 'cargas',
+        'phi' y los índices de ajuste de la extracción
+    """
+    R = estructura['R']
+    tareas = [(metodo, n) for metodo in metodos for n in valores_n]
+    extracciones = mapa_compartido(_extraer, R, tareas, n_workers)
+
+    soluciones = []
+    for (metodo, n), cargas in zip(tareas, extracciones):
+        ajuste = indices_ajuste(R, cargas, estructura['n'])
+        for rotacion in rotaciones:
+            rotadas, phi = rotar_cargas(cargas, rotacion)
+            soluciones.append({'metodo': metodo, 'n_factores': n, 'rotacion': rotacion,
+                               'oblicua': rotacion in OBLIQUE_ROTATIONS,
+                               'cargas': rotadas, 'phi': phi, **ajuste})
+    return soluciones
+
+def correlacion_ponderada(X, pesos, tamano_bloque=50_000):
+    """
+    Matriz de correlación de X con cada fila repetida pesos[i] veces,
+    acumulada por bloques (X puede ser un memmap; no se copian filas)
+    """
+    p = X.shape[1]
+    total = pesos.sum()
+    suma = np.zeros(p)
+    productos = np.zeros((p, p))
+    for inicio in range(0, len(X), tamano_bloque):
+        w = pesos[inicio:inicio + tamano_bloque]
+        usadas = w > 0
+        bloque = np.asarray(X[inicio:inicio + tamano_bloque][usadas], dtype=np.float64)
+        w = w[usadas]
+        suma += w @ bloque
+        productos += (bloque * w[:, None]).T @ bloque
+
+    media = suma / total
+    covarianza = productos / total - np.outer(media, media)
+    # Columnas sin variación en la réplica: correlación 0 con el resto
+    varianzas = np.diag(covarianza).copy()
+    escala = np.sqrt(np.where(varianzas > 1e-12, varianzas, 1.0))
+    R = covarianza / np.outer(escala, escala)
+    np.fill_diagonal(R, 1.0)
+    return R
+
+def _replicas_bootstrap(X, semilla, n_replicas, referencia, metodo, rotacion, tamano_bloque):
+    """
+    Cargas alineadas con la referencia de n_replicas réplicas bootstrap, y
+    la correlación entre factores de cada una (identidad si la rotación es
+    ortogonal)
+    """
+    rng = np.random.default_rng(semilla)
+    n = len(X)
+    n_factores = referencia.shape[1]
+    cargas = np.empty((n_replicas,) + referencia.shape)
+    phis = np.empty((n_replicas, n_factores, n_factores))
+    for r in range(n_replicas):
+        # Pesos multinomiales: cuántas veces sale cada fila en la réplica
+        pesos = np.bincount(rng.integers(0, n, n), minlength=n).astype(np.float64)
+        R = correlacion_ponderada(X, pesos, tamano_bloque)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            sin_rotar = _extraer(R, metodo, n_factores)
+        rotadas, phi = rotar_cargas(sin_rotar, rotacion)
+        # Rotación ortogonal (incluye permutaciones y signos) más cercana a la
+        # referencia; phi se transforma igual para que Λ·Φ·Λᵀ no cambie
+        T, _ = orthogonal_procrustes(rotadas, referencia)
+        cargas[r] = rotadas @ T
+        phis[r] = T.T @ phi @ T
+    return cargas, phis
+
+def bootstrap_cargas(X, referencia, metodo='minres', rotacion='varimax', n_replicas=1000,
+                     semilla=42, confianza=0.95, replicas_por_tarea=25, n_workers=None,
+                     tamano_bloque=50_000):
+    """
+    Intervalos bootstrap de cargas y comunalidades
+
+    Args:
+        X: Datos n×p (imputados; puede ser un memmap), mismas columnas que
+            referencia
+        referencia: Cargas p×k de la solución a evaluar
+        metodo, rotacion: Extracción y rotación de la solución de referencia
+        n_replicas: Réplicas bootstrap
+        semilla: Semilla; cada tarea usa un flujo independiente
+            (SeedSequence.spawn), así que el resultado no depende del
+            número de procesos
+        confianza: Nivel de los intervalos percentiles
+        replicas_por_tarea: Réplicas por tarea del pool
+
+    Returns:
+        dict con 'cargas' (réplicas×p×k alineadas), 'media', 'error_estandar',
+        'ic_inf', 'ic_sup' de las cargas y 'comunalidades' (réplicas×p, la
+        diagonal de Λ·Φ·Λᵀ, válida también con rotaciones oblicuas) con sus
+        'comunalidad_ic_inf', 'comunalidad_ic_sup' y
+        'comunalidad_error_estandar'
+    """
+    tamanos = [min(replicas_por_tarea, n_replicas - inicio)
+               for inicio in range(0, n_replicas, replicas_por_tarea)]
+    semillas = np.random.SeedSequence(semilla).spawn(len(tamanos))
+    tareas = [(s, t, referencia, metodo, rotacion, tamano_bloque)
+              for s, t in zip(semillas, tamanos)]
+    lotes = mapa_compartido(_replicas_bootstrap, X, tareas, n_workers)
+    cargas = np.concatenate([lote[0] for lote in lotes])
+    phis = np.concatenate([lote[1] for lote in lotes])
+
+    alfa = (1 - confianza) / 2 * 100
+    comunalidades = np.einsum('rij,rjk,rik->ri', cargas, phis, cargas)
+    return {
+        'cargas': cargas,
+        'media': cargas.mean(axis=0),
+        'error_estandar': cargas.std(axis=0, ddof=1),
+        'ic_inf': np.percentile(cargas, alfa, axis=0),
+        'ic_sup': np.percentile(cargas, 100 - alfa, axis=0),
+        'comunalidades': comunalidades,
+        'comunalidad_error_estandar': comunalidades.std(axis=0, ddof=1),
+        'comunalidad_ic_inf': np.percentile(comunalidades, alfa, axis=0),
+        'comunalidad_ic_sup': np.percentile(comunalidades, 100 - alfa, axis=0),
+    }
@@ -0,0 +1,111 @@
+"""
+Paralelismo dentro de una etapa
+Reparte tareas independientes entre procesos que leen una misma matriz
+desde memoria compartida (una sola copia para todos los workers) y limita
+los hilos BLAS/OpenMP de cada worker para no sobresuscribir los núcleos.
+Si la matriz ya es un .npy mapeado en memoria, los workers abren el mismo
+archivo en vez de copiarlo.
+
+Cuando las etapas ya corren en paralelo (planificador.py), el planificador
+fija WORKERS_ETAPA para que cada etapa use solo su parte de los núcleos.
+"""
+
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+from threadpoolctl import threadpool_limits
+
+# Matriz compartida abierta en cada worker (la fija _inicializar)
+_X = None
+_SEGMENTO = None
+
+def workers_disponibles():
+    """Procesos que puede usar una etapa (WORKERS_ETAPA o núcleos disponibles)"""
+    return int(os.environ.get('WORKERS_ETAPA', 0)) or os.cpu_count() or 1
+
+def _archivo_mapeado(X):
+    """Descriptor del archivo si X es un memmap completo (o una vista entera de él)"""
+    base = X
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    if (base is None or not isinstance(base.base, mmap.mmap) or base.filename is None
+            or X.shape != base.shape or not X.flags.c_contiguous
+            or X.__array_interface__['data'][0] != base.__array_interface__['data'][0]):
+        return None
+    return {'ruta': base.filename, 'desplazamiento': base.offset,
+            'forma': X.shape, 'dtype': X.dtype.str}
+
+@contextmanager
+def matriz_compartida(X):
+    """
+    Copia X a un segmento de memoria compartida mientras dure el bloque
+    (los memmaps no se copian: se comparte su archivo)
+
+    Yields:
+        Descriptor (nombre o ruta, forma, dtype) para abrirla en otros
+        procesos; None si X es None
+    """
+    if X is None:
+        yield None
+        return
+
+    archivo = _archivo_mapeado(X)
+    if archivo is not None:
+        yield archivo
+        return
+
+    X = np.asarray(X)
+    segmento = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+    try:
+        np.ndarray(X.shape, dtype=X.dtype, buffer=segmento.buf)[:] = X
+        yield {'nombre': segmento.name, 'forma': X.shape, 'dtype': X.dtype.str}
+    finally:
+        segmento.close()
+        segmento.unlink()
+
+def _inicializar(descriptor, hilos):
+    global _X, _SEGMENTO
+    threadpool_limits(limits=hilos)
+    if descriptor is None:
+        return
+    if 'ruta' in descriptor:
+        _X = np.memmap(descriptor['ruta'], dtype=np.dtype(descriptor['dtype']), mode='r',
+                       offset=descriptor['desplazamiento'], shape=descriptor['forma'])
+        return
+    _SEGMENTO = shared_memory.SharedMemory(name=descriptor['nombre'])
+    _X = np.ndarray(descriptor['forma'], dtype=np.dtype(descriptor['dtype']), buffer=_SEGMENTO.buf)
+    _X.flags.writeable = False
+
+def _llamar(funcion, tarea):
+    return funcion(_X, *tarea)
+
+def mapa_compartido(funcion, X, tareas, n_workers=None):
+    """
+    Ejecuta funcion(X, *tarea) para cada tarea en un pool de procesos
+
+    Args:
+        funcion: Función de nivel de módulo (importable por los workers)
+        X: Matriz que reciben todas las tareas (se comparte, no se copia
+           por tarea); None si las tareas no necesitan datos
+        tareas: Lista de tuplas de argumentos adicionales
+        n_workers: Procesos (None = workers_disponibles()); con 1 se
+                   ejecuta en el proceso actual
+
+    Returns:
+        Lista de resultados en el orden de las tareas
+    """
+    n_workers = min(n_workers or workers_disponibles(), len(tareas))
+    if n_workers <= 1:
+        return [funcion(X, *tarea) for tarea in tareas]
+
+    # Hilos BLAS por worker: los núcleos de la etapa repartidos entre los workers
+    hilos = max(1, workers_disponibles() // n_workers)
+    with matriz_compartida(X) as descriptor:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_inicializar,
+                                 initargs=(descriptor, hilos)) as pool:
+            futuros = [pool.submit(_llamar, funcion, tarea) for tarea in tareas]
+            return [futuro.result() for futuro in futuros]
@@ -0,0 +1,207 @@
+"""
+Perfilado de etapas
+Registra, para cada función instrumentada, tiempo de reloj, tiempo de CPU,
+pico de memoria de Python (tracemalloc) y RSS máximo del proceso. Al final
+de la ejecución se guarda un resumen JSON por función y una traza en
+formato Chrome Trace (se abre en https://ui.perfetto.dev o chrome://tracing).
+
+Desactivado (por defecto) el decorador solo consulta una variable global,
+y las funciones de las etapas ni siquiera se envuelven.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_ACTIVO = False
+_MEMORIA = False
+_EVENTOS = []
+# Picos de memoria de las funciones en curso (para medir llamadas anidadas)
+_PILA = []
+
+def activar(memoria=True):
+    """Activa el perfilado en este proceso (memoria=True también mide tracemalloc)"""
+    global _ACTIVO, _MEMORIA
+    _ACTIVO = True
+    _MEMORIA = memoria
+    if memoria and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def activo():
+    return _ACTIVO
+
+def _rss_maximo_mb():
+    if resource is None:
+        return None
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _medir(nombre, categoria, funcion, *args, **kwargs):
+    inicio_epoca = time.time()
+    inicio = time.perf_counter()
+    inicio_cpu = time.process_time()
+
+    if _MEMORIA:
+        memoria_inicial, pico_padre = tracemalloc.get_traced_memory()
+        _PILA.append(0)
+        tracemalloc.reset_peak()
+
+    try:
+        return funcion(*args, **kwargs)
+    finally:
+        duracion = time.perf_counter() - inicio
+        cpu = time.process_time() - inicio_cpu
+        pico_mb = None
+
+        if _MEMORIA:
+            _, pico = tracemalloc.get_traced_memory()
+            pico = max(pico, _PILA.pop())
+            pico_mb = (pico - memoria_inicial) / 2**20
+            # reset_peak borró el pico de la función que llamó: se conserva aparte
+            if _PILA:
+                _PILA[-1] = max(_PILA[-1], pico_padre, pico)
+
+        _EVENTOS.append({
+            'nombre': nombre,
+            'categoria': categoria,
+            'inicio': inicio_epoca,
+            'duracion_s': duracion,
+            'cpu_s': cpu,
+            'pico_memoria_mb': pico_mb,
+            'rss_maximo_mb': _rss_maximo_mb(),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        })
+
+def perfilar(funcion=None, nombre=None, categoria='funcion'):
+    """
+    Decorador que mide una función cuando el perfilado está activo
+
+    Uso: @perfilar o @perfilar(categoria='datos')
+    """
+    if funcion is None:
+        return functools.partial(perfilar, nombre=nombre, categoria=categoria)
+
+    etiqueta = nombre or f"{funcion.__module__}.{funcion.__qualname__}"
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if not _ACTIVO:
+            return funcion(*args, **kwargs)
+        return _medir(etiqueta, categoria, funcion, *args, **kwargs)
+
+    envoltura.__perfilada__ = True
+    return envoltura
+
+def tramo(nombre, funcion, *args, categoria='tramo', **kwargs):
+    """Ejecuta funcion(*args, **kwargs) midiéndola como un tramo con nombre"""
+    if not _ACTIVO:
+        return funcion(*args, **kwargs)
+    return _medir(nombre, categoria, funcion, *args, **kwargs)
+
+def instrumentar_modulo(modulo, categoria='paso'):
+    """
+    Envuelve con perfilar todas las funciones definidas en un módulo de
+    etapa (cargar_y_preparar_datos, realizar_pca, crear_*, ...). Las
+    llamadas entre ellas pasan por los globales del módulo, así que también
+    quedan medidas.
+    """
+    nombre_modulo = modulo.__name__
+    for nombre, objeto in list(vars(modulo).items()):
+        if (callable(objeto) and getattr(objeto, '__module__', None) == nombre_modulo
+                and not isinstance(objeto, type) and not getattr(objeto, '__perfilada__', False)
+                and nombre != 'main'):
+            setattr(modulo, nombre, perfilar(objeto, nombre=f"{nombre_modulo}.{nombre}",
+                                             categoria=categoria))
+
+def extraer_eventos():
+    """Devuelve y vacía los eventos registrados en este proceso"""
+    eventos = list(_EVENTOS)
+    _EVENTOS.clear()
+    return eventos
+
+def agregar_eventos(eventos):
+    """Incorpora eventos registrados en otro proceso (p. ej. un worker)"""
+    _EVENTOS.extend(eventos)
+
+def resumir(eventos):
+    """Totales por función: llamadas, reloj, CPU y máximos de memoria"""
+    resumen = {}
+    for e in eventos:
+        r = resumen.setdefault(e['nombre'], {
+            'categoria': e['categoria'], 'llamadas': 0, 'tiempo_s': 0.0, 'cpu_s': 0.0,
+            'pico_memoria_mb': None, 'rss_maximo_mb': None,
+        })
+        r['llamadas'] += 1
+        r['tiempo_s'] += e['duracion_s']
+        r['cpu_s'] += e['cpu_s']
+        for clave in ('pico_memoria_mb', 'rss_maximo_mb'):
+            if e[clave] is not None:
+                r[clave] = max(r[clave] or 0.0, e[clave])
+    return dict(sorted(resumen.items(), key=lambda kv: -kv[1]['tiempo_s']))
+
+def traza_chrome(eventos):
+    """Eventos en formato Chrome Trace (eventos completos 'X', tiempos en µs)"""
+    if not eventos:
+        return {'traceEvents': []}
+    origen = min(e['inicio'] for e in eventos)
+    return {
+        'displayTimeUnit': 'ms',
+        'traceEvents': [{
+            'name': e['nombre'].split('.')[-1],
+            'cat': e['categoria'],
+            'ph': 'X',
+            'ts': (e['inicio'] - origen) * 1e6,
+            'dur': e['duracion_s'] * 1e6,
+            'pid': e['pid'],
+            'tid': e['tid'],
+            'args': {
+                'funcion': e['nombre'],
+                'cpu_ms': round(e['cpu_s'] * 1000, 3),
+                'pico_memoria_mb': e['pico_memoria_mb'],
+                'rss_maximo_mb': e['rss_maximo_mb'],
+            },
+        } for e in eventos],
+    }
+
+def guardar(output_dir='../perfiles'):
+    """
+    Guarda el resumen y la traza de los eventos registrados
+
+    Returns:
+        (ruta del resumen, ruta de la traza)
+    """
+    Path(output_dir).mkdir(exist_ok=True)
+    marca = datetime.now().strftime('%Y%m%d-%H%M%S')
+    eventos = sorted(_EVENTOS, key=lambda e: e['inicio'])
+
+    ruta_resumen = Path(output_dir) / f'perfil_{marca}.json'
+    with open(ruta_resumen, 'w', encoding='utf-8') as f:
+        json.dump({'resumen': resumir(eventos), 'eventos': eventos}, f, indent=2, ensure_ascii=False)
+
+    ruta_traza = Path(output_dir) / f'traza_{marca}.json'
+    with open(ruta_traza, 'w', encoding='utf-8') as f:
+        json.dump(traza_chrome(eventos), f)
+
+    return ruta_resumen, ruta_traza
+
+def imprimir_resumen(n_filas=15):
+    """Imprime las funciones más lentas de los eventos registrados"""
+    print("\n🔎 PERFIL DE EJECUCIÓN (funciones más lentas):")
+    print("-" * 96)
+    print(f"   {'Función':<52} {'Llamadas':>8} {'Reloj (s)':>10} {'CPU (s)':>9} {'Pico (MB)':>10}")
+    for nombre, r in list(resumir(_EVENTOS).items())[:n_filas]:
+        pico = f"{r['pico_memoria_mb']:.1f}" if r['pico_memoria_mb'] is not None else '-'
+        print(f"   {nombre[-52:]:<52} {r['llamadas']:>8} {r['tiempo_s']:>10.2f} "
+              f"{r['cpu_s']:>9.2f} {pico:>10}")
+    print("-" * 96)
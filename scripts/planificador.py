@@ -0,0 +1,197 @@
+"""
+Planificador de etapas
+Ejecuta las etapas del análisis respetando sus dependencias: las que no
+dependen entre sí (PCA, AFE, Clustering, Discriminante) corren en paralelo
+en un pool de procesos. Un error en una etapa no detiene a las demás.
+
+Las etapas cuya huella (datos, parámetros y código) no cambió desde la
+última ejecución correcta se omiten y reutilizan sus salidas
+(ver almacen_artefactos.py).
+
+Con perfilar=True cada worker instrumenta las funciones de su etapa y
+devuelve los eventos medidos al proceso principal (ver perfilado.py).
+"""
+
+import contextlib
+import importlib.util
+import io
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from threadpoolctl import threadpool_limits
+
+import perfilado
+from almacen_artefactos import calcular_huella_etapa, registrar_salidas, restaurar_salidas
+
+# Cada etapa: archivo, nombre corto y etapas que deben terminar antes
+ETAPAS = {
+    1: {'archivo': '1_hoja_codificacion.py', 'nombre': 'Hoja de codificación', 'depende': []},
+    2: {'archivo': '2_analisis_pca.py', 'nombre': 'ACP', 'depende': []},
+    3: {'archivo': '3_analisis_afe.py', 'nombre': 'AFE', 'depende': []},
+    4: {'archivo': '4_analisis_clustering.py', 'nombre': 'Clustering', 'depende': []},
+    5: {'archivo': '5_analisis_discriminante.py', 'nombre': 'Análisis Discriminante', 'depende': []},
+    6: {'archivo': '6_analisis_comparativo.py', 'nombre': 'Análisis Comparativo', 'depende': [2, 3, 4, 5]},
+    7: {'archivo': '7_reflexion_critica.py', 'nombre': 'Plantilla de Reflexión', 'depende': [6]},
+}
+
+def cargar_modulo(nombre_archivo):
+    """Carga un módulo Python dinámicamente"""
+    ruta = Path(__file__).parent / nombre_archivo
+    spec = importlib.util.spec_from_file_location(nombre_archivo[:-3], ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+def ejecutar_etapa(id_etapa, capturar_salida=True, incremental=True, perfilar=False,
+                   workers_etapa=None):
+    """
+    Ejecuta el main() de una etapa y devuelve su estado.
+    Se usa tanto en el proceso principal como en los workers del pool.
+
+    Con incremental=True la etapa se omite si su huella no cambió.
+    Con perfilar=True se miden la etapa y cada una de sus funciones.
+    workers_etapa limita los procesos y los hilos BLAS que la etapa puede
+    usar internamente (ver paralelo.py).
+    """
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    limite_hilos = contextlib.nullcontext()
+    if workers_etapa is not None:
+        os.environ['WORKERS_ETAPA'] = str(workers_etapa)
+        limite_hilos = threadpool_limits(limits=workers_etapa)
+    if perfilar:
+        perfilado.activar()
+    archivo = ETAPAS[id_etapa]['archivo']
+    salida = io.StringIO()
+    inicio = time.perf_counter()
+    error = None
+    omitida = False
+
+    redireccion = contextlib.redirect_stdout(salida) if capturar_salida else contextlib.nullcontext()
+    with redireccion, limite_hilos:
+        try:
+            modulo = cargar_modulo(archivo)
+            incremental = incremental and hasattr(modulo, 'SALIDAS')
+            huella = calcular_huella_etapa(archivo, modulo) if incremental else None
+
+            if incremental and restaurar_salidas(archivo, huella):
+                omitida = True
+            else:
+                inicio_main = time.time()
+                if perfilar:
+                    perfilado.instrumentar_modulo(modulo)
+                perfilado.tramo(f"Etapa {id_etapa}: {ETAPAS[id_etapa]['nombre']}", modulo.main,
+                                categoria='etapa')
+                if incremental:
+                    registrar_salidas(archivo, huella, modulo.SALIDAS, inicio_main)
+        except Exception as e:
+            error = f"{e}\n{traceback.format_exc()}"
+
+    return {
+        'id': id_etapa,
+        'ok': error is None,
+        'omitida': omitida,
+        'error': error,
+        'tiempo': time.perf_counter() - inicio,
+        'salida': salida.getvalue(),
+        'eventos': perfilado.extraer_eventos(),
+    }
+
+def _listas(pendientes, terminadas):
+    return [i for i in sorted(pendientes) if all(d in terminadas for d in ETAPAS[i]['depende'])]
+
+def _informar(resultado, n_total, mostrar_salida):
+    etapa = ETAPAS[resultado['id']]
+    if resultado['omitida']:
+        print(f"⏭️  [{resultado['id']}/{n_total}] {etapa['nombre']} sin cambios "
+              f"(salidas reutilizadas)")
+        return
+    if mostrar_salida and resultado['salida']:
+        print(resultado['salida'], end='' if resultado['salida'].endswith('\n') else '\n')
+    if resultado['ok']:
+        print(f"✅ [{resultado['id']}/{n_total}] {etapa['nombre']} completado "
+              f"({resultado['tiempo']:.1f} s)")
+    else:
+        print(f"❌ [{resultado['id']}/{n_total}] Error en {etapa['nombre']}: "
+              f"{resultado['error'].splitlines()[0]}")
+        print("Continuando con el resto de análisis...")
+
+def ejecutar_etapas(ids=None, n_workers=None, secuencial=False, mostrar_salida=True,
+                    incremental=True, perfilar=False):
+    """
+    Ejecuta las etapas indicadas respetando dependencias
+
+    Args:
+        ids: Etapas a ejecutar (None = todas)
+        n_workers: Procesos del pool (None = núcleos disponibles)
+        secuencial: Ejecutar una tras otra en el proceso actual
+        mostrar_salida: Imprimir la salida de cada etapa al terminar
+        incremental: Omitir etapas sin cambios (False = recalcular todo)
+        perfilar: Medir tiempos y memoria de cada función de las etapas;
+            los eventos se acumulan en perfilado del proceso principal
+
+    Returns:
+        Lista de resultados (id, ok, omitida, error, tiempo) en orden de etapa
+    """
+    ids = sorted(ETAPAS) if ids is None else sorted(ids)
+    pendientes = set(ids)
+    # Las dependencias fuera de la selección se consideran satisfechas
+    terminadas = set(ETAPAS) - pendientes
+    resultados = {}
+
+    if secuencial:
+        for id_etapa in ids:
+            print(f"▶️  [{id_etapa}/{len(ETAPAS)}] {ETAPAS[id_etapa]['nombre']}...")
+            resultado = ejecutar_etapa(id_etapa, capturar_salida=False, incremental=incremental,
+                                       perfilar=perfilar)
+            perfilado.agregar_eventos(resultado['eventos'])
+            resultados[id_etapa] = resultado
+            _informar(resultado, len(ETAPAS), mostrar_salida=False)
+        return [resultados[i] for i in ids]
+
+    nucleos = os.cpu_count() or 1
+    n_workers = n_workers or nucleos
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        en_curso = {}
+        while pendientes or en_curso:
+            listas = _listas(pendientes, terminadas)
+            # Núcleos de cada etapa para su paralelismo interno: se reparten
+            # entre las etapas que corren a la vez en este nivel del grafo
+            # (el resto de la división va a las primeras)
+            simultaneas = min(n_workers, len(en_curso) + len(listas)) or 1
+            for posicion, id_etapa in enumerate(listas):
+                workers_etapa = max(1, nucleos // simultaneas
+                                    + (posicion < nucleos % simultaneas))
+                pendientes.discard(id_etapa)
+                print(f"▶️  [{id_etapa}/{len(ETAPAS)}] {ETAPAS[id_etapa]['nombre']} en ejecución...")
+                en_curso[pool.submit(ejecutar_etapa, id_etapa, True, incremental, perfilar,
+                                       workers_etapa)] = id_etapa
+
+            hechos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                id_etapa = en_curso.pop(futuro)
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    # El worker murió (p. ej. falta de memoria)
+                    resultado = {'id': id_etapa, 'ok': False, 'omitida': False,
+                                 'error': str(e) or repr(e),
+                                 'tiempo': 0.0, 'salida': '', 'eventos': []}
+                perfilado.agregar_eventos(resultado['eventos'])
+                resultados[id_etapa] = resultado
+                terminadas.add(id_etapa)
+                _informar(resultado, len(ETAPAS), mostrar_salida)
+
+    return [resultados[i] for i in ids]
+
+def imprimir_resumen(resultados, tiempo_total):
+    """Imprime la tabla de estado y tiempos por etapa"""
+    print("\n⏱️  RESUMEN DE EJECUCIÓN:")
+    print("-" * 60)
+    for r in resultados:
+        estado = "⏭️ " if r['omitida'] else ("✅" if r['ok'] else "❌")
+        print(f"   {estado} {r['id']}. {ETAPAS[r['id']]['nombre']:<28} {r['tiempo']:>8.1f} s")
+    print("-" * 60)
+    print(f"   Tiempo total (reloj): {tiempo_total:.1f} s")
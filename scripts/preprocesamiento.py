@@ -0,0 +1,298 @@
+"""
+Preprocesamiento compartido
+Calcula una sola vez por conjunto de datos la matriz numérica imputada
+(media) y estandarizada, y la guarda en disco como .npy para que cada
+etapa la abra como memoria mapeada de solo lectura, sin copiarla. Junto a
+ellas se guarda la máscara de faltantes (bool), para los análisis que deben
+excluir los valores imputados en vez de tratarlos como datos.
+
+Para archivos que no caben en memoria incluye además un estandarizador en
+streaming de dos pasadas: la primera acumula estadísticas por bloques y la
+segunda imputa y estandariza cada bloque con ellas. preparar_matriz_por_bloques
+lo usa para escribir las mismas matrices .npy sin cargar nunca el archivo.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cache_datos import (DIRECTORIO_CACHE, cargar_excel, escribir_atomico, leer_por_bloques,
+                         obtener_huella)
+from perfilado import perfilar
+
+# Cambiar si cambia la forma de preprocesar (invalida las matrices en caché)
+VERSION = 2
+
+def a_numerico(df):
+    """
+    Frontera numérica: columnas numéricas de df como float64
+
+    Equivale a df.select_dtypes(include=[np.number]) pero incluye también
+    las columnas compactas (Categorical de códigos, ver libro_codigos.compactar),
+    que se promueven a float64 con NaN en los faltantes.
+    """
+    numericas = {}
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            categorias = serie.cat.categories
+            if not pd.api.types.is_numeric_dtype(categorias):
+                continue
+            codigos = serie.cat.codes.to_numpy()
+            valores = np.asarray(categorias, dtype=np.float64)[codigos]
+            valores[codigos < 0] = np.nan
+            numericas[col] = valores
+        elif pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            numericas[col] = serie.to_numpy(dtype=np.float64)
+    return pd.DataFrame(numericas, index=df.index)
+
+def imputar_media(df_numeric):
+    """
+    Imputa valores faltantes con la media de cada columna.
+    Equivale a SimpleImputer(strategy='mean'): las columnas completamente
+    vacías se descartan.
+
+    Returns:
+        (matriz imputada, columnas conservadas, medias)
+    """
+    columnas = df_numeric.columns[df_numeric.notna().any()]
+    X = df_numeric[columnas].to_numpy(dtype=np.float64, copy=True)
+    medias = np.nanmean(X, axis=0)
+    filas, cols = np.where(np.isnan(X))
+    X[filas, cols] = medias[cols]
+    return X, list(columnas), medias
+
+def calcular_escala(X):
+    """Media y desviación (ddof=0) por columna, con desviación 0 → 1 como StandardScaler"""
+    medias = X.mean(axis=0)
+    escalas = X.std(axis=0)
+    escalas[escalas == 0] = 1.0
+    return medias, escalas
+
+def _guardar_npy(ruta, matriz, dtype):
+    def escribir(tmp):
+        mm = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=matriz.shape)
+        mm[:] = matriz
+        mm.flush()
+        del mm
+    escribir_atomico(ruta, escribir)
+
+@perfilar(categoria='datos')
+def preparar_matriz(ruta='../BASE_NOMBRES_Y_VALORES.xlsx', dtype='float64',
+                    directorio_cache=DIRECTORIO_CACHE):
+    """
+    Devuelve la matriz numérica preprocesada del archivo de datos
+
+    Args:
+        ruta: Archivo Excel de origen
+        dtype: 'float64' o 'float32' para las matrices en disco
+        directorio_cache: Carpeta de caché
+
+    Returns:
+        dict con 'columnas', 'imputada', 'estandarizada' y 'faltantes'
+        (memmaps de solo lectura n×p; faltantes es bool), 'medias_imputacion', 'medias', 'escalas', 'huella',
+        'clave' (identifica la matriz preprocesada) y 'forma_origen' (filas
+        y columnas del archivo original)
+    """
+    dtype = np.dtype(dtype)
+    huella = obtener_huella(ruta, directorio_cache)
+    clave = f'{huella[:16]}-v{VERSION}-{dtype.name}'
+    directorio = Path(directorio_cache) / 'matrices' / clave
+    ruta_parametros = directorio / 'parametros.json'
+
+    if not ruta_parametros.exists():
+        directorio.mkdir(parents=True, exist_ok=True)
+
+        df = cargar_excel(ruta, directorio_cache)
+        numericas = df.select_dtypes(include=[np.number])
+        X, columnas, medias_imputacion = imputar_media(numericas)
+        medias, escalas = calcular_escala(X)
+
+        _guardar_npy(directorio / 'faltantes.npy', numericas[columnas].isna().to_numpy(), np.bool_)
+
+        _guardar_npy(directorio / 'imputada.npy', X, dtype)
+        X -= medias
+        X /= escalas
+        _guardar_npy(directorio / 'estandarizada.npy', X, dtype)
+        del X
+
+        # parametros.json se escribe al final: marca la caché como completa
+        parametros = {
+            'huella': huella,
+            'forma_origen': list(df.shape),
+            'columnas': [str(c) for c in columnas],
+            'medias_imputacion': medias_imputacion.tolist(),
+            'medias': medias.tolist(),
+            'escalas': escalas.tolist(),
+        }
+        escribir_atomico(ruta_parametros, lambda tmp: Path(tmp).write_text(
+            json.dumps(parametros), encoding='utf-8'))
+
+    return _abrir_matriz(directorio, clave)
+
+def _abrir_matriz(directorio, clave):
+    """Abre una matriz preprocesada completa de la caché (ver preparar_matriz)"""
+    with open(directorio / 'parametros.json', encoding='utf-8') as f:
+        parametros = json.load(f)
+
+    return {
+        'huella': parametros['huella'],
+        'clave': clave,
+        'forma_origen': tuple(parametros['forma_origen']),
+        'columnas': parametros['columnas'],
+        'imputada': np.load(directorio / 'imputada.npy', mmap_mode='r'),
+        'estandarizada': np.load(directorio / 'estandarizada.npy', mmap_mode='r'),
+        'faltantes': np.load(directorio / 'faltantes.npy', mmap_mode='r'),
+        'medias_imputacion': np.array(parametros['medias_imputacion']),
+        'medias': np.array(parametros['medias']),
+        'escalas': np.array(parametros['escalas']),
+    }
+
+@perfilar(categoria='datos')
+def preparar_matriz_por_bloques(ruta='../BASE_NOMBRES_Y_VALORES.xlsx', tamano_bloque=50_000,
+                                dtype='float64', directorio_cache=DIRECTORIO_CACHE):
+    """
+    Como preparar_matriz, pero leyendo el archivo por bloques de filas
+
+    Las matrices imputada y estandarizada y la máscara de faltantes se
+    escriben bloque a bloque en sus .npy, así que la memoria máxima depende del tamaño de bloque y no del
+    número de filas. Devuelve el mismo dict que preparar_matriz.
+    """
+    dtype = np.dtype(dtype)
+    huella = obtener_huella(ruta, directorio_cache)
+    clave = f'{huella[:16]}-v{VERSION}-{dtype.name}-bloques'
+    directorio = Path(directorio_cache) / 'matrices' / clave
+    ruta_parametros = directorio / 'parametros.json'
+
+    if not ruta_parametros.exists():
+        directorio.mkdir(parents=True, exist_ok=True)
+
+        estadisticas = estadisticas_por_bloques(ruta, tamano_bloque)
+        forma = (estadisticas['n'], len(estadisticas['columnas']))
+
+        def escribir(tmp_imputada, tmp_estandarizada, tmp_faltantes):
+            imputada = np.lib.format.open_memmap(tmp_imputada, mode='w+', dtype=dtype, shape=forma)
+            estandarizada = np.lib.format.open_memmap(tmp_estandarizada, mode='w+', dtype=dtype,
+                                                      shape=forma)
+            faltantes = np.lib.format.open_memmap(tmp_faltantes, mode='w+', dtype=np.bool_,
+                                                  shape=forma)
+            inicio = 0
+            for X, mascara in imputar_por_bloques(ruta, estadisticas, tamano_bloque,
+                                                  con_faltantes=True):
+                fin = inicio + len(X)
+                imputada[inicio:fin] = X
+                faltantes[inicio:fin] = mascara
+                X -= estadisticas['medias']
+                X /= estadisticas['escalas']
+                estandarizada[inicio:fin] = X
+                inicio = fin
+            imputada.flush()
+            estandarizada.flush()
+            faltantes.flush()
+            del imputada, estandarizada, faltantes
+
+        escribir_atomico(directorio / 'imputada.npy', lambda tmp_imputada: escribir_atomico(
+            directorio / 'estandarizada.npy', lambda tmp_estandarizada: escribir_atomico(
+                directorio / 'faltantes.npy',
+                lambda tmp_faltantes: escribir(tmp_imputada, tmp_estandarizada, tmp_faltantes))))
+
+        # parametros.json se escribe al final: marca la caché como completa
+        parametros = {
+            'huella': huella,
+            'forma_origen': [estadisticas['n'], estadisticas['n_columnas_origen']],
+            'columnas': [str(c) for c in estadisticas['columnas']],
+            'medias_imputacion': estadisticas['medias_imputacion'].tolist(),
+            'medias': estadisticas['medias'].tolist(),
+            'escalas': estadisticas['escalas'].tolist(),
+        }
+        escribir_atomico(ruta_parametros, lambda tmp: Path(tmp).write_text(
+            json.dumps(parametros), encoding='utf-8'))
+
+    return _abrir_matriz(directorio, clave)
+
+def como_dataframe(matriz, columnas):
+    """Envuelve una matriz (p. ej. un memmap) en un DataFrame sin copiarla"""
+    return pd.DataFrame(matriz, columns=columnas, copy=False)
+
+def estadisticas_por_bloques(ruta, tamano_bloque=50_000):
+    """
+    Primera pasada del estandarizador en streaming
+
+    Acumula por columna el conteo de valores no faltantes, la media y la
+    suma de cuadrados centrada (fórmula de Chan para combinar bloques), y
+    detecta columnas no numéricas. Una columna es numérica si todos sus
+    valores no faltantes lo son; las columnas vacías se descartan, igual
+    que en imputar_media.
+
+    Returns:
+        dict con 'columnas', 'n', 'n_columnas_origen', 'medias_imputacion',
+        'medias' y 'escalas'
+    """
+    n_total = 0
+    columnas = None
+
+    for bloque in leer_por_bloques(ruta, tamano_bloque):
+        if columnas is None:
+            columnas = list(bloque.columns)
+            no_numerica = np.zeros(len(columnas), dtype=bool)
+            conteo = np.zeros(len(columnas))
+            media = np.zeros(len(columnas))
+            m2 = np.zeros(len(columnas))
+
+        numerico = bloque.apply(pd.to_numeric, errors='coerce')
+        no_numerica |= (bloque.notna() & numerico.isna()).any().to_numpy()
+
+        X = numerico.to_numpy(dtype=np.float64)
+        presentes = ~np.isnan(X)
+        conteo_b = presentes.sum(axis=0)
+        media_b = np.where(presentes, X, 0.0).sum(axis=0) / np.maximum(conteo_b, 1)
+        m2_b = (np.where(presentes, X - media_b, 0.0) ** 2).sum(axis=0)
+
+        total = conteo + conteo_b
+        delta = media_b - media
+        peso = np.divide(conteo_b, total, out=np.zeros_like(media), where=total > 0)
+        media += delta * peso
+        m2 += m2_b + delta ** 2 * conteo * peso
+        conteo = total
+        n_total += len(bloque)
+
+    conservar = ~no_numerica & (conteo > 0)
+    medias = media[conservar]
+    # Los valores imputados con la media no aportan desviación
+    escalas = np.sqrt(m2[conservar] / n_total)
+    escalas[escalas == 0] = 1.0
+
+    return {
+        'columnas': [c for c, ok in zip(columnas, conservar) if ok],
+        'n': n_total,
+        'n_columnas_origen': len(columnas),
+        'medias_imputacion': medias,
+        'medias': medias,
+        'escalas': escalas,
+    }
+
+def imputar_por_bloques(ruta, estadisticas, tamano_bloque=50_000, con_faltantes=False):
+    """
+    Genera bloques n_b×p (float64) imputados con las medias de la primera
+    pasada del estandarizador en streaming (con con_faltantes=True, pares
+    (bloque, máscara de faltantes))
+    """
+    columnas = estadisticas['columnas']
+    for bloque in leer_por_bloques(ruta, tamano_bloque):
+        X = bloque[columnas].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        faltantes = np.isnan(X)
+        filas, cols = np.nonzero(faltantes)
+        X[filas, cols] = estadisticas['medias_imputacion'][cols]
+        yield (X, faltantes) if con_faltantes else X
+
+def estandarizar_por_bloques(ruta, estadisticas, tamano_bloque=50_000, dtype='float64'):
+    """
+    Segunda pasada del estandarizador en streaming: genera bloques n_b×p
+    imputados y estandarizados con las estadísticas de la primera pasada
+    """
+    for X in imputar_por_bloques(ruta, estadisticas, tamano_bloque):
+        X -= estadisticas['medias']
+        X /= estadisticas['escalas']
+        yield X.astype(dtype, copy=False)
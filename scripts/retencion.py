@@ -0,0 +1,184 @@
+"""
+Criterios de retención de componentes y factores
+Análisis paralelo de Horn y MAP de Velicer, como alternativas al criterio
+de Kaiser (que suele retener de más con muchas variables).
+
+El análisis paralelo compara cada autovalor observado con el percentil de
+los autovalores de matrices de correlación de referencia del mismo n y p:
+aleatorias (datos normales, generadas como Wishart por la descomposición
+de Bartlett, sin simular las n filas) o de los datos con cada columna
+permutada. Las referencias se apilan en lotes 3-D y se descomponen con
+eigvalsh por lotes en un pool de procesos (paralelo.py). Las normales solo
+dependen de (n, p, iteraciones, semilla) y se guardan en cache/retencion/.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from cache_datos import DIRECTORIO_CACHE, escribir_atomico
+from paralelo import mapa_compartido
+
+def _a_correlacion(W):
+    """Normaliza un lote de matrices de covarianza (lote×p×p) a correlación"""
+    d = np.sqrt(np.einsum('bii->bi', W))
+    return W / (d[:, :, None] * d[:, None, :])
+
+def _autovalores_normales(_, semilla, n_matrices, n, p):
+    """Autovalores (descendentes) de n_matrices correlaciones de datos normales n×p"""
+    rng = np.random.default_rng(semilla)
+    gl = n - 1
+    if gl < p:
+        # Wishart singular: simular los datos directamente
+        Z = rng.standard_normal((n_matrices, n, p))
+        Z -= Z.mean(axis=1, keepdims=True)
+        W = np.einsum('bni,bnj->bij', Z, Z)
+    else:
+        # Descomposición de Bartlett: W = A·Aᵀ ~ Wishart(gl, I), A triangular
+        # inferior con chi en la diagonal y normales debajo
+        A = np.zeros((n_matrices, p, p))
+        filas, columnas = np.tril_indices(p, -1)
+        A[:, filas, columnas] = rng.standard_normal((n_matrices, len(filas)))
+        A[:, np.arange(p), np.arange(p)] = np.sqrt(rng.chisquare(gl - np.arange(p),
+                                                                 (n_matrices, p)))
+        W = A @ A.transpose(0, 2, 1)
+    return np.linalg.eigvalsh(_a_correlacion(W))[:, ::-1]
+
+def _estandarizar(X):
+    """Copia float64 de X con media 0 y desviación 1 (las columnas constantes quedan en 0)"""
+    X = np.array(X, dtype=np.float64)
+    X -= X.mean(axis=0)
+    desviacion = X.std(axis=0)
+    X /= np.where(desviacion > 0, desviacion, 1.0)
+    return X
+
+def _autovalores_permutados(X, semilla, n_matrices):
+    """
+    Autovalores de correlaciones de X (ya estandarizada) con cada columna
+    permutada por separado (las n_matrices correlaciones se apilan y se
+    descomponen en un solo eigvalsh)
+    """
+    rng = np.random.default_rng(semilla)
+    n, p = X.shape
+    R = np.empty((n_matrices, p, p))
+    for i in range(n_matrices):
+        indices = rng.permuted(np.broadcast_to(np.arange(n)[:, None], (n, p)), axis=0)
+        permutada = np.take_along_axis(X, indices, axis=0)
+        np.matmul(permutada.T, permutada, out=R[i])
+    R /= n
+    return np.linalg.eigvalsh(R)[:, ::-1]
+
+def autovalores_referencia(n, p, n_iter=100, semilla=42, datos=None, memoria_mb=256,
+                           n_workers=None, directorio_cache=DIRECTORIO_CACHE):
+    """
+    Autovalores de n_iter matrices de correlación de referencia
+
+    Args:
+        n, p: Filas y variables de los datos observados
+        n_iter: Matrices de referencia
+        semilla: Semilla; cada lote usa una semilla derivada (SeedSequence),
+            así que el resultado no depende del número de procesos
+        datos: Matriz n×p para referencias por permutación (None = normales)
+        memoria_mb: Memoria aproximada por lote de matrices p×p
+        n_workers: Procesos (None = núcleos disponibles)
+
+    Returns:
+        Matriz n_iter×p de autovalores descendentes
+    """
+    ruta = Path(directorio_cache) / 'retencion' / f'normal-{n}-{p}-{n_iter}-{semilla}.npy'
+    if datos is None and ruta.exists():
+        return np.load(ruta)
+
+    # Lotes que caben en memoria_mb (tres matrices p×p por referencia)
+    tamano_lote = max(1, int(memoria_mb * 2 ** 20 // (3 * 8 * p * p)))
+    if datos is None and n - 1 < p:
+        tamano_lote = max(1, int(memoria_mb * 2 ** 20 // (8 * n * p)))
+    tamanos = [min(tamano_lote, n_iter - inicio) for inicio in range(0, n_iter, tamano_lote)]
+    semillas = np.random.SeedSequence(semilla).spawn(len(tamanos))
+
+    if datos is None:
+        tareas = [(s, t, n, p) for s, t in zip(semillas, tamanos)]
+        lotes = mapa_compartido(_autovalores_normales, None, tareas, n_workers)
+    else:
+        # Se estandariza una vez aquí; los workers leen la copia compartida
+        tareas = [(s, t) for s, t in zip(semillas, tamanos)]
+        lotes = mapa_compartido(_autovalores_permutados, _estandarizar(datos), tareas, n_workers)
+    autovalores = np.concatenate(lotes)
+
+    if datos is None:
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+
+        def escribir(tmp):
+            with open(tmp, 'wb') as f:
+                np.save(f, autovalores)
+        escribir_atomico(ruta, escribir)
+    return autovalores
+
+def analisis_paralelo(autovalores, n, p, percentil=95, n_iter=100, semilla=42, datos=None,
+                      n_workers=None):
+    """
+    Análisis paralelo de Horn
+
+    Args:
+        autovalores: Autovalores observados de la matriz de correlación
+            (descendentes; pueden ser solo los primeros k)
+        n, p: Filas y variables de los datos
+        percentil: Percentil de las referencias que hay que superar
+        datos: Matriz n×p para referencias por permutación (None = normales)
+
+    Returns:
+        dict con 'n_retener' (autovalores iniciales que superan su umbral),
+        'cota_inferior' (True si se dieron menos de p autovalores y todos
+        superan su umbral: n_retener es entonces solo un mínimo), 'umbral'
+        (percentil por posición), 'media' de las referencias, 'percentil' y
+        'n_iter'
+    """
+    autovalores = np.asarray(autovalores)
+    referencia = autovalores_referencia(n, p, n_iter, semilla, datos, n_workers=n_workers)
+    umbral = np.percentile(referencia, percentil, axis=0)
+
+    k = len(autovalores)
+    superan = autovalores > umbral[:k]
+    n_retener = int(np.argmin(superan)) if not superan.all() else k
+    return {
+        'n_retener': n_retener,
+        'cota_inferior': bool(superan.all()) and k < p,
+        'umbral': umbral,
+        'media': referencia.mean(axis=0),
+        'percentil': percentil,
+        'n_iter': n_iter,
+    }
+
+def map_velicer(estructura, potencia=2):
+    """
+    MAP de Velicer: número de componentes que minimiza la correlación
+    parcial media (al cuadrado, o a la cuarta con potencia=4) entre las
+    variables tras extraer las m primeras componentes
+
+    Las covarianzas parciales se actualizan restando una componente cada
+    vez (O(p²) por paso), a partir de la descomposición de R compartida.
+
+    Returns:
+        dict con 'n_retener' y 'promedios' (un valor por m = 0, 1, ...)
+    """
+    # Las variables constantes (diagonal 0 en R) no entran en el promedio
+    activas = np.diag(estructura['R']) > 0
+    R = estructura['R'][np.ix_(activas, activas)]
+    p = len(R)
+    autovalores = np.clip(estructura['autovalores'], 0, None)
+    autovectores = estructura['autovectores'][activas]
+
+    C = R.copy()
+    promedios = []
+    for m in range(p - 1):
+        if m > 0:
+            carga = autovectores[:, m - 1] * np.sqrt(autovalores[m - 1])
+            C -= np.outer(carga, carga)
+        d = np.diag(C)
+        if d.min() <= 1e-12:
+            break
+        parcial = np.abs(C) ** potencia / np.outer(d, d) ** (potencia / 2)
+        promedios.append((parcial.sum() - p) / (p * (p - 1)))
+
+    promedios = np.array(promedios)
+    return {'n_retener': int(np.argmin(promedios)), 'promedios': promedios}
@@ -0,0 +1,164 @@
+"""
+Coeficiente de silhouette con memoria acotada
+Calcula la silhouette por bloques de filas (cada bloque recorre X por
+bloques de referencia y suma las distancias por cluster, sin cargar X ni
+guardar la matriz n×n) y, para datos grandes,
+la estima sobre una muestra estratificada por cluster con intervalo de
+confianza. La estimación cuesta O(m·n) en vez de O(n²): lineal en n para un
+tamaño de muestra m fijo.
+"""
+
+import numpy as np
+from scipy.stats import norm
+
+def silueta_muestras(X, labels, indices=None, memoria_mb=64, tamano_referencia=50_000):
+    """
+    Silhouette de las observaciones indicadas frente a todas las demás
+
+    Igual que sklearn.metrics.silhouette_samples (distancia euclídea; las
+    observaciones de clusters unitarios valen 0), pero por bloques: las
+    filas evaluadas se comparan con bloques de tamano_referencia filas de X
+    (que no se carga entera) y las distancias se suman por cluster sin
+    guardar ninguna matriz de tamaño n.
+
+    Args:
+        X: Matriz n×p (puede ser un memmap o un DataFrame)
+        labels: Etiquetas de cluster (n)
+        indices: Observaciones a evaluar (None = todas)
+        memoria_mb: Tamaño máximo de cada bloque de distancias
+        tamano_referencia: Filas de X por bloque de referencia
+
+    Returns:
+        Array con la silhouette de cada observación de indices
+    """
+    if hasattr(X, 'to_numpy'):
+        X = X.to_numpy()
+    _, codigos = np.unique(labels, return_inverse=True)
+    n = len(codigos)
+    k = codigos.max() + 1
+    indices = np.arange(n) if indices is None else np.asarray(indices)
+
+    tamanos = np.bincount(codigos, minlength=k)
+    tamano_referencia = min(n, tamano_referencia)
+    normas = np.empty(n)
+    for ref in range(0, n, tamano_referencia):
+        bloque = np.asarray(X[ref:ref + tamano_referencia], dtype=np.float64)
+        normas[ref:ref + len(bloque)] = np.einsum('ij,ij->i', bloque, bloque)
+
+    filas_bloque = max(1, int(memoria_mb * 2**20 / (8 * tamano_referencia)))
+    resultado = np.empty(len(indices))
+
+    for inicio in range(0, len(indices), filas_bloque):
+        idx = indices[inicio:inicio + filas_bloque]
+        filas = np.arange(len(idx))
+        evaluadas = np.asarray(X[idx], dtype=np.float64)
+
+        # Suma de distancias de cada fila evaluada a cada cluster
+        sumas = np.zeros((len(idx), k))
+        for ref in range(0, n, tamano_referencia):
+            referencia = np.asarray(X[ref:ref + tamano_referencia], dtype=np.float64)
+            fin = ref + len(referencia)
+            distancias = normas[idx, None] + normas[None, ref:fin] - 2 * (evaluadas @ referencia.T)
+            np.maximum(distancias, 0, out=distancias)
+            np.sqrt(distancias, out=distancias)
+            # La distancia de cada punto a sí mismo es 0 exacto
+            propias = (idx >= ref) & (idx < fin)
+            distancias[filas[propias], idx[propias] - ref] = 0.0
+
+            codigos_ref = codigos[ref:fin]
+            for c in np.unique(codigos_ref):
+                sumas[:, c] += distancias[:, codigos_ref == c].sum(axis=1)
+
+        propio = codigos[idx]
+        n_propio = tamanos[propio]
+
+        a = sumas[filas, propio] / np.maximum(n_propio - 1, 1)
+        medias_otros = sumas / tamanos
+        medias_otros[filas, propio] = np.inf
+        b = medias_otros.min(axis=1)
+
+        s = (b - a) / np.maximum(a, b)
+        s[n_propio == 1] = 0.0
+        resultado[inicio:inicio + len(idx)] = np.nan_to_num(s)
+
+    return resultado
+
+def muestra_estratificada(labels, tamano_muestra, semilla=42):
+    """
+    Índices de una muestra estratificada por cluster con asignación
+    proporcional (al menos 2 por cluster cuando es posible)
+    """
+    rng = np.random.default_rng(semilla)
+    grupos, codigos = np.unique(labels, return_inverse=True)
+    tamanos = np.bincount(codigos)
+    asignacion = np.minimum(tamanos, np.maximum(2, np.round(tamano_muestra * tamanos / len(codigos))))
+
+    orden = np.argsort(codigos, kind='stable')
+    limites = np.concatenate([[0], np.cumsum(tamanos)])
+    return [np.sort(rng.choice(orden[limites[h]:limites[h + 1]], size=int(m), replace=False))
+            for h, m in enumerate(asignacion.astype(int))]
+
+def silueta(X, labels, tamano_muestra=None, semilla=42, confianza=0.95, memoria_mb=64):
+    """
+    Coeficiente de silhouette medio, exacto o estimado por muestreo
+
+    Args:
+        X: Matriz n×p
+        labels: Etiquetas de cluster
+        tamano_muestra: None o >= n para el valor exacto; si no, tamaño de
+            la muestra estratificada por cluster
+        semilla: Semilla del muestreo
+        confianza: Nivel del intervalo de confianza
+
+    Returns:
+        dict con 'valor', 'ic_inf', 'ic_sup', 'n_muestra' y 'exacta'
+    """
+    n = len(labels)
+    if tamano_muestra is None or tamano_muestra >= n:
+        valor = float(silueta_muestras(X, labels, memoria_mb=memoria_mb).mean())
+        return {'valor': valor, 'ic_inf': valor, 'ic_sup': valor, 'n_muestra': n, 'exacta': True}
+
+    estratos = muestra_estratificada(labels, tamano_muestra, semilla)
+    valores = silueta_muestras(X, labels, np.concatenate(estratos), memoria_mb=memoria_mb)
+
+    # Estimador estratificado con corrección por población finita
+    _, tamanos = np.unique(labels, return_counts=True)
+    pesos = tamanos / n
+    media, varianza, inicio = 0.0, 0.0, 0
+    for h, idx in enumerate(estratos):
+        s_h = valores[inicio:inicio + len(idx)]
+        inicio += len(idx)
+        media += pesos[h] * s_h.mean()
+        if len(idx) > 1:
+            varianza += pesos[h] ** 2 * s_h.var(ddof=1) / len(idx) * (1 - len(idx) / tamanos[h])
+
+    z = norm.ppf(0.5 + confianza / 2)
+    error = z * np.sqrt(varianza)
+    return {'valor': float(media), 'ic_inf': float(media - error), 'ic_sup': float(media + error),
+            'n_muestra': inicio, 'exacta': False}
+
+def silueta_submuestra(X, labels, tamano_muestra, semilla=42, confianza=0.95, memoria_mb=64):
+    """
+    Silhouette de una submuestra estratificada por cluster
+
+    Puntos y referencias salen de la misma muestra (como sample_size en
+    sklearn), así que el coste es O(m²) y no depende de n: sirve para
+    matrices que solo se leen por bloques desde disco. El IC refleja la
+    variabilidad entre observaciones de la muestra.
+
+    Returns:
+        dict como silueta()
+    """
+    labels = np.asarray(labels)
+    n = len(labels)
+    if tamano_muestra is None or tamano_muestra >= n:
+        return silueta(X, labels, confianza=confianza, memoria_mb=memoria_mb)
+
+    indices = np.sort(np.concatenate(muestra_estratificada(labels, tamano_muestra, semilla)))
+    valores = silueta_muestras(np.asarray(X[indices]), labels[indices], memoria_mb=memoria_mb)
+
+    m = len(valores)
+    media = float(valores.mean())
+    error = norm.ppf(0.5 + confianza / 2) * valores.std(ddof=1) / np.sqrt(m) * np.sqrt(1 - m / n)
+    return {'valor': media, 'ic_inf': float(media - error), 'ic_sup': float(media + error),
+            'n_muestra': m, 'exacta': False}